@@ -23,6 +23,18 @@ if config.config_file_name is not None:
 # target_metadata = mymodel.Base.metadata
 target_metadata = Base.metadata
 
+# Postgres-only search objects created by migration c4e7a91b3f20; they are not
+# mapped on the models, so keep autogenerate from proposing to drop them.
+MIGRATION_ONLY_OBJECTS = {
+    "search_vector",
+    "ix_movies_search_vector",
+    "ix_movies_title_trgm",
+}
+
+
+def include_object(object, name, type_, reflected, compare_to):
+    return not (reflected and compare_to is None and name in MIGRATION_ONLY_OBJECTS)
+
 # other values from the config, defined by the needs of env.py,
 # can be acquired:
 # my_important_option = config.get_main_option("my_important_option")
@@ -47,6 +59,7 @@ def run_migrations_offline() -> None:
         target_metadata=target_metadata,
         literal_binds=True,
         dialect_opts={"paramstyle": "named"},
+        include_object=include_object,
     )
 
     with context.begin_transaction():
@@ -67,7 +80,11 @@ def run_migrations_online() -> None:
     )
 
     with connectable.connect() as connection:
-        context.configure(connection=connection, target_metadata=target_metadata)
+        context.configure(
+            connection=connection,
+            target_metadata=target_metadata,
+            include_object=include_object,
+        )
 
         with context.begin_transaction():
             context.run_migrations()
@@ -0,0 +1,59 @@
+"""movie listing indexes
+
+Revision ID: 8b1f2c7d9e41
+Revises: 3d40f4a00c92
+Create Date: 2026-10-18 09:12:41.204711
+
+"""
+
+from typing import Sequence, Union
+
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision: str = "8b1f2c7d9e41"
+down_revision: Union[str, Sequence[str], None] = "3d40f4a00c92"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_index(
+        "ix_movies_created_at_id", "movies", ["created_at", "id"], unique=False
+    )
+    op.create_index(
+        "ix_movies_view_count_id", "movies", ["view_count", "id"], unique=False
+    )
+    op.create_index(
+        "ix_movies_genre_id_created_at_id",
+        "movies",
+        ["genre_id", "created_at", "id"],
+        unique=False,
+    )
+    op.create_index(
+        "ix_movies_genre_id_view_count_id",
+        "movies",
+        ["genre_id", "view_count", "id"],
+        unique=False,
+    )
+    op.create_index(
+        "ix_movies_language_created_at_id",
+        "movies",
+        ["language", "created_at", "id"],
+        unique=False,
+    )
+    op.create_index(
+        "ix_movies_release_date", "movies", ["release_date"], unique=False
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index("ix_movies_release_date", table_name="movies")
+    op.drop_index("ix_movies_language_created_at_id", table_name="movies")
+    op.drop_index("ix_movies_genre_id_view_count_id", table_name="movies")
+    op.drop_index("ix_movies_genre_id_created_at_id", table_name="movies")
+    op.drop_index("ix_movies_view_count_id", table_name="movies")
+    op.drop_index("ix_movies_created_at_id", table_name="movies")
@@ -0,0 +1,42 @@
+"""watch progress
+
+Revision ID: a7d2e94c1f35
+Revises: f3a9d6c4b812
+Create Date: 2026-10-18 19:41:08.263507
+
+"""
+
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = "a7d2e94c1f35"
+down_revision: Union[str, Sequence[str], None] = "f3a9d6c4b812"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table(
+        "watch_progress",
+        sa.Column("user_id", sa.Integer(), primary_key=True),
+        sa.Column("movie_id", sa.Integer(), primary_key=True),
+        sa.Column("position_seconds", sa.Integer(), nullable=False),
+        sa.Column("completed", sa.Boolean(), nullable=False),
+        sa.Column("updated_at", sa.DateTime(timezone=True), nullable=False),
+    )
+    op.create_index(
+        "ix_watch_progress_user_id_updated_at",
+        "watch_progress",
+        ["user_id", "updated_at"],
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index("ix_watch_progress_user_id_updated_at", table_name="watch_progress")
+    op.drop_table("watch_progress")
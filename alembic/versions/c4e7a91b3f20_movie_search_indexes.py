@@ -0,0 +1,66 @@
+"""movie search indexes
+
+Revision ID: c4e7a91b3f20
+Revises: 8b1f2c7d9e41
+Create Date: 2026-10-18 10:03:17.551902
+
+"""
+
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+
+# revision identifiers, used by Alembic.
+revision: str = "c4e7a91b3f20"
+down_revision: Union[str, Sequence[str], None] = "8b1f2c7d9e41"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+SEARCH_VECTOR_EXPR = (
+    "setweight(to_tsvector('simple', coalesce(title, '')), 'A') || "
+    "setweight(to_tsvector('simple', coalesce(description, '')), 'B')"
+)
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # full-text search is Postgres only; other dialects use a LIKE fallback
+    if op.get_bind().dialect.name != "postgresql":
+        return
+    op.execute("CREATE EXTENSION IF NOT EXISTS pg_trgm")
+    op.add_column(
+        "movies",
+        sa.Column(
+            "search_vector",
+            postgresql.TSVECTOR(),
+            sa.Computed(SEARCH_VECTOR_EXPR, persisted=True),
+            nullable=True,
+        ),
+    )
+    op.create_index(
+        "ix_movies_search_vector",
+        "movies",
+        ["search_vector"],
+        unique=False,
+        postgresql_using="gin",
+    )
+    op.create_index(
+        "ix_movies_title_trgm",
+        "movies",
+        ["title"],
+        unique=False,
+        postgresql_using="gin",
+        postgresql_ops={"title": "gin_trgm_ops"},
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    if op.get_bind().dialect.name != "postgresql":
+        return
+    op.drop_index("ix_movies_title_trgm", table_name="movies")
+    op.drop_index("ix_movies_search_vector", table_name="movies")
+    op.drop_column("movies", "search_vector")
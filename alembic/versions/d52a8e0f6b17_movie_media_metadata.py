@@ -0,0 +1,35 @@
+"""movie media metadata
+
+Revision ID: d52a8e0f6b17
+Revises: c4e7a91b3f20
+Create Date: 2026-10-18 13:41:08.310257
+
+"""
+
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = "d52a8e0f6b17"
+down_revision: Union[str, Sequence[str], None] = "c4e7a91b3f20"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.add_column("movies", sa.Column("media_type", sa.String(), nullable=True))
+    op.add_column("movies", sa.Column("codecs", sa.String(), nullable=True))
+    op.add_column("movies", sa.Column("width", sa.Integer(), nullable=True))
+    op.add_column("movies", sa.Column("height", sa.Integer(), nullable=True))
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_column("movies", "height")
+    op.drop_column("movies", "width")
+    op.drop_column("movies", "codecs")
+    op.drop_column("movies", "media_type")
@@ -0,0 +1,29 @@
+"""movie poster variants
+
+Revision ID: e8c3b5d21a90
+Revises: d52a8e0f6b17
+Create Date: 2026-10-18 14:26:52.904118
+
+"""
+
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = "e8c3b5d21a90"
+down_revision: Union[str, Sequence[str], None] = "d52a8e0f6b17"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.add_column("movies", sa.Column("poster_variants", sa.JSON(), nullable=True))
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_column("movies", "poster_variants")
@@ -0,0 +1,41 @@
+"""watch events
+
+Revision ID: f3a9d6c4b812
+Revises: e8c3b5d21a90
+Create Date: 2026-10-18 18:02:37.415926
+
+"""
+
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = "f3a9d6c4b812"
+down_revision: Union[str, Sequence[str], None] = "e8c3b5d21a90"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table(
+        "watch_events",
+        sa.Column(
+            "id",
+            sa.BigInteger().with_variant(sa.Integer(), "sqlite"),
+            primary_key=True,
+        ),
+        sa.Column("user_id", sa.Integer(), nullable=False),
+        sa.Column("movie_id", sa.Integer(), nullable=False),
+        sa.Column("watched_at", sa.DateTime(timezone=True), nullable=False),
+    )
+    op.create_index("ix_watch_events_watched_at", "watch_events", ["watched_at"])
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index("ix_watch_events_watched_at", table_name="watch_events")
+    op.drop_table("watch_events")
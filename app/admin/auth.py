@@ -7,7 +7,7 @@ from starlette_admin.exceptions import LoginFailed
 
 from app.models import User
 from app.utils.dependencies import get_db
-from app.utils.password import verify_password
+from app.utils.password import verify_and_update_password_async
 from app.config import settings
 
 
@@ -27,8 +27,14 @@ class JSONAuthProvider(AuthProvider):
         if not user or not user.is_admin:
             raise LoginFailed("Invalid admin credentials.")
 
-        if not verify_password(password, user.hashed_password):
+        valid, new_hash = await verify_and_update_password_async(
+            password, user.hashed_password
+        )
+        if not valid:
             raise LoginFailed("Incorrect password.")
+        if new_hash:
+            user.hashed_password = new_hash
+            db.commit()
 
         token_data = {
             "sub": user.email,
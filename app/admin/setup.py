@@ -13,7 +13,6 @@ admin = Admin(
     title="AuraFlix Admin Panel",
     base_url="/admin",
     auth_provider=JSONAuthProvider(login_path="/login", logout_path="/logout"),
-    media_dir=os.path.join(settings.MEDIA_DIR, "media"),
 )
 
 admin.add_view(UserAdminView(User, icon="fa fa-user"))
@@ -1,8 +1,13 @@
 from typing import ClassVar
+import anyio
 from starlette_admin.contrib.sqla import ModelView
 from starlette_admin.fields import FileField, ImageField
 from fastapi import HTTPException
+from sqlalchemy import inspect
 from app.config import settings
+from app import services
+from app.tasks.celery import generate_poster_variants_task
+from app.utils.storage import release_movie_media_sync
 
 
 class UserAdminView(ModelView):
@@ -23,6 +28,12 @@ class UserAdminView(ModelView):
     export_fields: ClassVar[list[str]] = fields
     export_types: ClassVar[list[str]] = ["csv", "excel", "pdf", "print"]
 
+    async def after_edit(self, request, obj):
+        await services.refresh_user_status(obj)
+
+    async def after_delete(self, request, obj):
+        await services.refresh_user_status(obj, deleted=True)
+
 
 class GenreAdminView(ModelView):
     fields: ClassVar[list[str]] = ["id", "name", "created_at"]
@@ -48,6 +59,10 @@ class MovieAdminView(ModelView):
         "poster_path",
         "view_count",
         "release_date",
+        "media_type",
+        "codecs",
+        "width",
+        "height",
         "created_at",
     ]
 
@@ -64,14 +79,33 @@ class MovieAdminView(ModelView):
 
     exclude_fields_from_create = ["created_at", "view_count"]
     exclude_fields_from_edit = ["created_at", "view_count"]
-    exclude_fields_from_list = ["created_at"]
+    exclude_fields_from_list = ["created_at", "codecs", "width", "height"]
     export_fields = fields
     export_types = ["csv", "excel", "pdf", "print"]
 
-    async def before_create(self, request, data, obj, session):
+    async def before_create(self, request, data, obj):
         if data.get("file_path") and settings.MAX_VIDEO_UPLOAD_BYTES:
             if obj.file_path and obj.file_path.size > settings.MAX_VIDEO_UPLOAD_BYTES:
                 raise HTTPException(status_code=400, detail="Video file too large")
 
-    async def before_edit(self, request, data, obj, session):
-        await self.before_create(request, data, obj, session)
+    async def before_edit(self, request, data, obj):
+        await self.before_create(request, data, obj)
+        # the form is applied to obj by now; its history still holds the old value
+        request.state.poster_changed = inspect(obj).attrs.poster_path.history.has_changes()
+
+    async def after_create(self, request, obj):
+        await services.invalidate_movie(obj.id)
+        if obj.poster_path:
+            generate_poster_variants_task.delay(obj.id)
+
+    async def after_edit(self, request, obj):
+        await services.invalidate_movie(obj.id)
+        if obj.poster_path and request.state.poster_changed:
+            generate_poster_variants_task.delay(obj.id)
+
+    async def after_delete(self, request, obj):
+        # media is shared by content, so only unreferenced files are removed
+        await anyio.to_thread.run_sync(
+            release_movie_media_sync, request.state.session, obj
+        )
+        await services.invalidate_movie(obj.id)
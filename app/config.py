@@ -1,5 +1,5 @@
 import os
-from decouple import config
+from decouple import Csv, config
 
 
 class Settings:
@@ -13,16 +13,126 @@ class Settings:
     REFRESH_TOKEN_EXPIRE_DAYS: int = config(
         "REFRESH_TOKEN_EXPIRE_DAYS", default=30, cast=int
     )
+    # Argon2 parameters; pick them with `python calibrate_argon2.py`
+    ARGON2_TIME_COST: int = config("ARGON2_TIME_COST", default=3, cast=int)
+    ARGON2_MEMORY_COST: int = config("ARGON2_MEMORY_COST", default=65536, cast=int)
+    ARGON2_PARALLELISM: int = config("ARGON2_PARALLELISM", default=4, cast=int)
+    PASSWORD_HASH_WORKERS: int = config("PASSWORD_HASH_WORKERS", default=2, cast=int)
+    PASSWORD_HASH_QUEUE_SIZE: int = config(
+        "PASSWORD_HASH_QUEUE_SIZE", default=16, cast=int
+    )
     DATABASE_URL: str = config("DATABASE_URL")
+    # optional override; derived from DATABASE_URL when empty
+    ASYNC_DATABASE_URL: str = config("ASYNC_DATABASE_URL", default="")
+    # comma-separated read replica URLs (sync form, like DATABASE_URL); the
+    # API sends catalog and login lookups there, everything else and all
+    # writes to DATABASE_URL. Empty: no replicas.
+    DATABASE_REPLICA_URLS: list[str] = config(
+        "DATABASE_REPLICA_URLS", default="", cast=Csv()
+    )
+    # after writing, a user reads from the primary this long (replica lag)
+    READ_YOUR_WRITES_SECONDS: int = config("READ_YOUR_WRITES_SECONDS", default=5, cast=int)
+    # connection pool of each engine, per process (ignored for SQLite)
+    DB_POOL_SIZE: int = config("DB_POOL_SIZE", default=5, cast=int)
+    DB_MAX_OVERFLOW: int = config("DB_MAX_OVERFLOW", default=10, cast=int)
+    DB_POOL_TIMEOUT_SECONDS: int = config("DB_POOL_TIMEOUT_SECONDS", default=30, cast=int)
+    DB_POOL_PRE_PING: bool = config("DB_POOL_PRE_PING", default=True, cast=bool)
+    # reconnect after this long, under server/proxy idle timeouts (-1 = never)
+    DB_POOL_RECYCLE_SECONDS: int = config("DB_POOL_RECYCLE_SECONDS", default=1800, cast=int)
+    # Postgres statement_timeout of API connections (0 = none); Celery,
+    # Alembic and scripts are not limited
+    DB_STATEMENT_TIMEOUT_MS: int = config("DB_STATEMENT_TIMEOUT_MS", default=0, cast=int)
     REDIS_URL: str = config("REDIS_URL", default="redis://localhost:6379/0")
+    REDIS_MAX_CONNECTIONS: int = config("REDIS_MAX_CONNECTIONS", default=100, cast=int)
     CELERY_BROKER_URL: str = config("CELERY_BROKER_URL")
     CELERY_RESULT_BACKEND: str = config("CELERY_RESULT_BACKEND")
+    # per-request SQL profiling (development/staging): query count and time
+    # headers, N+1 and slow query logging; send X-DB-Explain for query plans
+    DB_PROFILING: bool = config("DB_PROFILING", default=False, cast=bool)
+    DB_SLOW_QUERY_MS: int = config("DB_SLOW_QUERY_MS", default=200, cast=int)
+    DB_N_PLUS_ONE_THRESHOLD: int = config("DB_N_PLUS_ONE_THRESHOLD", default=5, cast=int)
+    # Prometheus: bearer token required on /metrics when set; port on which
+    # each Celery worker serves its own metrics (0 = off). Set
+    # PROMETHEUS_MULTIPROC_DIR when running several processes per host.
+    METRICS_TOKEN: str = config("METRICS_TOKEN", default="")
+    CELERY_METRICS_PORT: int = config("CELERY_METRICS_PORT", default=0, cast=int)
     SMTP_HOST: str = config("SMTP_HOST")
     SMTP_PORT: int = config("SMTP_PORT", default=587, cast=int)
-    SMTP_USER: str = config("SMTP_USER")
-    SMTP_PASSWORD: str = config("SMTP_PASSWORD")
+    # leave SMTP_USER empty for relays that take no login (e.g. a local aiosmtpd)
+    SMTP_USER: str = config("SMTP_USER", default="")
+    SMTP_PASSWORD: str = config("SMTP_PASSWORD", default="")
     SMTP_FROM: str = config("SMTP_FROM")
+    SMTP_STARTTLS: bool = config("SMTP_STARTTLS", default=True, cast=bool)
+    SMTP_TIMEOUT_SECONDS: int = config("SMTP_TIMEOUT_SECONDS", default=30, cast=int)
+    # open connections each worker process keeps for reuse, and for how long
+    SMTP_POOL_SIZE: int = config("SMTP_POOL_SIZE", default=2, cast=int)
+    SMTP_POOL_IDLE_SECONDS: int = config("SMTP_POOL_IDLE_SECONDS", default=60, cast=int)
+    # lifetime of emailed verification / password reset codes
+    CODE_TTL_SECONDS: int = config("CODE_TTL_SECONDS", default=120, cast=int)
     MEDIA_DIR: str = config("MEDIA_DIR", default="./app/media")
+    # URL prefix MEDIA_DIR is served under
+    MEDIA_URL: str = config("MEDIA_URL", default="/media")
+    # movie metadata cache: in-process tier in front of the shared Redis tier
+    CACHE_TTL_SECONDS: int = config("CACHE_TTL_SECONDS", default=300, cast=int)
+    CACHE_LOCAL_TTL_SECONDS: int = config("CACHE_LOCAL_TTL_SECONDS", default=5, cast=int)
+    CACHE_LOCAL_MAXSIZE: int = config("CACHE_LOCAL_MAXSIZE", default=1024, cast=int)
+    # user status (active/verified/admin) cache used by get_current_user
+    USER_STATUS_LOCAL_TTL_SECONDS: int = config(
+        "USER_STATUS_LOCAL_TTL_SECONDS", default=5, cast=int
+    )
+    # embed signed status claims in access tokens so cold caches skip the DB
+    USER_STATUS_IN_TOKEN: bool = config(
+        "USER_STATUS_IN_TOKEN", default=False, cast=bool
+    )
+    # a new view is counted after this much idle time between requests
+    VIEW_SESSION_TTL_SECONDS: int = config(
+        "VIEW_SESSION_TTL_SECONDS", default=30 * 60, cast=int
+    )
+    VIEW_FLUSH_INTERVAL_SECONDS: int = config(
+        "VIEW_FLUSH_INTERVAL_SECONDS", default=60, cast=int
+    )
+    # watch progress heartbeats: kept in Redis this long after a user's last
+    # one, written to the database in bulk at this interval
+    PROGRESS_TTL_SECONDS: int = config(
+        "PROGRESS_TTL_SECONDS", default=30 * 24 * 60 * 60, cast=int
+    )
+    PROGRESS_FLUSH_INTERVAL_SECONDS: int = config(
+        "PROGRESS_FLUSH_INTERVAL_SECONDS", default=30, cast=int
+    )
+    # "similar movies" (Celery job, NumPy/SciPy): neighbours kept per movie,
+    # watch history they are computed from (older events are deleted),
+    # rebuild interval, memory for one block of the co-view matrix
+    SIMILAR_MOVIES_K: int = config("SIMILAR_MOVIES_K", default=20, cast=int)
+    SIMILARITY_HISTORY_DAYS: int = config("SIMILARITY_HISTORY_DAYS", default=180, cast=int)
+    SIMILARITY_REBUILD_SECONDS: int = config(
+        "SIMILARITY_REBUILD_SECONDS", default=6 * 60 * 60, cast=int
+    )
+    SIMILARITY_BLOCK_MEMORY_MB: int = config(
+        "SIMILARITY_BLOCK_MEMORY_MB", default=256, cast=int
+    )
+    # resumable uploads: chunk size handed to clients, idle expiry of sessions
+    UPLOAD_CHUNK_SIZE: int = config("UPLOAD_CHUNK_SIZE", default=8 * 1024 * 1024, cast=int)
+    UPLOAD_SESSION_TTL_SECONDS: int = config(
+        "UPLOAD_SESSION_TTL_SECONDS", default=24 * 60 * 60, cast=int
+    )
+    # how long an Idempotency-Key on /movies/upload maps to its movie
+    UPLOAD_IDEMPOTENCY_TTL_SECONDS: int = config(
+        "UPLOAD_IDEMPOTENCY_TTL_SECONDS", default=24 * 60 * 60, cast=int
+    )
+    # stored media no movie references is deleted once it has been neither
+    # stored nor deduplicated onto for this long (see app.utils.storage)
+    MEDIA_GC_GRACE_SECONDS: int = config(
+        "MEDIA_GC_GRACE_SECONDS", default=6 * 60 * 60, cast=int
+    )
+    # poster renditions (WebP, optionally AVIF) made at ingest
+    POSTER_VARIANT_WIDTHS: list[int] = config(
+        "POSTER_VARIANT_WIDTHS", default="160,320,640", cast=Csv(int)
+    )
+    POSTER_AVIF: bool = config("POSTER_AVIF", default=False, cast=bool)
+    # render during the upload request instead of in a Celery task
+    POSTER_VARIANTS_INLINE: bool = config(
+        "POSTER_VARIANTS_INLINE", default=False, cast=bool
+    )
     MAX_VIDEO_UPLOAD_BYTES: int = int(os.getenv("MAX_VIDEO_UPLOAD_BYTES", 0)) or None
 
 
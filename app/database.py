@@ -1,10 +1,163 @@
+import random
+
 from sqlalchemy import create_engine
-from sqlalchemy.orm import sessionmaker, DeclarativeBase
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine, async_sessionmaker
+from sqlalchemy.orm import Session, sessionmaker, DeclarativeBase
+from sqlalchemy.sql.dml import UpdateBase
 from app.config import settings
+from app.utils import db_profiler
+from app.utils.metrics import instrument_pool
+from app.utils.redis_pool import get_redis
+
+# async driver to use for each sync driver found in DATABASE_URL
+ASYNC_DRIVERS = {
+    "postgresql": "postgresql+asyncpg",
+    "postgresql+psycopg2": "postgresql+asyncpg",
+    "sqlite": "sqlite+aiosqlite",
+    "sqlite+pysqlite": "sqlite+aiosqlite",
+}
+
+# bind_arguments for a SELECT that may be served by a read replica
+REPLICA_READ = {"replica": True}
+# Redis key marking a subject (user email, CATALOG_SUBJECT) as a recent writer
+READ_YOUR_WRITES_KEY = "ryw:{subject}"
+# writes to movies, whose cached copies must not be refilled from a replica
+CATALOG_SUBJECT = "catalog"
+
+
+def make_async_url(url: str) -> str:
+    """
+    Derive the async driver URL from a sync SQLAlchemy URL,
+    e.g. postgresql+psycopg2://... -> postgresql+asyncpg://...
+    """
+    sa_url = make_url(url)
+    drivername = ASYNC_DRIVERS.get(sa_url.drivername, sa_url.drivername)
+    return sa_url.set(drivername=drivername).render_as_string(hide_password=False)
+
+
+def engine_options(url: str, statement_timeout_ms: int = 0) -> dict:
+    """
+    create_engine() pool arguments from settings. SQLite keeps its default
+    pool; the statement timeout is set per connection on Postgres only.
+    """
+    sa_url = make_url(url)
+    if sa_url.get_backend_name() == "sqlite":
+        return {}
+    options = {
+        "pool_size": settings.DB_POOL_SIZE,
+        "max_overflow": settings.DB_MAX_OVERFLOW,
+        "pool_timeout": settings.DB_POOL_TIMEOUT_SECONDS,
+        "pool_recycle": settings.DB_POOL_RECYCLE_SECONDS,
+        "pool_pre_ping": settings.DB_POOL_PRE_PING,
+    }
+    if statement_timeout_ms and sa_url.get_backend_name() == "postgresql":
+        if sa_url.get_driver_name() == "asyncpg":
+            options["connect_args"] = {
+                "server_settings": {"statement_timeout": str(statement_timeout_ms)}
+            }
+        else:
+            options["connect_args"] = {"options": f"-c statement_timeout={statement_timeout_ms}"}
+    return options
+
+
+def create_api_engine(url: str):
+    """Async engine for request handling, with the statement timeout applied."""
+    return create_async_engine(url, **engine_options(url, settings.DB_STATEMENT_TIMEOUT_MS))
+
+
+class RoutingSession(Session):
+    """
+    Sends SELECTs executed with `bind_arguments=REPLICA_READ` to one read
+    replica (picked per session) and everything else to the primary. Once
+    the session writes, or its subjects wrote recently (`watch_writes`), it
+    reads from the primary too.
+    """
+
+    def get_bind(self, mapper=None, *, clause=None, replica=False, **kw):
+        if self._flushing or isinstance(clause, UpdateBase):
+            self.info["wrote"] = self.info["primary"] = True
+        elif replica and replica_engines and not self.info.get("primary"):
+            if "replica" not in self.info:
+                self.info["replica"] = random.choice(replica_engines).sync_engine
+            return self.info["replica"]
+        return super().get_bind(mapper, clause=clause, **kw)
 
-engine = create_engine(settings.DATABASE_URL, future=True)
+
+class RoutingAsyncSession(AsyncSession):
+    async def commit(self):
+        await super().commit()
+        if self.info.pop("wrote", False):
+            for subject in self.info.get("subjects", ()):
+                await note_write(subject)
+
+
+def watch_writes(db: AsyncSession, subject: str):
+    """
+    Tie `db` to `subject` (a user's email): its replica reads go to the
+    primary while `subject` has written in the last READ_YOUR_WRITES_SECONDS,
+    and its commits start that window.
+    """
+    if replica_engines:
+        db.info.setdefault("subjects", set()).add(subject)
+
+
+async def note_write(subject: str):
+    if replica_engines and settings.READ_YOUR_WRITES_SECONDS > 0:
+        key = READ_YOUR_WRITES_KEY.format(subject=subject)
+        await get_redis().set(key, 1, ex=settings.READ_YOUR_WRITES_SECONDS)
+
+
+async def replica_read(db: AsyncSession) -> dict:
+    """
+    bind_arguments for a read-only query on `db`: REPLICA_READ, or none
+    (the primary) once one of its subjects turns out to be a recent writer.
+    The subjects are looked up on the first replica read of the session.
+    """
+    if not replica_engines or db.info.get("primary"):
+        return {}
+    unchecked = db.info.get("subjects", set()) - db.info.setdefault("checked", set())
+    if unchecked:
+        db.info["checked"] |= unchecked
+        keys = [READ_YOUR_WRITES_KEY.format(subject=s) for s in unchecked]
+        if await get_redis().exists(*keys):
+            db.info["primary"] = True
+            return {}
+    return REPLICA_READ
+
+
+# sync engine: Celery workers, Alembic, admin panel and scripts
+engine = create_engine(
+    settings.DATABASE_URL, future=True, **engine_options(settings.DATABASE_URL)
+)
 SessionLocal = sessionmaker(bind=engine, autocommit=False, autoflush=False, future=True)
 
+# async engines: every `async def` route. Writes go to the primary; reads
+# marked REPLICA_READ are spread over the replicas, if any.
+async_engine = create_api_engine(
+    settings.ASYNC_DATABASE_URL or make_async_url(settings.DATABASE_URL)
+)
+replica_engines = [
+    create_api_engine(make_async_url(url)) for url in settings.DATABASE_REPLICA_URLS
+]
+AsyncSessionLocal = async_sessionmaker(
+    bind=async_engine,
+    class_=RoutingAsyncSession,
+    sync_session_class=RoutingSession,
+    autoflush=False,
+    expire_on_commit=False,
+)
+
+instrument_pool(engine, "sync")
+instrument_pool(async_engine.sync_engine, "async")
+for replica in replica_engines:
+    instrument_pool(replica.sync_engine, "replica")
+if settings.DB_PROFILING:
+    db_profiler.install(engine, settings.DB_SLOW_QUERY_MS)
+    db_profiler.install(async_engine.sync_engine, settings.DB_SLOW_QUERY_MS)
+    for replica in replica_engines:
+        db_profiler.install(replica.sync_engine, settings.DB_SLOW_QUERY_MS)
+
 
 class Base(DeclarativeBase):
     pass
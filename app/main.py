@@ -1,20 +1,46 @@
+from contextlib import asynccontextmanager
 from fastapi import FastAPI
-from fastapi.staticfiles import StaticFiles
-from app.routers import auth as auth_router, movies as movies_router
+from app.routers import (
+    auth as auth_router,
+    metrics as metrics_router,
+    movies as movies_router,
+    uploads as uploads_router,
+)
 from app.admin.setup import admin
 from app.config import settings
+from app.utils.db_profiler import DBProfilerMiddleware
+from app.utils.media import MediaStaticFiles
+from app.utils.metrics import MetricsMiddleware
+from app.utils.password import shutdown_password_pool
+from app.utils.redis_pool import init_redis, close_redis
 import os
 
-app = FastAPI(title="AuraFlix")
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    await init_redis()
+    yield
+    await close_redis()
+    shutdown_password_pool()
+
+
+app = FastAPI(title="AuraFlix", lifespan=lifespan)
+app.add_middleware(MetricsMiddleware)
+if settings.DB_PROFILING:
+    app.add_middleware(
+        DBProfilerMiddleware, n_plus_one_threshold=settings.DB_N_PLUS_ONE_THRESHOLD
+    )
 
 app.mount(
-    "/media",
-    StaticFiles(directory=os.path.join(settings.MEDIA_DIR)),
+    settings.MEDIA_URL,
+    MediaStaticFiles(directory=os.path.join(settings.MEDIA_DIR)),
     name="media",
 )
 
 app.include_router(auth_router.router)
 app.include_router(movies_router.router)
+app.include_router(uploads_router.router)
+app.include_router(metrics_router.router)
 
 
 @app.get("/")
@@ -1,4 +1,14 @@
-from sqlalchemy import Integer, String, Boolean, DateTime, Text, ForeignKey
+from sqlalchemy import (
+    JSON,
+    BigInteger,
+    Integer,
+    String,
+    Boolean,
+    DateTime,
+    Text,
+    ForeignKey,
+    Index,
+)
 from sqlalchemy.orm import relationship, Mapped, mapped_column
 from sqlalchemy.sql import func
 from app.database import Base
@@ -46,10 +56,72 @@ class Movie(Base, TimeMixin):
         Integer, ForeignKey("genres.id"), nullable=True
     )
     language: Mapped[Optional[str]] = mapped_column(String, nullable=True)
+    # seconds; probed from the MP4 header at upload when not given
     duration: Mapped[Optional[int]] = mapped_column(Integer, nullable=True)
     file_path: Mapped[str] = mapped_column(String, nullable=False)
+    # container and stream details probed at upload (app.utils.mp4)
+    media_type: Mapped[Optional[str]] = mapped_column(String, nullable=True)
+    codecs: Mapped[Optional[str]] = mapped_column(String, nullable=True)
+    width: Mapped[Optional[int]] = mapped_column(Integer, nullable=True)
+    height: Mapped[Optional[int]] = mapped_column(Integer, nullable=True)
     poster_path: Mapped[Optional[str]] = mapped_column(String, nullable=True)
+    # {"webp": {"320": "posters/ab/<digest>.webp", ...}, "avif": {...}}
+    poster_variants: Mapped[Optional[dict]] = mapped_column(
+        JSON(none_as_null=True), nullable=True
+    )
     view_count: Mapped[int] = mapped_column(Integer, default=0)
     release_date: Mapped[Optional[datetime]] = mapped_column(DateTime, nullable=True)
 
     genre: Mapped[Optional["Genre"]] = relationship("Genre", back_populates="movies")
+
+    # On Postgres the table also has a generated `search_vector` tsvector column
+    # and trigram index (migration c4e7a91b3f20), used by services.search_movies.
+
+    # keyset pagination indexes for services.list_movies, (sort column, id)
+    # optionally prefixed by an equality filter
+    __table_args__ = (
+        Index("ix_movies_created_at_id", "created_at", "id"),
+        Index("ix_movies_view_count_id", "view_count", "id"),
+        Index("ix_movies_genre_id_created_at_id", "genre_id", "created_at", "id"),
+        Index("ix_movies_genre_id_view_count_id", "genre_id", "view_count", "id"),
+        Index("ix_movies_language_created_at_id", "language", "created_at", "id"),
+        Index("ix_movies_release_date", "release_date"),
+    )
+
+
+class WatchEvent(Base):
+    """
+    Playback starts (one per view session), appended in batches from the
+    Redis buffer filled by stream_movie; read by the similar movies job.
+    No foreign keys: an event may outlive its user or movie.
+    """
+
+    __tablename__ = "watch_events"
+    id: Mapped[int] = mapped_column(
+        BigInteger().with_variant(Integer, "sqlite"), primary_key=True
+    )
+    user_id: Mapped[int] = mapped_column(Integer, nullable=False)
+    movie_id: Mapped[int] = mapped_column(Integer, nullable=False)
+    watched_at: Mapped[datetime] = mapped_column(DateTime(timezone=True), nullable=False)
+
+    __table_args__ = (Index("ix_watch_events_watched_at", "watched_at"),)
+
+
+class WatchProgress(Base):
+    """
+    Last playback position per user and movie. Heartbeats land in Redis
+    (app.utils.progress); a Celery beat task upserts the changed entries.
+    No foreign keys, like watch_events.
+    """
+
+    __tablename__ = "watch_progress"
+    user_id: Mapped[int] = mapped_column(Integer, primary_key=True)
+    movie_id: Mapped[int] = mapped_column(Integer, primary_key=True)
+    position_seconds: Mapped[int] = mapped_column(Integer, nullable=False)
+    # played to the end; left out of "continue watching"
+    completed: Mapped[bool] = mapped_column(Boolean, default=False, nullable=False)
+    updated_at: Mapped[datetime] = mapped_column(DateTime(timezone=True), nullable=False)
+
+    __table_args__ = (
+        Index("ix_watch_progress_user_id_updated_at", "user_id", "updated_at"),
+    )
@@ -4,33 +4,65 @@ from app import schemas
 from app import services
 from app.config import settings
 import random
-import redis
 from app.tasks.celery import send_verification_email_task
 from app.utils.password import create_access_token, create_refresh_token
 from fastapi.security import OAuth2PasswordRequestForm
 from app.utils.dependencies import get_current_active_user
-from app.utils.password import verify_password
-from app import models
 from datetime import timedelta
-from app.utils.rate_limiter import rate_limit
-
-r = redis.Redis.from_url(settings.REDIS_URL)
+from app.utils.rate_limiter import RateLimiter
+from app.utils.redis_pool import get_redis, register_script
 
 router = APIRouter(prefix="/api/v1/auth", tags=["auth"])
 
-CODE_TTL_SECONDS = 120  # 2 minutes
+
+# per-IP limits run as route dependencies, per-account limits inside handlers
+register_ip_limiter = RateLimiter("register:ip", limit=10, window=3600)
+login_ip_limiter = RateLimiter("login:ip", limit=30, window=60)
+login_account_limiter = RateLimiter("login:account", limit=10, window=300)
+resend_limiter = RateLimiter("resend", limit=5, window=120)  # max 5 per 2 minutes
+verify_account_limiter = RateLimiter("verify:account", limit=10, window=600)
+reset_ip_limiter = RateLimiter("pwdreset:ip", limit=20, window=600)
+reset_account_limiter = RateLimiter("pwdreset:account", limit=5, window=600)
 
 
 def _gen_code() -> str:
     return f"{random.randint(0, 999999):06d}"
 
 
-@router.post("/register", response_model=schemas.UserOut)
+# Compare-and-delete a verification code in one round trip:
+# 1 = matched (and consumed), 0 = wrong code, -1 = expired or never requested
+_CONSUME_CODE_LUA = """
+local stored = redis.call('GET', KEYS[1])
+if not stored then
+    return -1
+end
+if stored ~= ARGV[1] then
+    return 0
+end
+redis.call('DEL', KEYS[1])
+return 1
+"""
+_consume_code = register_script(_CONSUME_CODE_LUA)
+
+
+async def _store_code(key: str, code: str):
+    await get_redis().setex(key, settings.CODE_TTL_SECONDS, code)
+
+
+async def _check_code(key: str, code: str) -> int:
+    return await _consume_code(keys=[key], args=[code], client=get_redis())
+
+
+@router.post(
+    "/register",
+    response_model=schemas.UserOut,
+    dependencies=[Depends(register_ip_limiter)],
+)
 async def register(user_in: schemas.UserCreate, db: db_dependency):
-    existing = services.get_user_by_email(db, user_in.email)
+    existing = await services.get_user_by_email(db, user_in.email)
     if existing:
         raise HTTPException(status_code=400, detail="Email already registered")
-    user = services.create_user(
+    user = await services.create_user(
         db,
         email=user_in.email,
         password=user_in.password,
@@ -38,53 +70,57 @@ async def register(user_in: schemas.UserCreate, db: db_dependency):
         last_name=user_in.last_name,
     )
     code = _gen_code()
-    r.setex(f"verify:{user.email}", CODE_TTL_SECONDS, code)
+    await _store_code(f"verify:{user.email}", code)
     send_verification_email_task.delay(user.email, code, "verify")
     return user
 
 
 @router.post("/resend-code")
 async def resend_code(email: str, db: db_dependency):
-    rate_limit(f"resend:{email}", limit=5, window=120)  # max 5 per 2 minutes
-    user = services.get_user_by_email(db, email)
+    await resend_limiter.hit(email.lower())
+    user = await services.get_user_by_email(db, email)
     if not user:
         raise HTTPException(status_code=404, detail="User not found")
     code = _gen_code()
-    r.setex(f"verify:{email}", CODE_TTL_SECONDS, code)
+    await _store_code(f"verify:{email}", code)
     send_verification_email_task.delay(email, code, "verify")
     return {"msg": "sent"}
 
 
 @router.post("/verify")
 async def verify(email: str, code: str, db: db_dependency):
-    user = services.get_user_by_email(db, email)
+    await verify_account_limiter.hit(email.lower())
+    user = await services.get_user_by_email(db, email)
     if not user:
         raise HTTPException(status_code=404, detail="User not found")
-    stored = r.get(f"verify:{email}")
-    if not stored:
+    result = await _check_code(f"verify:{email}", code)
+    if result < 0:
         raise HTTPException(status_code=400, detail="Code expired or not requested")
-    if stored.decode() != code:
+    if result == 0:
         raise HTTPException(status_code=400, detail="Invalid code")
-    services.confirm_user(db, user)
-    r.delete(f"verify:{email}")
+    await services.confirm_user(db, user)
     return {"msg": "verified"}
 
 
-@router.post("/login")
+@router.post("/login", dependencies=[Depends(login_ip_limiter)])
 async def login(db: db_dependency, form_data: OAuth2PasswordRequestForm = Depends()):
     """
     OAuth2 login endpoint. Works with OAuth2PasswordBearer.
     """
-    user = services.get_user_by_email(db, form_data.username)
-    if not user or not verify_password(form_data.password, user.hashed_password):
+    await login_account_limiter.hit(form_data.username.lower())
+    user = await services.get_user_by_email(db, form_data.username)
+    if not user or not await services.verify_user_password(
+        db, user, form_data.password
+    ):
         raise HTTPException(status_code=401, detail="Invalid email or password")
     if not user.is_verified:
         raise HTTPException(status_code=403, detail="Email not verified")
 
     access_token_expires = timedelta(minutes=settings.ACCESS_TOKEN_EXPIRE_MINUTES)
-    access_token = create_access_token(
-        data={"sub": str(user.id)}, expires_delta=access_token_expires
-    )
+    claims = {"sub": str(user.id)}
+    if settings.USER_STATUS_IN_TOKEN:
+        claims["st"] = services.user_status_payload(user)
+    access_token = create_access_token(data=claims, expires_delta=access_token_expires)
     refresh_token = create_refresh_token(data={"sub": str(user.id)})
     return {
         "access_token": access_token,
@@ -108,7 +144,7 @@ async def refresh_token(refresh_token: str = Form(...)):
 
 
 @router.get("/me")
-async def get_me(current_user: models.User = Depends(get_current_active_user)):
+async def get_me(current_user: schemas.UserStatus = Depends(get_current_active_user)):
     return {
         "id": current_user.id,
         "email": current_user.email,
@@ -116,29 +152,30 @@ async def get_me(current_user: models.User = Depends(get_current_active_user)):
     }
 
 
-@router.post("/password-reset/request")
+@router.post("/password-reset/request", dependencies=[Depends(reset_ip_limiter)])
 async def password_reset_request(email: str, db: db_dependency):
-    user = services.get_user_by_email(db, email)
+    await reset_account_limiter.hit(f"request:{email.lower()}")
+    user = await services.get_user_by_email(db, email)
     if not user:
         return {"msg": "If the email exists, a code has been sent"}
     code = _gen_code()
-    r.setex(f"pwdreset:{email}", CODE_TTL_SECONDS, code)
+    await _store_code(f"pwdreset:{email}", code)
     send_verification_email_task.delay(email, code, "reset")
     return {"msg": "If the email exists, a code has been sent"}
 
 
-@router.post("/password-reset/confirm")
+@router.post("/password-reset/confirm", dependencies=[Depends(reset_ip_limiter)])
 async def password_reset_confirm(email: str, code: str, new_password: str, db: db_dependency):
-    user = services.get_user_by_email(db, email)
+    await reset_account_limiter.hit(f"confirm:{email.lower()}")
+    user = await services.get_user_by_email(db, email)
     if not user:
         raise HTTPException(status_code=404, detail="User not found")
-    stored = r.get(f"pwdreset:{email}")
-    if not stored or stored.decode() != code:
+    if await _check_code(f"pwdreset:{email}", code) != 1:
         raise HTTPException(status_code=400, detail="Invalid or expired code")
-    from app.utils.password import hash_password
+    from app.utils.password import hash_password_async
 
-    user.hashed_password = hash_password(new_password)
+    user.hashed_password = await hash_password_async(new_password)
     db.add(user)
-    db.commit()
-    r.delete(f"pwdreset:{email}")
+    await db.commit()
+    await services.refresh_user_status(user)
     return {"msg": "password reset"}
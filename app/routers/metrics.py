@@ -0,0 +1,67 @@
+import json
+import secrets
+from typing import Optional
+
+import redis.asyncio as aioredis
+from fastapi import APIRouter, Header, HTTPException, Response
+
+from app.config import settings
+from app.tasks.celery import celery_app
+from app.utils.metrics import CELERY_QUEUE_LENGTH, CELERY_QUEUED_TASKS, render
+
+router = APIRouter(tags=["metrics"])
+
+# per-task counts look at this many waiting messages at most
+QUEUE_SCAN_LIMIT = 1000
+
+_broker: aioredis.Redis | None = None
+
+
+def _broker_client() -> aioredis.Redis | None:
+    """Client for a Redis broker; queue depth is not sampled for other brokers."""
+    global _broker
+    url = celery_app.conf.broker_url or ""
+    if not url.startswith(("redis://", "rediss://", "unix://")):
+        return None
+    if _broker is None:
+        _broker = aioredis.Redis.from_url(url, decode_responses=True)
+    return _broker
+
+
+async def sample_celery_queues():
+    client = _broker_client()
+    if client is None:
+        return
+    queue = celery_app.conf.task_default_queue
+    pipe = client.pipeline(transaction=False)
+    pipe.llen(queue)
+    pipe.lrange(queue, 0, QUEUE_SCAN_LIMIT - 1)
+    length, messages = await pipe.execute()
+    CELERY_QUEUE_LENGTH.labels(queue).set(length)
+
+    # only our own task names become label values
+    counts = {name: 0 for name in celery_app.tasks if not name.startswith("celery.")}
+    for raw in messages:
+        try:
+            name = json.loads(raw)["headers"]["task"]
+        except (ValueError, KeyError, TypeError):
+            continue
+        if name in counts:
+            counts[name] += 1
+    for name, count in counts.items():
+        CELERY_QUEUED_TASKS.labels(name).set(count)
+
+
+@router.get("/metrics", include_in_schema=False)
+async def metrics(authorization: Optional[str] = Header(None)):
+    """Prometheus exposition of this process (or all, in multiprocess mode)."""
+    if settings.METRICS_TOKEN and not secrets.compare_digest(
+        authorization or "", f"Bearer {settings.METRICS_TOKEN}"
+    ):
+        raise HTTPException(status_code=401, detail="Invalid metrics token")
+    try:
+        await sample_celery_queues()
+    except aioredis.RedisError:
+        pass  # the broker being down must not take the API metrics with it
+    body, content_type = render()
+    return Response(body, media_type=content_type)
@@ -1,197 +1,477 @@
 from fastapi import (
     APIRouter,
     Depends,
-    File,
-    UploadFile,
+    Header,
     HTTPException,
     status,
     Request,
     Response,
-    Form,
+    Query,
 )
+from fastapi.exceptions import RequestValidationError
+from pydantic import ValidationError
+from starlette.requests import ClientDisconnect
 from app.utils.dependencies import db_dependency
 from app import services, schemas
 from app.config import settings
+import anyio
+import mimetypes
+import orjson
 import os
-from fastapi.responses import StreamingResponse
-from typing import List, Optional
+import time
+from datetime import datetime
+from typing import Literal, Optional
 from app.utils.dependencies import get_current_active_user, get_current_admin_user
 from app.utils.files import (
     ALLOWED_VIDEO_MIME,
     ALLOWED_IMAGE_MIME,
     DEFAULT_MAX_VIDEO_SIZE,
-    make_safe_filename,
-    save_upload_file_stream,
 )
+from app.utils.cache import (
+    cache_stats,
+    get_catalog_state,
+    get_views_stamp,
+    get_views_state,
+)
+from app.utils.http_cache import (
+    IMMUTABLE,
+    is_not_modified,
+    not_modified,
+    validator_headers,
+)
+from app.utils.media import StreamResponse
+from app.utils.metrics import UPLOAD_BYTES, UPLOAD_DURATION
+from app.tasks.celery import generate_poster_variants_task
+from app.utils.images import PosterError, render_poster_variants
+from app.utils.rate_limiter import RateLimiter
+from app.utils.storage import ingest_video, is_content_addressed, movie_media_fields
+from app.utils.redis_pool import get_redis
+from app.utils.streaming_upload import (
+    FileFieldSpec,
+    StreamingUploadError,
+    discard_saved_files,
+    parse_streaming_upload,
+)
+from app.utils.trending import record_play
+from app.utils.views import record_view
 
 router = APIRouter(prefix="/api/v1/movies", tags=["movies"])
 
+# players issue many Range requests per playback, so these are generous
+stream_ip_limiter = RateLimiter("stream:ip", limit=1200, window=60)
+stream_user_limiter = RateLimiter("stream:user", limit=600, window=60)
+
+
+async def _catalog_not_modified(
+    request: Request,
+    response: Response,
+    tag: str,
+    views_stamp: int | None = None,
+) -> Response | None:
+    """
+    Validators for catalog responses come from the catalog version, so they
+    are known before anything is loaded or serialized; responses whose view
+    counts must be current pass a `views_stamp` too. Returns a 304 when the
+    client's copy is current, otherwise sets them on `response`.
+    """
+    version, updated_at = await get_catalog_state()
+    etag = f"{tag}-v{version}"
+    if views_stamp is not None:
+        etag += f"-views{views_stamp}"
+        views_updated_at = (await get_views_state())[1]
+        if updated_at is None or (views_updated_at or 0) > updated_at:
+            updated_at = views_updated_at
+    headers = validator_headers(f'W/"{etag}"', updated_at)
+    if is_not_modified(request.headers, headers["etag"], updated_at):
+        return not_modified(headers)
+    response.headers.update(headers)
+    return None
+
+
+def _json_response(data, headers: dict | None = None) -> Response:
+    """Already JSON-ready data, encoded with orjson; skips response_model
+    re-validation of every item."""
+    return Response(orjson.dumps(data), media_type="application/json", headers=headers)
+
+
+def _parse_fieldset(fields: Optional[str], include: Optional[str]):
+    """`fields=id,title` and `include=genre` -> (field tuple or None, include_genre)."""
+    names = None
+    if fields:
+        names = tuple(sorted({name.strip() for name in fields.split(",") if name.strip()}))
+        unknown = set(names) - set(schemas.MOVIE_FIELDS)
+        if unknown:
+            raise HTTPException(
+                status_code=400, detail=f"Unknown fields: {', '.join(sorted(unknown))}"
+            )
+    includes = {name.strip() for name in include.split(",")} if include else set()
+    if includes - {"genre"}:
+        raise HTTPException(status_code=400, detail="Only include=genre is supported")
+    return names, "genre" in includes
+
 
-@router.get("/", response_model=List[schemas.MovieOut])
+@router.get("/", response_model=schemas.MoviePage)
 async def list_movies(
+    request: Request,
+    response: Response,
     db: db_dependency,
-    skip: int = 0,
-    limit: int = 50,
+    limit: int = Query(50, ge=1, le=200),
+    cursor: Optional[str] = None,
+    sort: Literal["created_at", "view_count"] = "created_at",
+    genre_id: Optional[int] = None,
+    language: Optional[str] = None,
+    released_from: Optional[datetime] = None,
+    released_to: Optional[datetime] = None,
+    fields: Optional[str] = Query(None, description="Comma-separated MovieOut fields"),
+    include: Optional[str] = Query(None, description="Related objects: genre"),
     _u=Depends(get_current_active_user),
 ):
-    movies = services.list_movies(db, skip=skip, limit=limit)
-    return movies
+    """
+    Keyset-paginated listing. Pass the returned `next_cursor` back as
+    `cursor` to fetch the next page. `fields=` returns (and loads) only the
+    named fields; `include=genre` embeds each movie's genre.
+    """
+    field_names, include_genre = _parse_fieldset(fields, include)
+    views_stamp = (await get_views_state())[0] if sort == "view_count" else None
+    if cached := await _catalog_not_modified(request, response, "movies", views_stamp):
+        return cached
+    try:
+        page = await services.list_movies_cached(
+            db,
+            limit=limit,
+            cursor=cursor,
+            sort=sort,
+            genre_id=genre_id,
+            language=language,
+            released_from=released_from,
+            released_to=released_to,
+            fields=field_names,
+            include_genre=include_genre,
+        )
+    except ValueError as exc:
+        raise HTTPException(status_code=400, detail=str(exc))
+    return _json_response(page, headers=dict(response.headers))
+
+
+@router.get("/cache/stats")
+async def movie_cache_stats(_admin=Depends(get_current_admin_user)):
+    """Hit/miss counters of this worker's movie metadata cache."""
+    return cache_stats()
+
+
+@router.get("/search", response_model=schemas.MoviePage)
+async def search_movies(
+    db: db_dependency,
+    q: str = Query(..., min_length=1, max_length=200),
+    limit: int = Query(20, ge=1, le=100),
+    cursor: Optional[str] = None,
+    _u=Depends(get_current_active_user),
+):
+    """Relevance-ranked search over title and description."""
+    try:
+        movies, next_cursor = await services.search_movies(
+            db, q, limit=limit, cursor=cursor
+        )
+    except ValueError as exc:
+        raise HTTPException(status_code=400, detail=str(exc))
+    return _json_response(
+        {"items": services.serialize_movies(movies), "next_cursor": next_cursor}
+    )
+
+
+@router.get("/trending", response_model=schemas.TrendingPage)
+async def trending_movies(
+    db: db_dependency,
+    window: Literal["hour", "day"] = "day",
+    limit: int = Query(20, ge=1, le=100),
+    _u=Depends(get_current_active_user),
+):
+    """Most played movies of the last hour or day, recent plays weighing more."""
+    items = await services.trending_movies(db, window, limit)
+    return _json_response({"window": window, "items": items})
+
+
+@router.get("/continue-watching", response_model=schemas.ContinueWatchingPage)
+async def continue_watching(
+    db: db_dependency,
+    limit: int = Query(20, ge=1, le=50),
+    user=Depends(get_current_active_user),
+):
+    """Movies the user started and has not finished, last watched first."""
+    items = await services.continue_watching(db, user.id, limit)
+    return _json_response({"items": items})
 
 
 @router.get("/{movie_id}", response_model=schemas.MovieOut)
-async def get_movie(movie_id: int, db: db_dependency, _u=Depends(get_current_active_user)):
-    movie = services.get_movie(db, movie_id)
+async def get_movie(
+    movie_id: int,
+    request: Request,
+    response: Response,
+    db: db_dependency,
+    _u=Depends(get_current_active_user),
+):
+    views_stamp = await get_views_stamp(movie_id)
+    if cached := await _catalog_not_modified(
+        request, response, f"movie-{movie_id}", views_stamp
+    ):
+        return cached
+    movie = await services.get_movie_cached(db, movie_id, views_stamp)
     if not movie:
         raise HTTPException(status_code=404, detail="Not found")
-    return movie
+    return _json_response(movie, headers=dict(response.headers))
+
+
+@router.get("/{movie_id}/similar", response_model=schemas.SimilarPage)
+async def similar_movies(
+    movie_id: int,
+    db: db_dependency,
+    limit: int = Query(10, ge=1, le=settings.SIMILAR_MOVIES_K),
+    _u=Depends(get_current_active_user),
+):
+    """Movies watched by the same people, or popular ones of the same genre."""
+    similar = await services.similar_movies(db, movie_id, limit)
+    if similar is None:
+        raise HTTPException(status_code=404, detail="Not found")
+    source, items = similar
+    return _json_response({"movie_id": movie_id, "source": source, "items": items})
+
+
+@router.put("/{movie_id}/progress", response_model=schemas.WatchProgressOut)
+async def update_watch_progress(
+    movie_id: int,
+    progress: schemas.WatchProgressIn,
+    db: db_dependency,
+    user=Depends(get_current_active_user),
+):
+    """
+    Playback position heartbeat, sent every few seconds while playing.
+    Buffered in Redis; written to the database in bulk by Celery beat.
+    """
+    stored = await services.record_watch_progress(
+        db, user.id, movie_id, progress.position_seconds
+    )
+    if stored is None:
+        raise HTTPException(status_code=404, detail="Not found")
+    return stored
+
+
+@router.get("/{movie_id}/progress", response_model=schemas.WatchProgressOut)
+async def get_watch_progress(
+    movie_id: int,
+    db: db_dependency,
+    user=Depends(get_current_active_user),
+):
+    """Where to resume `movie_id`; position 0 if the user never played it."""
+    progress = await services.get_watch_progress(db, user.id, movie_id)
+    return progress or {"movie_id": movie_id}
+
+
+# poster size limit (5 MiB)
+MAX_POSTER_SIZE = 5 * 1024 * 1024
+# allowance for multipart boundaries, part headers and the text fields
+UPLOAD_FORM_OVERHEAD = 1024 * 1024
+
+UPLOAD_TEXT_FIELDS = ("title", "description", "genre_id", "language", "duration")
+UPLOAD_FORM_SCHEMA = {
+    "requestBody": {
+        "required": True,
+        "content": {
+            "multipart/form-data": {
+                "schema": {
+                    "type": "object",
+                    "required": ["title", "file"],
+                    "properties": {
+                        "title": {"type": "string"},
+                        "description": {"type": "string"},
+                        "genre_id": {"type": "integer"},
+                        "language": {"type": "string"},
+                        "duration": {"type": "integer"},
+                        "file": {"type": "string", "format": "binary"},
+                        "poster": {"type": "string", "format": "binary"},
+                    },
+                }
+            }
+        },
+    }
+}
 
 
 @router.post(
-    "/upload", response_model=schemas.MovieOut, status_code=status.HTTP_201_CREATED
+    "/upload",
+    response_model=schemas.MovieOut,
+    status_code=status.HTTP_201_CREATED,
+    openapi_extra=UPLOAD_FORM_SCHEMA,
 )
 async def upload_movie(
+    request: Request,
+    response: Response,
     db: db_dependency,
-    title: str = Form(...),
-    description: Optional[str] = Form(None),
-    genre_id: Optional[int] = Form(None),
-    language: Optional[str] = Form(None),
-    duration: Optional[int] = Form(None),
-    file: UploadFile = File(...),
-    poster: Optional[UploadFile] = File(None),
     admin=Depends(get_current_admin_user),
+    idempotency_key: Optional[str] = Header(None, max_length=128),
 ):
     """
     Upload a movie file + optional poster.
-    Validates MIME type and size before saving.
+    The body is parsed as it streams in and hashed on the way; files are
+    stored under their digest, so re-uploading known content writes nothing.
+    MIME type and size limits are checked before the body ends.
+
+    With an `Idempotency-Key` header a retried request returns the movie the
+    first one created, without reading the body again.
+    """
+    idem_key = None
+    if idempotency_key:
+        idem_key = f"idem:upload:{admin.id}:{idempotency_key}"
+        existing = await _claim_idempotency_key(db, idem_key)
+        if existing is not None:
+            response.status_code = status.HTTP_200_OK
+            response.headers["Idempotent-Replayed"] = "true"
+            return existing
+    try:
+        movie = await _create_uploaded_movie(request, db)
+    except BaseException:
+        if idem_key:
+            await get_redis().delete(idem_key)
+        raise
+    if idem_key:
+        await get_redis().set(
+            idem_key, movie.id, ex=settings.UPLOAD_IDEMPOTENCY_TTL_SECONDS
+        )
+    return movie
+
+
+async def _claim_idempotency_key(db, idem_key: str):
+    """
+    Reserve `idem_key` for this request. Returns the movie a previous request
+    with the same key created, or None when this request should proceed.
     """
-    # validate video content-type
-    if file.content_type not in ALLOWED_VIDEO_MIME:
+    ttl = settings.UPLOAD_IDEMPOTENCY_TTL_SECONDS
+    redis = get_redis()
+    if await redis.set(idem_key, "pending", nx=True, ex=ttl):
+        return None
+    movie_id = await redis.get(idem_key)
+    if movie_id == "pending":
         raise HTTPException(
-            status_code=400, detail=f"Invalid video content-type: {file.content_type}"
+            status_code=409,
+            detail="A request with this Idempotency-Key is still in progress",
         )
+    movie = await services.get_movie_cached(db, int(movie_id)) if movie_id else None
+    if movie is None:
+        # the earlier movie is gone (or the key just expired): start over
+        await redis.set(idem_key, "pending", ex=ttl)
+    return movie
+
 
+async def _create_uploaded_movie(request: Request, db):
+    start = time.perf_counter()
     # allow override of max size via settings (env) if you want
     max_video_size = getattr(settings, "MAX_VIDEO_UPLOAD_BYTES", DEFAULT_MAX_VIDEO_SIZE)
 
-    media_dir = settings.MEDIA_DIR
-    movies_dir = os.path.join(media_dir, "movies")
-    posters_dir = os.path.join(media_dir, "posters")
-    os.makedirs(movies_dir, exist_ok=True)
-    os.makedirs(posters_dir, exist_ok=True)
+    max_body_size = (
+        max_video_size + MAX_POSTER_SIZE + UPLOAD_FORM_OVERHEAD if max_video_size else None
+    )
 
-    # safe filenames
-    safe_video_name = make_safe_filename(file.filename)
-    video_rel_path = os.path.join("movies", safe_video_name)
-    video_full_path = os.path.join(media_dir, video_rel_path)
+    # reject oversized bodies before reading a single byte
+    content_length = request.headers.get("content-length")
+    if max_body_size and content_length and content_length.isdigit():
+        if int(content_length) > max_body_size:
+            raise HTTPException(status_code=413, detail="Video file too large")
 
+    media_dir = settings.MEDIA_DIR
     try:
-        save_upload_file_stream(file, video_full_path, max_bytes=max_video_size)
-    except ValueError:
-        raise HTTPException(status_code=413, detail="Video file too large")
-    except Exception as exc:
-        # unexpected error while saving
-        raise HTTPException(status_code=500, detail=f"Failed to save video: {exc}")
+        fields, files = await parse_streaming_upload(
+            request,
+            {
+                "file": FileFieldSpec(
+                    "video", media_dir, "movies", ALLOWED_VIDEO_MIME, max_video_size
+                ),
+                "poster": FileFieldSpec(
+                    "poster", media_dir, "posters", ALLOWED_IMAGE_MIME, MAX_POSTER_SIZE
+                ),
+            },
+            max_body_size,
+        )
+    except StreamingUploadError as exc:
+        raise HTTPException(status_code=exc.status_code, detail=exc.detail)
+    except ClientDisconnect:
+        raise HTTPException(status_code=400, detail="Upload interrupted")
+    UPLOAD_BYTES.labels("form").inc(sum(saved.size for saved in files.values()))
 
-    poster_rel_path = None
-    if poster:
-        if poster.content_type not in ALLOWED_IMAGE_MIME:
-            # cleanup video file we just wrote
-            try:
-                os.remove(video_full_path)
-            except Exception:
-                pass
-            raise HTTPException(
-                status_code=400,
-                detail=f"Invalid poster content-type: {poster.content_type}",
-            )
-        safe_poster_name = make_safe_filename(poster.filename)
-        poster_rel_path = os.path.join("posters", safe_poster_name)
-        poster_full_path = os.path.join(media_dir, poster_rel_path)
-        try:
-            # smaller poster size limit (e.g., 5 MiB)
-            save_upload_file_stream(poster, poster_full_path, max_bytes=5 * 1024 * 1024)
-        except ValueError:
-            # cleanup video file
-            try:
-                os.remove(video_full_path)
-            except Exception:
-                pass
-            raise HTTPException(status_code=413, detail="Poster file too large")
-        except Exception as exc:
+    video = files.get("file")
+    poster = files.get("poster")
+    try:
+        if video is None:
+            raise HTTPException(status_code=400, detail="Missing video file")
+        # faststart rewrite + metadata probe; may move the video to a new digest
+        video.rel_path, video.created, info = await anyio.to_thread.run_sync(
+            ingest_video, video.rel_path, video.created, media_dir
+        )
+        video.full_path = os.path.join(media_dir, video.rel_path)
+        # probed values fill in whatever the form left empty
+        data = movie_media_fields(info, video.content_type)
+        data.update(
+            (name, fields[name]) for name in UPLOAD_TEXT_FIELDS if fields.get(name)
+        )
+        movie_in = schemas.MovieCreate(
+            **data,
+            file_path=video.rel_path,
+            poster_path=poster.rel_path if poster else None,
+        )
+        poster_variants = None
+        if poster and settings.POSTER_VARIANTS_INLINE:
             try:
-                os.remove(video_full_path)
-            except Exception:
-                pass
-            raise HTTPException(status_code=500, detail=f"Failed to save poster: {exc}")
-
-    movie = services.create_movie(
-        db,
-        title=title,
-        description=description,
-        genre_id=genre_id,
-        language=language,
-        duration=duration,
-        file_path=video_rel_path,
-        poster_path=poster_rel_path,
-    )
+                poster_variants = await anyio.to_thread.run_sync(
+                    render_poster_variants, poster.rel_path, media_dir
+                )
+            except PosterError as exc:
+                raise HTTPException(status_code=400, detail=str(exc))
+        movie = await services.create_movie(
+            db, **movie_in.model_dump(), poster_variants=poster_variants
+        )
+    except Exception as exc:
+        # also I/O errors from ingest and database errors from create_movie
+        discard_saved_files(files)
+        if isinstance(exc, ValidationError):
+            raise RequestValidationError(exc.errors())
+        raise
+    if poster and not settings.POSTER_VARIANTS_INLINE:
+        generate_poster_variants_task.delay(movie.id)
+    UPLOAD_DURATION.labels("form").observe(time.perf_counter() - start)
     return movie
 
 
-@router.get("/{movie_id}/stream")
+@router.api_route(
+    "/{movie_id}/stream",
+    methods=["GET", "HEAD"],
+    dependencies=[Depends(stream_ip_limiter)],
+)
 async def stream_movie(
     movie_id: int,
     request: Request,
     db: db_dependency,
-    _u=Depends(get_current_active_user),
+    user=Depends(get_current_active_user),
 ):
-    movie = services.get_movie(db, movie_id)
+    await stream_user_limiter.hit(str(user.id))
+    movie = await services.get_movie_cached(db, movie_id)
     if not movie:
         raise HTTPException(status_code=404, detail="Not found")
     media_root = settings.MEDIA_DIR
-    path = os.path.join(media_root, movie.file_path)
+    path = os.path.join(media_root, movie["file_path"])
     if not os.path.exists(path):
         raise HTTPException(status_code=404, detail="File not found")
 
-    file_size = os.path.getsize(path)
-    range_header = request.headers.get("range")
+    media_type = (
+        movie.get("media_type")
+        or mimetypes.guess_type(path)[0]
+        or "application/octet-stream"
+    )
+    headers = None
+    if is_content_addressed(movie["file_path"]):
+        headers = {"cache-control": f"private, {IMMUTABLE}"}
+    # range parsing, conditional requests, HEAD and zero-copy sending live in
+    # the response
+    resp = StreamResponse(path, media_type=media_type, headers=headers)
 
-    def iter_file(start: int = 0, end: int = None, chunk_size: int = 1024 * 1024):
-        with open(path, "rb") as f:
-            f.seek(start)
-            remaining = (end - start + 1) if end is not None else None
-            while True:
-                read_size = (
-                    chunk_size if remaining is None else min(chunk_size, remaining)
-                )
-                chunk = f.read(read_size)
-                if not chunk:
-                    break
-                yield chunk
-                if remaining is not None:
-                    remaining -= len(chunk)
-                    if remaining <= 0:
-                        break
-
-    if range_header:
-        # parse "bytes=start-end"
-        try:
-            _, range_val = range_header.split("=")
-            start_str, end_str = range_val.split("-")
-            start = int(start_str) if start_str else 0
-            end = int(end_str) if end_str else file_size - 1
-        except Exception:
-            raise HTTPException(status_code=400, detail="Invalid Range header")
-        if start >= file_size:
-            return Response(status_code=416)
-        resp = StreamingResponse(iter_file(start, end), status_code=206)
-        resp.headers["Content-Range"] = f"bytes {start}-{end}/{file_size}"
-        resp.headers["Accept-Ranges"] = "bytes"
-        resp.headers["Content-Length"] = str(end - start + 1)
-        resp.headers["Content-Type"] = "video/mp4"
-    else:
-        resp = StreamingResponse(iter_file(0, file_size - 1), media_type="video/mp4")
-        resp.headers["Content-Length"] = str(file_size)
-
-    # increment view count
-    services.increment_view_count(db, movie)
+    # buffered in Redis, one per playback session; flushed by Celery beat
+    if request.method == "GET" and await record_view(movie_id, user.id):
+        await record_play(movie_id)
     return resp
@@ -0,0 +1,283 @@
+import functools
+import hashlib
+import json
+import os
+import time
+import uuid
+
+import aiofiles
+import anyio
+from fastapi import APIRouter, Depends, Header, HTTPException, Request, status
+
+from app import models, schemas, services
+from app.config import settings
+from app.utils.dependencies import db_dependency, get_current_admin_user
+from app.utils.files import ALLOWED_VIDEO_MIME
+from app.utils.metrics import UPLOAD_BYTES, UPLOAD_DURATION
+from app.utils.redis_pool import get_redis
+from app.utils.storage import (
+    hash_file,
+    ingest_video,
+    movie_media_fields,
+    remove_media,
+    store_content,
+)
+
+router = APIRouter(prefix="/api/v1/uploads", tags=["uploads"])
+
+# how long a complete call holds its claim if the process dies while holding it
+COMPLETE_CLAIM_TTL_SECONDS = 60 * 60
+
+# Resumable upload protocol:
+#   POST   /uploads                      create a session, get chunk_size
+#   PUT    /uploads/{id}/chunks?offset=  send one chunk (any order, in parallel)
+#   GET    /uploads/{id}                 progress: received / missing chunks
+#   POST   /uploads/{id}/complete        store under its digest, create the Movie
+#   DELETE /uploads/{id}                 abort
+# Sessions live in Redis and expire after UPLOAD_SESSION_TTL_SECONDS without
+# activity; the Celery cleanup task removes their orphaned .part files.
+
+
+def uploads_dir() -> str:
+    return os.path.join(settings.MEDIA_DIR, "uploads")
+
+
+def _part_path(upload_id: str) -> str:
+    return os.path.join(uploads_dir(), f"{upload_id}.part")
+
+
+def _session_key(upload_id: str) -> str:
+    return f"upload:{upload_id}"
+
+
+def _chunks_key(upload_id: str) -> str:
+    return f"upload:{upload_id}:chunks"
+
+
+def _completing_key(upload_id: str) -> str:
+    return f"upload:{upload_id}:completing"
+
+
+async def _load_session(upload_id: str, admin: models.User) -> dict:
+    """The upload's session; other admins' uploads are not found."""
+    try:
+        valid = uuid.UUID(hex=upload_id).hex == upload_id
+    except ValueError:
+        valid = False
+    if not valid:
+        raise HTTPException(status_code=404, detail="Upload not found")
+    raw = await get_redis().get(_session_key(upload_id))
+    if not raw:
+        raise HTTPException(status_code=404, detail="Upload not found or expired")
+    session = json.loads(raw)
+    if session["admin_id"] != admin.id:
+        raise HTTPException(status_code=404, detail="Upload not found")
+    return session
+
+
+async def _ensure_not_completing(upload_id: str):
+    if await get_redis().exists(_completing_key(upload_id)):
+        raise HTTPException(status_code=409, detail="Upload is being completed")
+
+
+async def _progress(session: dict) -> schemas.UploadSessionOut:
+    received = sorted(
+        int(i) for i in await get_redis().smembers(_chunks_key(session["id"]))
+    )
+    received_set = set(received)
+    missing = [i for i in range(session["total_chunks"]) if i not in received_set]
+    return schemas.UploadSessionOut(
+        id=session["id"],
+        size=session["size"],
+        chunk_size=session["chunk_size"],
+        total_chunks=session["total_chunks"],
+        received_chunks=received,
+        missing_chunks=missing,
+        complete=not missing,
+    )
+
+
+def _preallocate(path: str, size: int):
+    with open(path, "wb") as f:
+        f.truncate(size)
+
+
+@router.post(
+    "/", response_model=schemas.UploadSessionOut, status_code=status.HTTP_201_CREATED
+)
+async def create_upload(
+    data: schemas.UploadSessionCreate, admin=Depends(get_current_admin_user)
+):
+    if data.content_type not in ALLOWED_VIDEO_MIME:
+        raise HTTPException(
+            status_code=400, detail=f"Invalid video content-type: {data.content_type}"
+        )
+    if data.size <= 0:
+        raise HTTPException(status_code=400, detail="Invalid size")
+    if settings.MAX_VIDEO_UPLOAD_BYTES and data.size > settings.MAX_VIDEO_UPLOAD_BYTES:
+        raise HTTPException(status_code=413, detail="Video file too large")
+
+    upload_id = uuid.uuid4().hex
+    chunk_size = settings.UPLOAD_CHUNK_SIZE
+    session = {
+        "id": upload_id,
+        "size": data.size,
+        "chunk_size": chunk_size,
+        "total_chunks": -(-data.size // chunk_size),
+        "admin_id": admin.id,
+        "movie": data.model_dump(mode="json"),
+    }
+    os.makedirs(uploads_dir(), exist_ok=True)
+    await anyio.to_thread.run_sync(_preallocate, _part_path(upload_id), data.size)
+    await get_redis().set(
+        _session_key(upload_id),
+        json.dumps(session),
+        ex=settings.UPLOAD_SESSION_TTL_SECONDS,
+    )
+    return await _progress(session)
+
+
+@router.put("/{upload_id}/chunks", response_model=schemas.UploadSessionOut)
+async def upload_chunk(
+    upload_id: str,
+    offset: int,
+    request: Request,
+    x_chunk_sha256: str = Header(...),
+    admin=Depends(get_current_admin_user),
+):
+    """
+    Write one chunk at `offset` (a multiple of chunk_size). The raw request
+    body is the chunk; `X-Chunk-SHA256` is its hex digest. Re-sending a chunk
+    is safe, so clients retry only what failed.
+    """
+    session = await _load_session(upload_id, admin)
+    chunk_size, size = session["chunk_size"], session["size"]
+    if offset < 0 or offset >= size or offset % chunk_size:
+        raise HTTPException(status_code=400, detail="Invalid chunk offset")
+    expected = min(chunk_size, size - offset)
+
+    start = time.perf_counter()
+    # the chunk (at most chunk_size) is held until its digest checks out, so
+    # a corrupt re-send never overwrites a chunk already received intact
+    chunk = bytearray()
+    digest = hashlib.sha256()
+    async for data in request.stream():
+        if len(chunk) + len(data) > expected:
+            raise HTTPException(status_code=413, detail="Chunk too large")
+        digest.update(data)
+        chunk += data
+    received = len(chunk)
+    if received != expected:
+        raise HTTPException(
+            status_code=400, detail=f"Expected {expected} bytes, got {received}"
+        )
+    if digest.hexdigest() != x_chunk_sha256.lower():
+        raise HTTPException(status_code=400, detail="Chunk checksum mismatch")
+    await _ensure_not_completing(upload_id)
+    # a chunk already received was verified when it was written; leaving it
+    # alone also keeps the .part file untouched once complete has linked it
+    if not await get_redis().sismember(_chunks_key(upload_id), offset // chunk_size):
+        async with aiofiles.open(_part_path(upload_id), "r+b") as f:
+            await f.seek(offset)
+            await f.write(chunk)
+    UPLOAD_BYTES.labels("chunk").inc(received)
+    UPLOAD_DURATION.labels("chunk").observe(time.perf_counter() - start)
+
+    pipe = get_redis().pipeline(transaction=True)
+    pipe.sadd(_chunks_key(upload_id), offset // chunk_size)
+    pipe.expire(_chunks_key(upload_id), settings.UPLOAD_SESSION_TTL_SECONDS)
+    pipe.expire(_session_key(upload_id), settings.UPLOAD_SESSION_TTL_SECONDS)
+    await pipe.execute()
+    return await _progress(session)
+
+
+@router.get("/{upload_id}", response_model=schemas.UploadSessionOut)
+async def upload_progress(upload_id: str, admin=Depends(get_current_admin_user)):
+    return await _progress(await _load_session(upload_id, admin))
+
+
+@router.post(
+    "/{upload_id}/complete",
+    response_model=schemas.MovieOut,
+    status_code=status.HTTP_201_CREATED,
+)
+async def complete_upload(
+    upload_id: str, db: db_dependency, admin=Depends(get_current_admin_user)
+):
+    session = await _load_session(upload_id, admin)
+    progress = await _progress(session)
+    if not progress.complete:
+        raise HTTPException(
+            status_code=409,
+            detail=f"{len(progress.missing_chunks)} chunks missing",
+        )
+    # claim the session so a concurrent complete cannot create a second movie
+    claimed = await get_redis().set(
+        _completing_key(upload_id), "1", nx=True, ex=COMPLETE_CLAIM_TTL_SECONDS
+    )
+    if not claimed:
+        raise HTTPException(status_code=409, detail="Upload is already being completed")
+    if not await get_redis().exists(_session_key(upload_id)):
+        # completed (or aborted) since it was loaded
+        await get_redis().delete(_completing_key(upload_id))
+        raise HTTPException(status_code=404, detail="Upload not found or expired")
+    created_paths = []
+    try:
+        movie = await _create_movie(db, session, created_paths)
+    except Exception:
+        # the .part file is still whole, so the client can complete again
+        for path in created_paths:
+            await anyio.to_thread.run_sync(remove_media, path)
+        await get_redis().delete(_completing_key(upload_id))
+        raise
+    await get_redis().delete(
+        _session_key(upload_id), _chunks_key(upload_id), _completing_key(upload_id)
+    )
+    try:
+        os.remove(_part_path(upload_id))
+    except FileNotFoundError:
+        pass
+    return movie
+
+
+async def _create_movie(db, session: dict, created_paths: list[str]):
+    """Store the assembled .part file under its digest (as a hard link, so the
+    upload survives a failure here) and create its Movie. Files this creates
+    are appended to `created_paths`."""
+    movie_in = schemas.UploadSessionCreate.model_validate(session["movie"])
+    # chunks arrive out of order, so the file is hashed once it is whole
+    part_path = _part_path(session["id"])
+    digest = await anyio.to_thread.run_sync(hash_file, part_path)
+    video_rel_path, created = await anyio.to_thread.run_sync(
+        functools.partial(
+            store_content, part_path, "movies", digest, movie_in.filename, link=True
+        )
+    )
+    if created:
+        created_paths.append(os.path.join(settings.MEDIA_DIR, video_rel_path))
+    video_rel_path, created, info = await anyio.to_thread.run_sync(
+        ingest_video, video_rel_path, created
+    )
+    if created:
+        created_paths.append(os.path.join(settings.MEDIA_DIR, video_rel_path))
+
+    details = movie_in.model_dump(
+        include={"title", "description", "genre_id", "language", "duration", "release_date"},
+        exclude_none=True,
+    )
+    return await services.create_movie(
+        db,
+        **{**movie_media_fields(info, movie_in.content_type), **details},
+        file_path=video_rel_path,
+    )
+
+
+@router.delete("/{upload_id}", status_code=status.HTTP_204_NO_CONTENT)
+async def abort_upload(upload_id: str, admin=Depends(get_current_admin_user)):
+    await _load_session(upload_id, admin)
+    await _ensure_not_completing(upload_id)
+    await get_redis().delete(_session_key(upload_id), _chunks_key(upload_id))
+    try:
+        os.remove(_part_path(upload_id))
+    except FileNotFoundError:
+        pass
@@ -1,6 +1,8 @@
-from pydantic import BaseModel, EmailStr
-from typing import Optional
+from pydantic import BaseModel, EmailStr, Field, TypeAdapter, computed_field, create_model
+from typing import Dict, List, Optional
 from datetime import datetime
+from functools import lru_cache
+from app.config import settings
 
 
 class UserCreate(BaseModel):
@@ -22,6 +24,19 @@ class UserOut(BaseModel):
         from_attributes = True
 
 
+class UserStatus(BaseModel):
+    """What authorization needs to know about the current user."""
+
+    id: int
+    email: str
+    is_active: bool
+    is_verified: bool
+    is_admin: bool
+
+    class Config:
+        from_attributes = True
+
+
 class Token(BaseModel):
     access_token: str
     refresh_token: str
@@ -41,9 +56,27 @@ class MovieCreate(BaseModel):
     file_path: str
     poster_path: Optional[str] = None
     release_date: Optional[datetime] = None
+    media_type: Optional[str] = None
+    codecs: Optional[str] = None
+    width: Optional[int] = None
+    height: Optional[int] = None
+
+
+class MoviePosterUrls(BaseModel):
+    # {format: {width: media path}}, e.g. {"webp": {"320": "posters/ab/....webp"}}
+    poster_variants: Optional[Dict[str, Dict[str, str]]] = None
 
+    @computed_field
+    @property
+    def poster_urls(self) -> Dict[str, Dict[str, str]]:
+        """poster_variants as URLs under the media mount, for srcset."""
+        return {
+            fmt: {width: f"{settings.MEDIA_URL}/{path}" for width, path in by_width.items()}
+            for fmt, by_width in (self.poster_variants or {}).items()
+        }
 
-class MovieOut(BaseModel):
+
+class MovieOut(MoviePosterUrls):
     id: int
     title: str
     description: Optional[str]
@@ -54,11 +87,85 @@ class MovieOut(BaseModel):
     view_count: int
     file_path: str
     release_date: Optional[datetime]
+    media_type: Optional[str] = None
+    codecs: Optional[str] = None
+    width: Optional[int] = None
+    height: Optional[int] = None
 
     class Config:
         from_attributes = True
 
 
+class MoviePage(BaseModel):
+    items: List[MovieOut]
+    next_cursor: Optional[str] = None
+
+
+class TrendingMovie(MovieOut):
+    # plays in the window, each decayed by its age (half-life = window)
+    trending_score: float
+
+
+class TrendingPage(BaseModel):
+    window: str
+    items: List[TrendingMovie]
+
+
+class WatchProgressIn(BaseModel):
+    position_seconds: int = Field(ge=0)
+
+
+class WatchProgressOut(BaseModel):
+    movie_id: int
+    position_seconds: int = 0
+    completed: bool = False
+    # None until the first heartbeat
+    updated_at: Optional[datetime] = None
+
+
+class ContinueWatchingItem(MovieOut):
+    position_seconds: int
+    progress_updated_at: datetime
+
+
+class ContinueWatchingPage(BaseModel):
+    items: List[ContinueWatchingItem]
+
+
+class SimilarMovie(MovieOut):
+    # cosine similarity of the co-view vectors; None for genre fallbacks
+    similarity: Optional[float] = None
+
+
+class SimilarPage(BaseModel):
+    movie_id: int
+    # "coview" (precomputed neighbours) or "genre" (cold-start fallback)
+    source: str
+    items: List[SimilarMovie]
+
+
+class UploadSessionCreate(BaseModel):
+    filename: str
+    content_type: str
+    size: int
+    title: str
+    description: Optional[str] = None
+    genre_id: Optional[int] = None
+    language: Optional[str] = None
+    duration: Optional[int] = None
+    release_date: Optional[datetime] = None
+
+
+class UploadSessionOut(BaseModel):
+    id: str
+    size: int
+    chunk_size: int
+    total_chunks: int
+    received_chunks: List[int]
+    missing_chunks: List[int]
+    complete: bool
+
+
 class GenreCreate(BaseModel):
     name: str
 
@@ -69,3 +176,44 @@ class GenreOut(BaseModel):
 
     class Config:
         from_attributes = True
+
+
+class MovieWithGenreOut(MovieOut):
+    genre: Optional[GenreOut] = None
+
+
+# names accepted by the `fields=` sparse fieldset of movie listings
+MOVIE_FIELDS = (*MovieOut.model_fields, *MovieOut.model_computed_fields)
+
+
+@lru_cache(maxsize=128)
+def movie_list_adapter(
+    fields: tuple[str, ...] | None = None, include_genre: bool = False
+) -> TypeAdapter:
+    """
+    TypeAdapter for a list of movies, restricted to `fields` (all of MovieOut
+    when None). Built once per field set: validate ORM rows with
+    `from_attributes=True` and dump straight to JSON-ready data.
+    """
+    if fields is None:
+        model = MovieWithGenreOut if include_genre else MovieOut
+        return TypeAdapter(List[model])
+
+    definitions = {
+        name: (info.annotation, info)
+        for name, info in MovieOut.model_fields.items()
+        if name in fields
+    }
+    base = BaseModel
+    if "poster_urls" in fields:
+        base = MoviePosterUrls
+        if "poster_variants" not in fields:
+            # still loaded to compute poster_urls, just not returned
+            definitions["poster_variants"] = (
+                Optional[Dict[str, Dict[str, str]]],
+                Field(None, exclude=True),
+            )
+    if include_genre:
+        definitions["genre"] = (Optional[GenreOut], None)
+    model = create_model("MovieFieldsOut", __base__=base, **definitions)
+    return TypeAdapter(List[model])
@@ -1,63 +1,501 @@
-from sqlalchemy import select
-from sqlalchemy.orm import Session
-from app import models
-from app.utils.password import hash_password, verify_password
+from datetime import datetime
+from sqlalchemy import select, tuple_, func, case, cast, literal_column, Double
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import load_only, selectinload
+from app import models, schemas
+from app.database import CATALOG_SUBJECT, note_write, replica_read, watch_writes
+from app.utils.cache import (
+    movie_cache,
+    movie_list_cache,
+    user_status_cache,
+    get_catalog_version,
+    get_views_state,
+    bump_catalog_version,
+)
+from app.utils.pagination import encode_cursor, decode_cursor
+from app.utils.progress import (
+    COMPLETED_FRACTION,
+    CONTINUE_WATCHING_MAX,
+    get_progress,
+    recent_progress,
+    record_progress,
+    warm_progress,
+)
+from app.utils.similar import get_neighbours
+from app.utils.trending import top_trending
+from app.utils.password import (
+    hash_password_async,
+    verify_and_update_password_async,
+)
 
 
-def get_user_by_email(db: Session, email: str):
-    return db.execute(
-        select(models.User).where(models.User.email == email)
-    ).scalar_one_or_none()
+async def get_user_by_email(db: AsyncSession, email: str):
+    watch_writes(db, email.lower())
+    result = await db.execute(
+        select(models.User).where(models.User.email == email),
+        bind_arguments=await replica_read(db),
+    )
+    return result.scalar_one_or_none()
 
 
-def create_user(
-    db: Session,
+async def create_user(
+    db: AsyncSession,
     email: str,
     password: str,
     first_name: str = None,
     last_name: str = None,
 ):
-    hashed = hash_password(password)
+    hashed = await hash_password_async(password)
     user = models.User(
         email=email, hashed_password=hashed, first_name=first_name, last_name=last_name
     )
     db.add(user)
-    db.commit()
-    db.refresh(user)
+    await db.commit()
+    await db.refresh(user)
     return user
 
 
-def verify_user_password(user: models.User, password: str):
-    return verify_password(password, user.hashed_password)
+async def verify_user_password(db: AsyncSession, user: models.User, password: str):
+    """Check the password, rehashing it when the Argon2 parameters changed."""
+    valid, new_hash = await verify_and_update_password_async(
+        password, user.hashed_password
+    )
+    if valid and new_hash:
+        user.hashed_password = new_hash
+        db.add(user)
+        await db.commit()
+    return valid
 
 
-def confirm_user(db: Session, user: models.User):
+async def confirm_user(db: AsyncSession, user: models.User):
     user.is_verified = True
     db.add(user)
-    db.commit()
-    db.refresh(user)
+    await db.commit()
+    await db.refresh(user)
+    await refresh_user_status(user)
     return user
 
 
-def get_movie(db: Session, movie_id: int):
-    return db.get(models.Movie, movie_id)
+def user_status_payload(user: models.User) -> dict:
+    return schemas.UserStatus.model_validate(user).model_dump(exclude={"id"})
+
+
+async def get_user_status(
+    db: AsyncSession, user_id: int, claims: dict | None = None
+) -> schemas.UserStatus | None:
+    """
+    Authorization status of a user without a DB hit on the hot path:
+    in-process cache, then Redis, then the token's signed status claims,
+    and only then the users table.
+    """
+
+    async def load():
+        if claims:
+            return claims
+        user = await db.get(models.User, user_id)
+        return user_status_payload(user) if user else None
+
+    payload = await user_status_cache.get_or_load(str(user_id), load)
+    if payload is None:
+        return None
+    try:
+        return schemas.UserStatus(id=user_id, **payload)
+    except ValueError:
+        return None
+
+
+async def refresh_user_status(user: models.User, deleted: bool = False):
+    """
+    Write the user's current status through the cache after it changed.
+    Stored (rather than dropped) so it shadows stale claims in live tokens.
+    """
+    payload = user_status_payload(user)
+    if deleted:
+        payload["is_active"] = False
+    await user_status_cache.set(str(user.id), payload)
+
 
+async def get_movie(db: AsyncSession, movie_id: int):
+    result = await db.execute(
+        select(models.Movie).where(models.Movie.id == movie_id),
+        bind_arguments=await replica_read(db),
+    )
+    return result.scalar_one_or_none()
+
+
+# sort key name -> keyset column; every order is (column DESC, id DESC)
+MOVIE_SORT_COLUMNS = {
+    "created_at": models.Movie.created_at,
+    "view_count": models.Movie.view_count,
+}
+
+
+# output fields computed from another column
+MOVIE_FIELD_COLUMNS = {"poster_urls": "poster_variants"}
 
-def list_movies(db: Session, skip: int = 0, limit: int = 50):
-    return db.execute(select(models.Movie).offset(skip).limit(limit)).scalars().all()
 
+def _movie_load_options(fields, include_genre: bool, sort_column) -> list:
+    """Load only the columns `fields` needs (plus the keyset columns), and
+    the genre in one extra SELECT ... IN query instead of a lazy load each."""
+    options = []
+    if fields is not None:
+        names = {MOVIE_FIELD_COLUMNS.get(name, name) for name in fields}
+        names |= {"id", sort_column.key}
+        options.append(load_only(*(getattr(models.Movie, name) for name in sorted(names))))
+    if include_genre:
+        options.append(selectinload(models.Movie.genre))
+    return options
 
-def create_movie(db: Session, **data):
+
+async def list_movies(
+    db: AsyncSession,
+    limit: int = 50,
+    cursor: str | None = None,
+    sort: str = "created_at",
+    genre_id: int | None = None,
+    language: str | None = None,
+    released_from: datetime | None = None,
+    released_to: datetime | None = None,
+    fields: tuple[str, ...] | None = None,
+    include_genre: bool = False,
+):
+    """
+    Keyset-paginated movie listing, newest (or most viewed) first.
+    `fields` limits the loaded columns to those MovieOut fields;
+    `include_genre` eager-loads Movie.genre.
+    Returns (movies, next_cursor); next_cursor is None on the last page.
+    Raises ValueError for an unknown sort or a malformed cursor.
+    """
+    if sort not in MOVIE_SORT_COLUMNS:
+        raise ValueError(f"Unknown sort: {sort}")
+    sort_column = MOVIE_SORT_COLUMNS[sort]
+
+    stmt = select(models.Movie).options(
+        *_movie_load_options(fields, include_genre, sort_column)
+    )
+    if genre_id is not None:
+        stmt = stmt.where(models.Movie.genre_id == genre_id)
+    if language is not None:
+        stmt = stmt.where(models.Movie.language == language)
+    if released_from is not None:
+        stmt = stmt.where(models.Movie.release_date >= released_from)
+    if released_to is not None:
+        stmt = stmt.where(models.Movie.release_date <= released_to)
+
+    if cursor:
+        position = decode_cursor(cursor)
+        if position.get("sort") != sort:
+            raise ValueError("Cursor does not match sort")
+        try:
+            last_value = position["value"]
+            if sort == "created_at":
+                last_value = datetime.fromisoformat(last_value)
+            else:
+                last_value = int(last_value)
+            last_id = int(position["id"])
+        except (KeyError, TypeError, ValueError) as exc:
+            raise ValueError("Invalid cursor") from exc
+        stmt = stmt.where(tuple_(sort_column, models.Movie.id) < (last_value, last_id))
+
+    stmt = stmt.order_by(sort_column.desc(), models.Movie.id.desc()).limit(limit + 1)
+    result = await db.execute(stmt, bind_arguments=await replica_read(db))
+    movies = result.scalars().all()
+
+    next_cursor = None
+    if len(movies) > limit:
+        movies = movies[:limit]
+        last = movies[-1]
+        value = getattr(last, sort_column.key)
+        next_cursor = encode_cursor(
+            {
+                "sort": sort,
+                "value": value.isoformat() if isinstance(value, datetime) else value,
+                "id": last.id,
+            }
+        )
+    return movies, next_cursor
+
+
+async def create_movie(db: AsyncSession, **data):
     movie = models.Movie(**data)
     db.add(movie)
-    db.commit()
-    db.refresh(movie)
+    await db.commit()
+    await db.refresh(movie)
+    await invalidate_movie(movie.id)
     return movie
 
 
-def increment_view_count(db: Session, movie: models.Movie):
-    movie.view_count = (movie.view_count or 0) + 1
-    db.add(movie)
-    db.commit()
-    db.refresh(movie)
-    return movie
+def _movie_payload(movie: models.Movie) -> dict:
+    return schemas.MovieOut.model_validate(movie).model_dump(mode="json")
+
+
+async def get_movie_cached(
+    db: AsyncSession, movie_id: int, views_stamp: int | None = None
+) -> dict | None:
+    """
+    Serialized MovieOut for `movie_id`, served from the metadata cache.
+    With `views_stamp` the entry is keyed by it and the catalog version, like
+    list pages, so it is never older than the validators it is sent with.
+    """
+    key = str(movie_id)
+    if views_stamp is not None:
+        key = f"v{await get_catalog_version()}:{movie_id}:views{views_stamp}"
+
+    async def load():
+        # a fill must not cache what a lagging replica still has
+        watch_writes(db, CATALOG_SUBJECT)
+        movie = await get_movie(db, movie_id)
+        return _movie_payload(movie) if movie else None
+
+    return await movie_cache.get_or_load(key, load)
+
+
+def serialize_movies(
+    movies, fields: tuple[str, ...] | None = None, include_genre: bool = False
+) -> list[dict]:
+    """JSON-ready movie dicts through the cached list TypeAdapter."""
+    adapter = schemas.movie_list_adapter(fields, include_genre)
+    return adapter.dump_python(
+        adapter.validate_python(movies, from_attributes=True), mode="json"
+    )
+
+
+async def list_movies_cached(db: AsyncSession, **params) -> dict:
+    """Serialized `list_movies` page ({items, next_cursor}) from the cache.
+    Pages are keyed by catalog version, so any movie change drops them all;
+    pages sorted by views also by the views version. Other pages keep the
+    view counts they were cached with until the catalog changes."""
+    version = await get_catalog_version()
+    key = f"v{version}:" + encode_cursor(params)
+    if params.get("sort") == "view_count":
+        key = f"views{(await get_views_state())[0]}:{key}"
+
+    async def load():
+        watch_writes(db, CATALOG_SUBJECT)
+        movies, next_cursor = await list_movies(db, **params)
+        return {
+            "items": serialize_movies(
+                movies, params.get("fields"), params.get("include_genre", False)
+            ),
+            "next_cursor": next_cursor,
+        }
+
+    return await movie_list_cache.get_or_load(key, load)
+
+
+async def _movies_by_id(db: AsyncSession, ids: list[int]) -> dict[int, models.Movie]:
+    """Movies of `ids` in one `id IN (...)` query; deleted ones are absent."""
+    if not ids:
+        return {}
+    stmt = select(models.Movie).where(models.Movie.id.in_(ids))
+    result = await db.execute(stmt, bind_arguments=await replica_read(db))
+    return {movie.id: movie for movie in result.scalars()}
+
+
+async def _ranked_movies(
+    db: AsyncSession, ranking: list[tuple[int, float]], score_field: str
+) -> list[dict]:
+    """
+    Serialized movies of a (movie id, score) ranking, in ranking order with
+    the score as `score_field`. Ids of deleted movies are skipped.
+    """
+    movies = await _movies_by_id(db, [movie_id for movie_id, _ in ranking])
+    ranked = [(movies[movie_id], score) for movie_id, score in ranking if movie_id in movies]
+    items = serialize_movies([movie for movie, _ in ranked])
+    for item, (_, score) in zip(items, ranked):
+        item[score_field] = round(score, 3)
+    return items
+
+
+async def trending_movies(db: AsyncSession, window: str, limit: int = 20) -> list[dict]:
+    """Serialized TrendingMovie dicts, best first; the ranking comes from Redis."""
+    return await _ranked_movies(db, await top_trending(window, limit), "trending_score")
+
+
+async def similar_movies(
+    db: AsyncSession, movie_id: int, limit: int = 10
+) -> tuple[str, list[dict]] | None:
+    """
+    ("coview", SimilarMovie dicts) from the precomputed neighbours of
+    `movie_id`, or ("genre", ...) with the most viewed movies of its genre
+    for titles without any yet. None if the movie does not exist.
+    """
+    movie = await get_movie_cached(db, movie_id)
+    if movie is None:
+        return None
+    neighbours = (await get_neighbours(movie_id))[:limit]
+    if neighbours:
+        return "coview", await _ranked_movies(db, neighbours, "similarity")
+
+    stmt = (
+        select(models.Movie)
+        .where(models.Movie.id != movie_id)
+        .order_by(models.Movie.view_count.desc(), models.Movie.id.desc())
+        .limit(limit)
+    )
+    if movie["genre_id"] is not None:
+        stmt = stmt.where(models.Movie.genre_id == movie["genre_id"])
+    result = await db.execute(stmt, bind_arguments=await replica_read(db))
+    items = serialize_movies(result.scalars().all())
+    for item in items:
+        item["similarity"] = None
+    return "genre", items
+
+
+def _progress_payload(progress: models.WatchProgress) -> dict:
+    return {
+        "movie_id": progress.movie_id,
+        "position_seconds": progress.position_seconds,
+        "completed": progress.completed,
+        "updated_at": progress.updated_at,
+    }
+
+
+async def record_watch_progress(
+    db: AsyncSession, user_id: int, movie_id: int, position: int
+) -> dict | None:
+    """
+    Store a progress heartbeat in Redis; the database catches up on the next
+    flush. Positions past the end are clamped. None if the movie does not
+    exist.
+    """
+    movie = await get_movie_cached(db, movie_id)
+    if movie is None:
+        return None
+    duration = movie["duration"]
+    if duration:
+        position = min(position, duration)
+    completed = bool(duration) and position >= duration * COMPLETED_FRACTION
+    return await record_progress(user_id, movie_id, position, completed)
+
+
+async def get_watch_progress(db: AsyncSession, user_id: int, movie_id: int) -> dict | None:
+    """Where the user left `movie_id`: Redis, else the last flushed row."""
+    progress = await get_progress(user_id, movie_id)
+    if progress is not None:
+        return progress
+    result = await db.execute(
+        select(models.WatchProgress).where(
+            models.WatchProgress.user_id == user_id,
+            models.WatchProgress.movie_id == movie_id,
+        ),
+        bind_arguments=await replica_read(db),
+    )
+    row = result.scalar_one_or_none()
+    return _progress_payload(row) if row else None
+
+
+async def continue_watching(db: AsyncSession, user_id: int, limit: int = 20) -> list[dict]:
+    """
+    Serialized ContinueWatchingItem dicts, last watched first, from the
+    Redis hot tier. When it holds nothing for the user (expired, or never
+    warmed) the unfinished rows of watch_progress are read and loaded back.
+    """
+    entries = await recent_progress(user_id, limit)
+    if not entries:
+        result = await db.execute(
+            select(models.WatchProgress)
+            .where(
+                models.WatchProgress.user_id == user_id,
+                models.WatchProgress.completed.is_(False),
+            )
+            .order_by(models.WatchProgress.updated_at.desc())
+            .limit(CONTINUE_WATCHING_MAX),
+            bind_arguments=await replica_read(db),
+        )
+        rows = [_progress_payload(row) for row in result.scalars()]
+        # entries newer than their row (not flushed yet) win over it
+        if await warm_progress(user_id, rows) < len(rows):
+            entries = await recent_progress(user_id, limit)
+        else:
+            entries = rows[:limit]
+
+    movies = await _movies_by_id(db, [entry["movie_id"] for entry in entries])
+    entries = [entry for entry in entries if entry["movie_id"] in movies]
+    items = serialize_movies([movies[entry["movie_id"]] for entry in entries])
+    for item, entry in zip(items, entries):
+        item["position_seconds"] = entry["position_seconds"]
+        item["progress_updated_at"] = entry["updated_at"].isoformat()
+    return items
+
+
+async def invalidate_movie(movie_id: int):
+    """Drop cached metadata after a movie is created, edited or deleted."""
+    # bump first: a load that began before it is then either deleted below
+    # or refused its write-back by the version check
+    await bump_catalog_version()
+    await movie_cache.invalidate(str(movie_id))
+    await note_write(CATALOG_SUBJECT)
+
+
+def _escape_like(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+
+
+def _search_page(rows, limit: int, mode: str):
+    """Split (movie, rank) rows into a page and the cursor for the next one."""
+    movies = [movie for movie, _ in rows[:limit]]
+    next_cursor = None
+    if len(rows) > limit:
+        last_movie, last_rank = rows[limit - 1]
+        next_cursor = encode_cursor(
+            {"mode": mode, "rank": float(last_rank), "id": last_movie.id}
+        )
+    return movies, next_cursor
+
+
+async def search_movies(
+    db: AsyncSession, q: str, limit: int = 20, cursor: str | None = None
+):
+    """
+    Ranked movie search with keyset paging over (rank, id).
+
+    On Postgres this matches the generated `search_vector` column (GIN index)
+    and falls back to pg_trgm title similarity when the full-text query finds
+    nothing, so typos still return results. Other dialects (SQLite in local
+    runs) use a LIKE scan ranked title-first.
+    Returns (movies, next_cursor); raises ValueError for a malformed cursor.
+    """
+    position = decode_cursor(cursor) if cursor else None
+    if position is not None:
+        try:
+            last = (float(position["rank"]), int(position["id"]))
+            mode = position["mode"]
+        except (KeyError, TypeError, ValueError) as exc:
+            raise ValueError("Invalid cursor") from exc
+    else:
+        last, mode = None, None
+
+    if db.get_bind().dialect.name != "postgresql":
+        pattern = "%" + _escape_like(q) + "%"
+        title_match = models.Movie.title.ilike(pattern, escape="\\")
+        rank = case((title_match, 2.0), else_=1.0)
+        where = title_match | models.Movie.description.ilike(pattern, escape="\\")
+        mode = "like"
+    elif mode in (None, "fts"):
+        query = func.websearch_to_tsquery("simple", q)
+        vector = literal_column("movies.search_vector")
+        # double precision so the cursor round-trips exactly
+        rank = cast(func.ts_rank_cd(vector, query), Double)
+        where = vector.op("@@")(query)
+    elif mode == "trgm":
+        rank = cast(func.similarity(models.Movie.title, q), Double)
+        where = models.Movie.title.op("%")(q)
+    else:
+        raise ValueError("Invalid cursor")
+
+    def page_stmt(rank, where):
+        stmt = select(models.Movie, rank.label("rank")).where(where)
+        if last is not None:
+            stmt = stmt.where(tuple_(rank, models.Movie.id) < last)
+        return stmt.order_by(rank.desc(), models.Movie.id.desc()).limit(limit + 1)
+
+    rows = (await db.execute(page_stmt(rank, where))).all()
+    if not rows and mode is None and last is None:
+        # nothing matched the full-text query: retry as a fuzzy title match
+        mode = "trgm"
+        rank = cast(func.similarity(models.Movie.title, q), Double)
+        rows = (
+            await db.execute(page_stmt(rank, models.Movie.title.op("%")(q)))
+        ).all()
+    return _search_page(rows, limit, mode or "fts")
@@ -1,8 +1,35 @@
+import os
+import random
+import time
+import redis
 from celery import Celery
+from celery.signals import (
+    task_postrun,
+    task_prerun,
+    worker_init,
+    worker_process_shutdown,
+)
+from celery.utils.log import get_task_logger
+from prometheus_client import start_http_server
+from sqlalchemy import insert, update, bindparam
+from sqlalchemy.dialects import postgresql, sqlite
 from app.database import SessionLocal
-from app import services
+from app import models
 from app.config import settings
-from app.tasks.email import send_email
+from app.tasks.email import enqueue_email, flush_outbox, pool as smtp_pool
+from app.utils import metrics
+from app.utils.cache import invalidate_movie_sync, invalidate_view_counts_sync
+from app.utils.images import PosterError, render_poster_variants
+from app.utils.storage import collect_unreferenced_media
+from app.utils.trending import RESCALE_INTERVAL_SECONDS, rescale_trending
+from app.utils.progress import drain_dirty_progress, restore_dirty_progress
+from app.utils.views import (
+    ack_drained,
+    drain_pending_views,
+    drain_watch_events,
+    restore_drained_views,
+    restore_drained_watch_events,
+)
 
 
 celery_app = Celery(
@@ -11,23 +38,283 @@ celery_app = Celery(
     backend=settings.CELERY_RESULT_BACKEND or "redis://localhost:6379/2",
 )
 
+r = redis.Redis.from_url(settings.REDIS_URL, decode_responses=True)
+logger = get_task_logger(__name__)
 
-@celery_app.task
-def send_verification_email_task(to_email: str, code: str, purpose: str = "verify"):
+
+EMAIL_MAX_RETRIES = 6
+EMAIL_RETRY_BACKOFF_MAX = 300
+
+
+def _format_ttl(seconds: int) -> str:
+    minutes, rest = divmod(seconds, 60)
+    if rest or not minutes:
+        return f"{seconds} second{'s' if seconds != 1 else ''}"
+    return f"{minutes} minute{'s' if minutes != 1 else ''}"
+
+
+@celery_app.task(bind=True, max_retries=EMAIL_MAX_RETRIES)
+def send_verification_email_task(self, to_email: str, code: str, purpose: str = "verify"):
+    """
+    Queue the code email on the Redis outbox and drain the outbox over a
+    pooled SMTP connection, so a burst of these tasks is delivered in a few
+    batches. Transient SMTP failures are retried with exponential backoff.
+    """
     subject = (
         f"AuraFlix {'Verification' if purpose == 'verify' else 'Password Reset'} Code"
     )
-    body = f"Your AuraFlix {'verification' if purpose == 'verify' else 'password reset'} code is: {code}\nThis code expires in 10 minutes."
-    send_email(to_email, subject, body)
+    body = (
+        f"Your AuraFlix {'verification' if purpose == 'verify' else 'password reset'} code is: {code}\n"
+        f"This code expires in {_format_ttl(settings.CODE_TTL_SECONDS)}."
+    )
+    if self.request.retries == 0:
+        enqueue_email(r, to_email, subject, body)
+    _, requeued = flush_outbox(r)
+    if requeued:
+        # full jitter keeps a fleet of retrying workers from reconnecting in step
+        countdown = random.uniform(0, min(EMAIL_RETRY_BACKOFF_MAX, 5 * 2**self.request.retries))
+        raise self.retry(countdown=countdown)
     return True
 
 
+@worker_process_shutdown.connect
+def close_smtp_pool(**kwargs):
+    smtp_pool.close()
+    metrics.mark_process_dead(os.getpid())
+
+
+# task start times by task id, for CELERY_TASK_DURATION
+_task_started: dict[str, float] = {}
+
+
+@task_prerun.connect
+def start_task_timer(task_id=None, **kwargs):
+    _task_started[task_id] = time.perf_counter()
+
+
+@task_postrun.connect
+def observe_task_duration(task_id=None, task=None, state=None, **kwargs):
+    start = _task_started.pop(task_id, None)
+    if start is not None and task is not None:
+        metrics.CELERY_TASK_DURATION.labels(task.name, state or "UNKNOWN").observe(
+            time.perf_counter() - start
+        )
+
+
+@worker_init.connect
+def start_metrics_server(**kwargs):
+    if settings.CELERY_METRICS_PORT:
+        start_http_server(settings.CELERY_METRICS_PORT, registry=metrics.registry())
+
+
+@celery_app.task
+def increment_view_count_task():
+    """
+    Flush the views buffered in Redis by `stream_movie` into movies.view_count,
+    one `view_count = view_count + n` UPDATE per movie in a single transaction,
+    then drop those movies from the metadata cache and bump their view
+    stamps so their ETags and the pages sorted by views follow.
+    """
+    flushing_key, counts = drain_pending_views(r)
+    if not counts:
+        return 0
+    movies = models.Movie.__table__
+    stmt = (
+        update(movies)
+        .where(movies.c.id == bindparam("movie_id"))
+        .values(view_count=movies.c.view_count + bindparam("n"))
+    )
+    db = SessionLocal()
+    try:
+        db.execute(
+            stmt, [{"movie_id": movie_id, "n": n} for movie_id, n in counts.items()]
+        )
+        db.commit()
+    except Exception:
+        db.rollback()
+        restore_drained_views(r, flushing_key)
+        raise
+    finally:
+        db.close()
+    ack_drained(r, flushing_key)
+    # view_count is part of the flushed movies' cached payloads and of the
+    # pages sorted by it; the rest of the catalog cache stays valid
+    invalidate_view_counts_sync(r, counts)
+    return sum(counts.values())
+
+
+@celery_app.task
+def flush_watch_events_task():
+    """Append the watch events buffered by `stream_movie` to watch_events."""
+    flushing_key, events = drain_watch_events(r)
+    if not events:
+        return 0
+    db = SessionLocal()
+    try:
+        db.execute(insert(models.WatchEvent), events)
+        db.commit()
+    except Exception:
+        db.rollback()
+        restore_drained_watch_events(r, flushing_key)
+        raise
+    finally:
+        db.close()
+    ack_drained(r, flushing_key)
+    return len(events)
+
+
+def _upsert_watch_progress(db, rows: list[dict]):
+    """INSERT ... ON CONFLICT DO UPDATE, keeping whichever write is newer."""
+    dialect = db.get_bind().dialect.name
+    stmt = (postgresql.insert if dialect == "postgresql" else sqlite.insert)(
+        models.WatchProgress
+    )
+    stmt = stmt.on_conflict_do_update(
+        index_elements=["user_id", "movie_id"],
+        set_={
+            "position_seconds": stmt.excluded.position_seconds,
+            "completed": stmt.excluded.completed,
+            "updated_at": stmt.excluded.updated_at,
+        },
+        where=stmt.excluded.updated_at > models.WatchProgress.updated_at,
+    )
+    db.execute(stmt, rows)
+
+
+@celery_app.task
+def flush_watch_progress_task():
+    """
+    Upsert the latest position of every (user, movie) that sent a progress
+    heartbeat since the last flush, in one executemany statement.
+    """
+    flushing_key, rows = drain_dirty_progress(r)
+    if flushing_key is None:
+        return 0
+    if rows:
+        db = SessionLocal()
+        try:
+            _upsert_watch_progress(db, rows)
+            db.commit()
+        except Exception:
+            db.rollback()
+            restore_dirty_progress(r, flushing_key)
+            raise
+        finally:
+            db.close()
+    ack_drained(r, flushing_key)
+    return len(rows)
+
+
+@celery_app.task
+def rebuild_similar_movies_task():
+    """Recompute the "similar movies" neighbours from the watch events."""
+    # NumPy/SciPy are only needed on the worker, not in the API process
+    from app.tasks.similarity import rebuild_similar_movies
+
+    db = SessionLocal()
+    try:
+        return rebuild_similar_movies(db, r)
+    finally:
+        db.close()
+
+
+@celery_app.task
+def cleanup_expired_uploads_task():
+    """
+    Remove the .part files of resumable uploads whose Redis session expired.
+    A file is only removed once it has also been idle for the session TTL, so
+    an upload being completed right now is never touched.
+    """
+    uploads_dir = os.path.join(settings.MEDIA_DIR, "uploads")
+    if not os.path.isdir(uploads_dir):
+        return 0
+    cutoff = time.time() - settings.UPLOAD_SESSION_TTL_SECONDS
+    removed = 0
+    for entry in os.scandir(uploads_dir):
+        if not entry.name.endswith(".part"):
+            continue
+        upload_id = entry.name[: -len(".part")]
+        try:
+            if entry.stat().st_mtime > cutoff or r.exists(f"upload:{upload_id}"):
+                continue
+            os.remove(entry.path)
+        except FileNotFoundError:
+            continue
+        r.delete(f"upload:{upload_id}:chunks")
+        removed += 1
+    return removed
+
+
+@celery_app.task
+def collect_unreferenced_media_task():
+    """Delete stored media no movie has referenced for the grace period."""
+    db = SessionLocal()
+    try:
+        return collect_unreferenced_media(db)
+    finally:
+        db.close()
+
+
+@celery_app.task
+def rescale_trending_task():
+    """Rebase the trending scores on the current time and trim their tail."""
+    return rescale_trending(r)
+
+
 @celery_app.task
-def increment_view_count_task(movie_id: int):
+def generate_poster_variants_task(movie_id: int):
+    """Render the resized WebP/AVIF renditions of a movie's poster."""
     db = SessionLocal()
     try:
-        movie = services.get_movie(db, movie_id)
-        if movie:
-            services.increment_view_count(db, movie)
+        movie = db.get(models.Movie, movie_id)
+        if movie is None or not movie.poster_path:
+            return None
+        poster_path = movie.poster_path
+        try:
+            variants = render_poster_variants(poster_path)
+        except PosterError:
+            logger.warning("Poster of movie %s is not a readable image", movie_id)
+            return None
+        # skip the write if the poster was replaced while rendering
+        db.execute(
+            update(models.Movie)
+            .where(models.Movie.id == movie_id, models.Movie.poster_path == poster_path)
+            .values(poster_variants=variants)
+        )
+        db.commit()
     finally:
         db.close()
+    invalidate_movie_sync(r, movie_id)
+    return variants
+
+
+celery_app.conf.beat_schedule = {
+    "flush-view-counts": {
+        "task": increment_view_count_task.name,
+        "schedule": settings.VIEW_FLUSH_INTERVAL_SECONDS,
+    },
+    "flush-watch-events": {
+        "task": flush_watch_events_task.name,
+        "schedule": settings.VIEW_FLUSH_INTERVAL_SECONDS,
+    },
+    "flush-watch-progress": {
+        "task": flush_watch_progress_task.name,
+        "schedule": settings.PROGRESS_FLUSH_INTERVAL_SECONDS,
+    },
+    "rebuild-similar-movies": {
+        "task": rebuild_similar_movies_task.name,
+        "schedule": settings.SIMILARITY_REBUILD_SECONDS,
+    },
+    "cleanup-expired-uploads": {
+        "task": cleanup_expired_uploads_task.name,
+        "schedule": 60 * 60,
+    },
+    "collect-unreferenced-media": {
+        "task": collect_unreferenced_media_task.name,
+        "schedule": 60 * 60,
+    },
+    "rescale-trending": {
+        "task": rescale_trending_task.name,
+        "schedule": RESCALE_INTERVAL_SECONDS,
+    },
+}
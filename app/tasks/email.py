@@ -1,16 +1,179 @@
+import json
+import os
 import smtplib
+import threading
+import time
+from contextlib import contextmanager
 from email.message import EmailMessage
+
 from app.config import settings
 
+# messages waiting for delivery; every send task drains it, so a burst of
+# queued tasks goes out in a few batches over one connection
+EMAIL_OUTBOX_KEY = "email:outbox"
+EMAIL_BATCH_SIZE = 50
+# an idle connection is NOOP-checked before reuse once it has sat this long
+HEALTHCHECK_AFTER_SECONDS = 5
 
-def send_email(to: str, subject: str, body: str):
+
+def build_message(to: str, subject: str, body: str) -> EmailMessage:
     msg = EmailMessage()
     msg["From"] = settings.SMTP_FROM
     msg["To"] = to
     msg["Subject"] = subject
     msg.set_content(body)
+    return msg
+
+
+def is_transient(exc: Exception) -> bool:
+    """4xx replies and dropped/refused connections are worth retrying; 5xx are not."""
+    if isinstance(exc, smtplib.SMTPRecipientsRefused):
+        return any(code < 500 for code, _ in exc.recipients.values())
+    if isinstance(exc, smtplib.SMTPResponseException):
+        return 400 <= exc.smtp_code < 500
+    return isinstance(exc, OSError)
+
+
+def _close(smtp: smtplib.SMTP):
+    try:
+        smtp.quit()
+    except (smtplib.SMTPException, OSError):
+        smtp.close()
+
+
+class SMTPPool:
+    """
+    Authenticated SMTP connections kept open between sends. One pool per
+    worker process: connections inherited across a fork are dropped.
+    """
+
+    def __init__(self, maxsize: int, idle_timeout: float):
+        self.maxsize = maxsize
+        self.idle_timeout = idle_timeout
+        self._idle: list[tuple[smtplib.SMTP, float]] = []
+        self._lock = threading.Lock()
+        self._pid = os.getpid()
+
+    def _connect(self) -> smtplib.SMTP:
+        smtp = smtplib.SMTP(
+            settings.SMTP_HOST, settings.SMTP_PORT, timeout=settings.SMTP_TIMEOUT_SECONDS
+        )
+        try:
+            if settings.SMTP_STARTTLS:
+                smtp.starttls()
+            if settings.SMTP_USER:
+                smtp.login(settings.SMTP_USER, settings.SMTP_PASSWORD)
+        except BaseException:
+            smtp.close()
+            raise
+        return smtp
+
+    def _take_idle(self) -> tuple[smtplib.SMTP, float] | None:
+        with self._lock:
+            if self._pid != os.getpid():
+                # the parent's sockets: never QUIT them from the child
+                self._idle.clear()
+                self._pid = os.getpid()
+            return self._idle.pop() if self._idle else None
+
+    def acquire(self) -> smtplib.SMTP:
+        while (entry := self._take_idle()) is not None:
+            smtp, idle_since = entry
+            idle = time.monotonic() - idle_since
+            if idle > self.idle_timeout:
+                _close(smtp)
+                continue
+            if idle < HEALTHCHECK_AFTER_SECONDS:
+                return smtp
+            try:
+                if smtp.noop()[0] == 250:
+                    return smtp
+            except (smtplib.SMTPException, OSError):
+                pass
+            smtp.close()
+        return self._connect()
+
+    def release(self, smtp: smtplib.SMTP, reusable: bool = True):
+        with self._lock:
+            if reusable and len(self._idle) < self.maxsize and self._pid == os.getpid():
+                self._idle.append((smtp, time.monotonic()))
+                return
+        _close(smtp)
+
+    @contextmanager
+    def connection(self):
+        smtp = self.acquire()
+        try:
+            yield smtp
+        except BaseException:
+            self.release(smtp, reusable=False)
+            raise
+        self.release(smtp)
+
+    def close(self):
+        with self._lock:
+            idle, self._idle = self._idle, []
+        for smtp, _ in idle:
+            _close(smtp)
+
+
+pool = SMTPPool(settings.SMTP_POOL_SIZE, settings.SMTP_POOL_IDLE_SECONDS)
+
+
+def send_messages(messages: list[EmailMessage]) -> list[EmailMessage]:
+    """
+    Send `messages` over one pooled connection, reconnecting once if it
+    drops mid-batch. Returns the messages that failed transiently; permanent
+    rejections are dropped. Permanent connection errors (e.g. a refused
+    login) are raised.
+    """
+    pending = list(messages)
+    failed = []
+    for _ in range(2):
+        try:
+            with pool.connection() as smtp:
+                while pending:
+                    try:
+                        smtp.send_message(pending[0])
+                    except (smtplib.SMTPRecipientsRefused, smtplib.SMTPResponseException) as exc:
+                        # rejected after the transaction was reset; the connection is fine
+                        if is_transient(exc):
+                            failed.append(pending[0])
+                    pending.pop(0)
+            break
+        except OSError as exc:
+            if not is_transient(exc):
+                raise
+    return failed + pending
+
+
+def send_email(to: str, subject: str, body: str):
+    if send_messages([build_message(to, subject, body)]):
+        raise smtplib.SMTPServerDisconnected(f"Could not deliver email to {to}")
+
+
+def enqueue_email(client, to: str, subject: str, body: str):
+    client.rpush(EMAIL_OUTBOX_KEY, json.dumps({"to": to, "subject": subject, "body": body}))
+
 
-    with smtplib.SMTP(settings.SMTP_HOST, settings.SMTP_PORT) as smtp:
-        smtp.starttls()
-        smtp.login(settings.SMTP_USER, settings.SMTP_PASSWORD)
-        smtp.send_message(msg)
+def flush_outbox(client, batch_size: int = EMAIL_BATCH_SIZE) -> tuple[int, int]:
+    """
+    Deliver queued messages `batch_size` at a time until the outbox is empty.
+    Transient failures go back on the outbox and stop the flush.
+    Returns (handed off, requeued); permanently rejected messages count as
+    handed off.
+    """
+    sent = 0
+    while items := client.lpop(EMAIL_OUTBOX_KEY, batch_size):
+        messages = [build_message(**json.loads(item)) for item in items]
+        try:
+            failed = {id(msg) for msg in send_messages(messages)}
+        except BaseException:
+            client.rpush(EMAIL_OUTBOX_KEY, *items)
+            raise
+        sent += len(messages) - len(failed)
+        if failed:
+            requeue = [item for item, msg in zip(items, messages) if id(msg) in failed]
+            client.rpush(EMAIL_OUTBOX_KEY, *requeue)
+            return sent, len(requeue)
+    return sent, 0
@@ -0,0 +1,138 @@
+from datetime import datetime, timedelta, timezone
+
+import numpy as np
+import redis
+from scipy import sparse
+from sqlalchemy import delete, select
+from sqlalchemy.orm import Session
+
+from app import models
+from app.config import settings
+from app.utils.similar import SIMILAR_MOVIES_KEY, encode_neighbours
+
+# Item-item "similar movies" from the watch event log. Every user who played
+# a movie in the last SIMILARITY_HISTORY_DAYS is a binary vector over movies
+# (X, users x movies, sparse); the co-view counts of two movies are X^T X,
+# and their cosine similarity divides that by the square roots of both view
+# counts. X^T X is never built whole: it is computed a block of rows at a
+# time, sized so one block fits SIMILARITY_BLOCK_MEMORY_MB even if it were
+# dense, and each row is cut to its top SIMILAR_MOVIES_K right away. Memory
+# is the sparse X (distinct user/movie pairs) plus one block.
+
+# rows fetched from the database at a time
+LOAD_CHUNK_ROWS = 100_000
+# pairs co-viewed by fewer users are noise, not similarity
+MIN_COVIEWS = 2
+# bytes per stored entry of a sparse block (int32 index + float32 value),
+# doubled for the intermediates of the product
+BYTES_PER_ENTRY = 16
+# hash fields written per pipeline round trip
+STORE_BATCH = 1000
+
+
+def load_pairs(db: Session, since: datetime) -> tuple[np.ndarray, np.ndarray]:
+    """Distinct (user id, movie id) pairs watched since `since`, streamed."""
+    stmt = (
+        select(models.WatchEvent.user_id, models.WatchEvent.movie_id)
+        .where(models.WatchEvent.watched_at >= since)
+        .distinct()
+        .execution_options(yield_per=LOAD_CHUNK_ROWS)
+    )
+    chunks = []
+    for rows in db.execute(stmt).partitions():
+        flat = np.fromiter(
+            (value for row in rows for value in row), dtype=np.int64, count=2 * len(rows)
+        )
+        chunks.append(flat.reshape(-1, 2))
+    if not chunks:
+        return np.empty(0, np.int64), np.empty(0, np.int64)
+    pairs = np.concatenate(chunks)
+    return pairs[:, 0], pairs[:, 1]
+
+
+def cosine_neighbours(
+    user_index: np.ndarray,
+    movie_index: np.ndarray,
+    n_users: int,
+    n_movies: int,
+    k: int,
+    block_rows: int,
+):
+    """
+    Yield (movie index, neighbour indexes, similarities) for every movie with
+    neighbours, best first, at most `k` of them.
+    """
+    views = sparse.csr_matrix(
+        (np.ones(len(user_index), dtype=np.float32), (user_index, movie_index)),
+        shape=(n_users, n_movies),
+    )
+    by_movie = views.T.tocsr()
+    norms = np.sqrt(np.diff(by_movie.indptr)).astype(np.float32)
+
+    for start in range(0, n_movies, block_rows):
+        coviews = by_movie[start : start + block_rows] @ views
+        for row in range(coviews.shape[0]):
+            movie = start + row
+            lo, hi = coviews.indptr[row], coviews.indptr[row + 1]
+            neighbours, counts = coviews.indices[lo:hi], coviews.data[lo:hi]
+            keep = (neighbours != movie) & (counts >= MIN_COVIEWS)
+            neighbours, counts = neighbours[keep], counts[keep]
+            if not len(neighbours):
+                continue
+            scores = counts / (norms[movie] * norms[neighbours])
+            if len(scores) > k:
+                top = np.argpartition(scores, -k)[-k:]
+                neighbours, scores = neighbours[top], scores[top]
+            order = np.argsort(-scores, kind="stable")
+            yield movie, neighbours[order], scores[order]
+
+
+def store_neighbours(client: redis.Redis, rows) -> int:
+    """Write (movie id, neighbour ids, scores) rows over the previous run's."""
+    building_key = f"{SIMILAR_MOVIES_KEY}:building"
+    client.delete(building_key)
+    pipe = client.pipeline(transaction=False)
+    stored = 0
+    for movie_id, neighbour_ids, scores in rows:
+        pipe.hset(building_key, str(movie_id), encode_neighbours(neighbour_ids, scores))
+        stored += 1
+        if stored % STORE_BATCH == 0:
+            pipe.execute()
+    pipe.execute()
+    if stored:
+        client.rename(building_key, SIMILAR_MOVIES_KEY)
+    else:
+        client.delete(SIMILAR_MOVIES_KEY)
+    return stored
+
+
+def rebuild_similar_movies(db: Session, client: redis.Redis) -> int:
+    """
+    Drop watch events older than SIMILARITY_HISTORY_DAYS, recompute every
+    movie's neighbours from the rest and publish them. Returns the number
+    of movies that have neighbours.
+    """
+    since = datetime.now(timezone.utc) - timedelta(days=settings.SIMILARITY_HISTORY_DAYS)
+    db.execute(delete(models.WatchEvent).where(models.WatchEvent.watched_at < since))
+    db.commit()
+
+    user_ids, movie_ids = load_pairs(db, since)
+    _, user_index = np.unique(user_ids, return_inverse=True)
+    del user_ids
+    movies, movie_index = np.unique(movie_ids, return_inverse=True)
+    del movie_ids
+
+    budget = settings.SIMILARITY_BLOCK_MEMORY_MB * 1024 * 1024
+    block_rows = max(1, budget // (max(len(movies), 1) * BYTES_PER_ENTRY))
+    neighbours = cosine_neighbours(
+        user_index,
+        movie_index,
+        n_users=int(user_index.max()) + 1 if len(user_index) else 0,
+        n_movies=len(movies),
+        k=settings.SIMILAR_MOVIES_K,
+        block_rows=block_rows,
+    )
+    return store_neighbours(
+        client,
+        ((movies[movie], movies[indexes], scores) for movie, indexes, scores in neighbours),
+    )
@@ -0,0 +1,324 @@
+import asyncio
+import time
+import uuid
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable
+
+import orjson
+
+from app.config import settings
+from app.utils.redis_pool import get_redis, register_script
+
+_MISSING = object()
+# how long a loader may hold the shared Redis lock, and how long other
+# processes wait for its result before loading themselves
+LOCK_TTL_MS = 5000
+LOCK_WAIT_SECONDS = 1.0
+LOCK_POLL_SECONDS = 0.05
+
+CATALOG_VERSION_KEY = "cache:catalog:version"
+# unix time of the last bump, for Last-Modified on catalog responses
+CATALOG_UPDATED_KEY = "cache:catalog:updated_at"
+# View counts change every flush, so they are versioned apart from the
+# catalog: a counter bumped by each flush (keys the pages sorted by views),
+# its time, and a per-movie counter hash (keys that movie's validators).
+VIEWS_VERSION_KEY = "cache:catalog:views:version"
+VIEWS_UPDATED_KEY = "cache:catalog:views:updated_at"
+VIEWS_STAMPS_KEY = "cache:catalog:views:stamps"
+
+# KEYS: value, lock[, version]; ARGV: lock token, payload (empty: store
+# nothing), ttl, version read before the load. The value is stored only if
+# the version has not moved since and no value was written meanwhile (a
+# write-through `set` or version bump may have made the load stale), and the
+# lock is released only if this loader still holds it (it may have expired
+# and been taken by another). Returns 1 if stored.
+_FILL_LUA = """
+local stored = 0
+if ARGV[2] ~= '' and (#KEYS < 3 or (redis.call('GET', KEYS[3]) or '') == ARGV[4]) then
+    if redis.call('SET', KEYS[1], ARGV[2], 'EX', ARGV[3], 'NX') then
+        stored = 1
+    end
+end
+if redis.call('GET', KEYS[2]) == ARGV[1] then
+    redis.call('DEL', KEYS[2])
+end
+return stored
+"""
+_fill = register_script(_FILL_LUA)
+
+
+class LocalTTLCache:
+    """In-process LRU cache whose entries also expire after `ttl` seconds."""
+
+    def __init__(self, maxsize: int, ttl: float):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data: OrderedDict[str, tuple[float, Any]] = OrderedDict()
+
+    def get(self, key: str):
+        item = self._data.get(key)
+        if item is None:
+            return _MISSING
+        expires_at, value = item
+        if expires_at < time.monotonic():
+            del self._data[key]
+            return _MISSING
+        self._data.move_to_end(key)
+        return value
+
+    def set(self, key: str, value: Any):
+        self._data[key] = (time.monotonic() + self.ttl, value)
+        self._data.move_to_end(key)
+        while len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+
+    def delete(self, key: str):
+        self._data.pop(key, None)
+
+    def clear(self):
+        self._data.clear()
+
+
+class CacheStats:
+    def __init__(self):
+        self.local_hits = 0
+        self.redis_hits = 0
+        self.misses = 0
+
+    def as_dict(self) -> dict:
+        total = self.local_hits + self.redis_hits + self.misses
+        return {
+            "local_hits": self.local_hits,
+            "redis_hits": self.redis_hits,
+            "misses": self.misses,
+            "hit_rate": (self.local_hits + self.redis_hits) / total if total else 0.0,
+        }
+
+
+class TwoTierCache:
+    """
+    Read-through cache: in-process LRU/TTL tier in front of a shared Redis tier
+    holding JSON payloads.
+
+    Stampedes are avoided on two levels: concurrent misses for a key in one
+    process share a single load, and across processes only the holder of a
+    short Redis lock runs the loader while the others wait for its result.
+
+    A load never replaces a value written by `set` while it ran, and with a
+    `version_key` it is cached only if that counter is unchanged once it
+    finishes, so a load racing an invalidation cannot put the stale value
+    back either.
+    """
+
+    def __init__(
+        self,
+        namespace: str,
+        local_maxsize: int,
+        local_ttl: float,
+        ttl: int,
+        version_key: str | None = None,
+    ):
+        self.namespace = namespace
+        self.ttl = ttl
+        self.version_key = version_key
+        self.local = LocalTTLCache(local_maxsize, local_ttl)
+        self.stats = CacheStats()
+        self._inflight: dict[str, asyncio.Task] = {}
+
+    def _redis_key(self, key: str) -> str:
+        return f"cache:{self.namespace}:{key}"
+
+    async def get_or_load(self, key: str, loader: Callable[[], Awaitable[Any]]):
+        """Return the cached value for `key`, calling `loader` on a miss.
+        None results are not cached."""
+        value = self.local.get(key)
+        if value is not _MISSING:
+            self.stats.local_hits += 1
+            return value
+        task = self._inflight.get(key)
+        if task is None:
+            task = asyncio.ensure_future(self._load(key, loader))
+            self._inflight[key] = task
+            task.add_done_callback(lambda _: self._inflight.pop(key, None))
+        else:
+            self.stats.local_hits += 1
+        return await asyncio.shield(task)
+
+    async def _load(self, key: str, loader: Callable[[], Awaitable[Any]]):
+        redis_key = self._redis_key(key)
+        version = None
+        if self.version_key:
+            # read with the value, so before any load starts
+            raw, version = await get_redis().mget(redis_key, self.version_key)
+        else:
+            raw = await get_redis().get(redis_key)
+        if raw is not None:
+            self.stats.redis_hits += 1
+            value = orjson.loads(raw)
+            self.local.set(key, value)
+            return value
+
+        lock_key = f"{redis_key}:lock"
+        keys = [redis_key, lock_key] + ([self.version_key] if self.version_key else [])
+        token = uuid.uuid4().hex
+        if await get_redis().set(lock_key, token, nx=True, px=LOCK_TTL_MS):
+            payload = b""
+            try:
+                value = await loader()
+                if value is not None:
+                    payload = orjson.dumps(value)
+            finally:
+                stored = await _fill(
+                    keys=keys,
+                    args=[token, payload, self.ttl, version or ""],
+                    client=get_redis(),
+                )
+        else:
+            value = await self._wait_for_peer(redis_key)
+            if value is not _MISSING:
+                self.stats.redis_hits += 1
+                self.local.set(key, value)
+                return value
+            value = await loader()
+            stored = self.local.get(key) is _MISSING and (
+                not self.version_key or version == await get_redis().get(self.version_key)
+            )
+
+        self.stats.misses += 1
+        if value is not None and stored:
+            self.local.set(key, value)
+        return value
+
+    async def _wait_for_peer(self, redis_key: str):
+        deadline = time.monotonic() + LOCK_WAIT_SECONDS
+        while time.monotonic() < deadline:
+            await asyncio.sleep(LOCK_POLL_SECONDS)
+            raw = await get_redis().get(redis_key)
+            if raw is not None:
+                return orjson.loads(raw)
+        return _MISSING
+
+    async def set(self, key: str, value: Any):
+        """Write-through: replace the value in both tiers."""
+        self.local.set(key, value)
+        await get_redis().set(self._redis_key(key), orjson.dumps(value), ex=self.ttl)
+
+    async def invalidate(self, key: str):
+        self.local.delete(key)
+        await get_redis().delete(self._redis_key(key))
+
+
+# every movie write bumps the catalog version
+movie_cache = TwoTierCache(
+    "movie",
+    local_maxsize=settings.CACHE_LOCAL_MAXSIZE,
+    local_ttl=settings.CACHE_LOCAL_TTL_SECONDS,
+    ttl=settings.CACHE_TTL_SECONDS,
+    version_key=CATALOG_VERSION_KEY,
+)
+movie_list_cache = TwoTierCache(
+    "movies",
+    local_maxsize=settings.CACHE_LOCAL_MAXSIZE,
+    local_ttl=settings.CACHE_LOCAL_TTL_SECONDS,
+    ttl=settings.CACHE_TTL_SECONDS,
+    version_key=CATALOG_VERSION_KEY,
+)
+
+# Redis entries must outlive every access token issued before a status
+# change, because on a Redis miss the status claims inside the token are used.
+# Status changes are written through with `set`, which a fill that read the
+# old claims or row never overwrites.
+user_status_cache = TwoTierCache(
+    "user_status",
+    local_maxsize=settings.CACHE_LOCAL_MAXSIZE,
+    local_ttl=settings.USER_STATUS_LOCAL_TTL_SECONDS,
+    ttl=settings.ACCESS_TOKEN_EXPIRE_MINUTES * 60,
+)
+
+_catalog_state = LocalTTLCache(maxsize=2, ttl=settings.CACHE_LOCAL_TTL_SECONDS)
+
+
+async def _versioned_state(version_key: str, updated_key: str) -> tuple[int, float | None]:
+    state = _catalog_state.get(version_key)
+    if state is _MISSING:
+        version, updated_at = await get_redis().mget(version_key, updated_key)
+        state = (int(version or 0), float(updated_at) if updated_at else None)
+        _catalog_state.set(version_key, state)
+    return state
+
+
+async def get_catalog_state() -> tuple[int, float | None]:
+    """
+    (version, last change time) of the movie catalog. List pages are cached
+    under the version, so bumping it invalidates every cached page at once
+    without scanning keys; both values also serve as HTTP validators.
+    """
+    return await _versioned_state(CATALOG_VERSION_KEY, CATALOG_UPDATED_KEY)
+
+
+async def get_views_state() -> tuple[int, float | None]:
+    """(version, last flush time) of view counts, like `get_catalog_state`."""
+    return await _versioned_state(VIEWS_VERSION_KEY, VIEWS_UPDATED_KEY)
+
+
+async def get_views_stamp(movie_id: int) -> int:
+    """Counter bumped each time a flush changes `movie_id`'s view count."""
+    return int(await get_redis().hget(VIEWS_STAMPS_KEY, str(movie_id)) or 0)
+
+
+async def get_catalog_version() -> int:
+    return (await get_catalog_state())[0]
+
+
+async def bump_catalog_version() -> int:
+    now = time.time()
+    pipe = get_redis().pipeline(transaction=True)
+    pipe.incr(CATALOG_VERSION_KEY)
+    pipe.set(CATALOG_UPDATED_KEY, now)
+    version, _ = await pipe.execute()
+    _catalog_state.set(CATALOG_VERSION_KEY, (version, now))
+    movie_list_cache.local.clear()
+    return version
+
+
+def invalidate_movies_sync(client, movie_ids) -> int:
+    """`services.invalidate_movie` for any number of movies, for sync callers
+    (Celery, scripts) with a sync Redis client; other workers' local tiers
+    catch up within their TTL. Returns the new catalog version."""
+    pipe = client.pipeline(transaction=True)
+    keys = [movie_cache._redis_key(str(movie_id)) for movie_id in movie_ids]
+    if keys:
+        pipe.delete(*keys)
+    pipe.incr(CATALOG_VERSION_KEY)
+    pipe.set(CATALOG_UPDATED_KEY, time.time())
+    return pipe.execute()[-2]
+
+
+def invalidate_movie_sync(client, movie_id: int):
+    invalidate_movies_sync(client, [movie_id])
+
+
+def invalidate_view_counts_sync(client, movie_ids) -> int:
+    """
+    After a view count flush: drop the flushed movies' cached metadata and
+    bump their stamps and the views version, leaving the catalog version
+    (every other cached page and validator) alone. Returns the new views
+    version.
+    """
+    pipe = client.pipeline(transaction=True)
+    keys = [movie_cache._redis_key(str(movie_id)) for movie_id in movie_ids]
+    if keys:
+        pipe.delete(*keys)
+    for movie_id in movie_ids:
+        pipe.hincrby(VIEWS_STAMPS_KEY, str(movie_id), 1)
+    pipe.incr(VIEWS_VERSION_KEY)
+    pipe.set(VIEWS_UPDATED_KEY, time.time())
+    return pipe.execute()[-2]
+
+
+def cache_stats() -> dict:
+    return {
+        "movie": movie_cache.stats.as_dict(),
+        "movie_list": movie_list_cache.stats.as_dict(),
+        "user_status": user_status_cache.stats.as_dict(),
+    }
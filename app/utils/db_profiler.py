@@ -0,0 +1,138 @@
+import logging
+import re
+import time
+from collections import Counter
+from contextvars import ContextVar
+from dataclasses import dataclass, field
+
+from sqlalchemy import event
+from starlette.datastructures import Headers, MutableHeaders
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+# Opt-in (DB_PROFILING) per-request query profiling. Cursor events on the
+# engines time every statement into the stats of the request being served,
+# found through a context variable: it follows the request into the async
+# engine's greenlets and into the worker threads of the sync (admin) engine.
+# Statements executed outside a request (Celery, scripts) are only checked
+# against the slow query threshold.
+
+logger = logging.getLogger(__name__)
+
+# send with any value to EXPLAIN the slow SELECTs of this request
+EXPLAIN_HEADER = "x-db-explain"
+# bind parameter lists of any length, e.g. IN (?, ?, ?) or IN ($1, $2)
+_PARAM = r"(?:\?|\$\d+|%\(\w+\)s|%s|:\w+)"
+_PARAM_LIST_RE = re.compile(rf"\(\s*{_PARAM}(?:\s*,\s*{_PARAM})*\s*\)")
+_WHITESPACE_RE = re.compile(r"\s+")
+# a shape shown in logs is cut to this many characters
+SHAPE_LOG_CHARS = 300
+
+
+@dataclass
+class QueryStats:
+    count: int = 0
+    seconds: float = 0.0
+    explain: bool = False
+    shapes: Counter = field(default_factory=Counter)
+
+    def repeated(self, threshold: int) -> list[tuple[str, int]]:
+        """Statement shapes run at least `threshold` times: likely N+1 loads."""
+        return [(shape, n) for shape, n in self.shapes.most_common() if n >= threshold]
+
+
+_current: ContextVar[QueryStats | None] = ContextVar("db_query_stats", default=None)
+
+
+def statement_shape(statement: str) -> str:
+    """The statement with whitespace and bound parameter lists normalised."""
+    return _PARAM_LIST_RE.sub("(?)", _WHITESPACE_RE.sub(" ", statement).strip())
+
+
+def _explain(conn, statement: str, parameters) -> str | None:
+    prefix = "EXPLAIN QUERY PLAN " if conn.dialect.name == "sqlite" else "EXPLAIN "
+    cursor = conn.connection.cursor()
+    try:
+        cursor.execute(prefix + statement, parameters)
+        return "\n".join(" ".join(str(col) for col in row) for row in cursor.fetchall())
+    except Exception:  # the plan is a debugging aid; never fail the query for it
+        logger.debug("EXPLAIN failed", exc_info=True)
+        return None
+    finally:
+        cursor.close()
+
+
+def install(engine, slow_query_ms: float):
+    """
+    Profile every statement `engine` runs (a sync Engine; pass
+    `async_engine.sync_engine` for an AsyncEngine).
+    """
+    slow_seconds = slow_query_ms / 1000
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault("query_start", []).append(time.perf_counter())
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        elapsed = time.perf_counter() - conn.info["query_start"].pop()
+        stats = _current.get()
+        if stats is not None:
+            stats.count += 1
+            stats.seconds += elapsed
+            stats.shapes[statement_shape(statement)] += 1
+        if elapsed < slow_seconds:
+            return
+        plan = None
+        if stats is not None and stats.explain and not executemany:
+            if statement.lstrip()[:6].upper() == "SELECT":
+                plan = _explain(conn, statement, parameters)
+        logger.warning(
+            "Slow query (%.1f ms): %s%s",
+            elapsed * 1000,
+            statement_shape(statement)[:SHAPE_LOG_CHARS],
+            f"\n{plan}" if plan else "",
+        )
+
+
+class DBProfilerMiddleware:
+    """
+    Counts the statements each request runs and their total time, returned
+    as `X-DB-Queries` and a `Server-Timing: db` entry. Shapes repeated
+    `n_plus_one_threshold` times are logged as probable N+1 loads. Headers
+    cover the statements run before the response starts.
+    """
+
+    def __init__(self, app: ASGIApp, n_plus_one_threshold: int = 5):
+        self.app = app
+        self.n_plus_one_threshold = n_plus_one_threshold
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        stats = QueryStats(explain=EXPLAIN_HEADER in Headers(scope=scope))
+        token = _current.set(stats)
+
+        async def send_wrapper(message: Message) -> None:
+            if message["type"] == "http.response.start":
+                headers = MutableHeaders(scope=message)
+                headers["x-db-queries"] = str(stats.count)
+                headers.append(
+                    "server-timing",
+                    f'db;dur={stats.seconds * 1000:.1f};desc="{stats.count} queries"',
+                )
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            _current.reset(token)
+            for shape, n in stats.repeated(self.n_plus_one_threshold):
+                logger.warning(
+                    "Possible N+1: %d x %s in %s %s",
+                    n,
+                    shape[:SHAPE_LOG_CHARS],
+                    scope["method"],
+                    scope["path"],
+                )
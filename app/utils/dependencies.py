@@ -1,14 +1,15 @@
-from app.database import SessionLocal
+from app.database import SessionLocal, AsyncSessionLocal, watch_writes
 from fastapi import Depends
-from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
 from typing import Annotated
 from fastapi import HTTPException, status
 from fastapi.security import OAuth2PasswordBearer
-from app import models
+from app import schemas, services
 from .password import decode_token
 
 
 def get_db():
+    """Sync session, for code running outside the event loop (admin panel)."""
     db = SessionLocal()
     try:
         yield db
@@ -16,7 +17,12 @@ def get_db():
         db.close()
 
 
-db_dependency = Annotated[Session, Depends(get_db)]
+async def get_async_db():
+    async with AsyncSessionLocal() as db:
+        yield db
+
+
+db_dependency = Annotated[AsyncSession, Depends(get_async_db)]
 
 
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="/api/v1/auth/login")
@@ -30,22 +36,28 @@ def _raise_401():
     )
 
 
-def get_current_user(
-    token: str = Depends(oauth2_scheme), db: Session = Depends(get_db)
-) -> models.User:
+async def get_current_user(
+    token: str = Depends(oauth2_scheme), db: AsyncSession = Depends(get_async_db)
+) -> schemas.UserStatus:
     payload = decode_token(token)
     if not payload:
         _raise_401()
     user_id = payload.get("sub")
     if not user_id:
         _raise_401()
-    user = db.get(models.User, int(user_id))
+    # served from the user status cache; the DB is only hit on a cold cache
+    # for tokens without status claims
+    user = await services.get_user_status(db, int(user_id), claims=payload.get("st"))
     if not user:
         _raise_401()
+    # replica reads of this request see the user's own recent writes
+    watch_writes(db, user.email.lower())
     return user
 
 
-def get_current_active_user(current_user: models.User = Depends(get_current_user)):
+async def get_current_active_user(
+    current_user: schemas.UserStatus = Depends(get_current_user),
+):
     if not current_user.is_active:
         raise HTTPException(status_code=400, detail="Inactive user")
     if not current_user.is_verified:
@@ -53,8 +65,8 @@ def get_current_active_user(current_user: models.User = Depends(get_current_user
     return current_user
 
 
-def get_current_admin_user(
-    current_user: models.User = Depends(get_current_active_user),
+async def get_current_admin_user(
+    current_user: schemas.UserStatus = Depends(get_current_active_user),
 ):
     if not current_user.is_admin:
         raise HTTPException(status_code=403, detail="Requires admin privileges")
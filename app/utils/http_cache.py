@@ -0,0 +1,54 @@
+from email.utils import formatdate, parsedate_to_datetime
+
+from starlette.datastructures import Headers
+from starlette.responses import Response
+
+# cached responses must be revalidated; catalog responses are per-user (auth)
+REVALIDATE = "private, no-cache"
+# content-addressed media never changes under its name
+IMMUTABLE = "max-age=31536000, immutable"
+
+
+def _opaque(tag: str) -> str:
+    tag = tag.strip()
+    return tag[2:] if tag.startswith("W/") else tag
+
+
+def etag_matches(if_none_match: str, etag: str) -> bool:
+    """Weak comparison of an If-None-Match list against `etag` (RFC 9110 13.1.2)."""
+    if if_none_match.strip() == "*":
+        return True
+    return _opaque(etag) in {_opaque(tag) for tag in if_none_match.split(",")}
+
+
+def is_not_modified(
+    request_headers: Headers, etag: str | None, last_modified: float | None
+) -> bool:
+    """
+    Whether a GET/HEAD may be answered with 304. If-None-Match takes
+    precedence; If-Modified-Since is only consulted without it.
+    """
+    if_none_match = request_headers.get("if-none-match")
+    if if_none_match is not None:
+        return etag is not None and etag_matches(if_none_match, etag)
+    if_modified_since = request_headers.get("if-modified-since")
+    if if_modified_since and last_modified is not None:
+        try:
+            since = parsedate_to_datetime(if_modified_since).timestamp()
+        except (TypeError, ValueError):
+            return False
+        return int(last_modified) <= since
+    return False
+
+
+def validator_headers(
+    etag: str, last_modified: float | None = None, cache_control: str = REVALIDATE
+) -> dict[str, str]:
+    headers = {"etag": etag, "cache-control": cache_control}
+    if last_modified is not None:
+        headers["last-modified"] = formatdate(last_modified, usegmt=True)
+    return headers
+
+
+def not_modified(headers: dict[str, str]) -> Response:
+    return Response(status_code=304, headers=headers)
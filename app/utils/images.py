@@ -0,0 +1,73 @@
+import hashlib
+import io
+import os
+import uuid
+
+from PIL import Image, ImageOps, features
+
+from app.config import settings
+from app.utils.storage import content_rel_path, reuse_content
+
+# encoder settings are part of the output bytes, and so of the variant names
+WEBP_OPTIONS = {"quality": 80, "method": 6}
+AVIF_OPTIONS = {"quality": 60, "speed": 6}
+# refuse decompression bombs well below Pillow's own warning threshold
+MAX_POSTER_PIXELS = 40_000_000
+
+
+class PosterError(ValueError):
+    pass
+
+
+def variant_formats() -> dict[str, dict]:
+    formats = {"webp": WEBP_OPTIONS}
+    if settings.POSTER_AVIF and features.check("avif"):
+        formats["avif"] = AVIF_OPTIONS
+    return formats
+
+
+def _encode(image: Image.Image, fmt: str, options: dict) -> bytes:
+    buffer = io.BytesIO()
+    image.save(buffer, format=fmt.upper(), **options)
+    return buffer.getvalue()
+
+
+def _store_bytes(data: bytes, fmt: str, media_dir: str) -> str:
+    rel_path = content_rel_path("posters", hashlib.sha256(data).hexdigest(), f"poster.{fmt}")
+    full_path = os.path.join(media_dir, rel_path)
+    if not reuse_content(full_path):
+        os.makedirs(os.path.dirname(full_path), exist_ok=True)
+        tmp_path = os.path.join(os.path.dirname(full_path), f".{uuid.uuid4().hex}.part")
+        with open(tmp_path, "wb") as f:
+            f.write(data)
+        os.replace(tmp_path, full_path)
+    return rel_path
+
+
+def render_poster_variants(poster_path: str, media_dir: str | None = None) -> dict:
+    """
+    Resize a stored poster to each POSTER_VARIANT_WIDTHS width (never
+    upscaling) and store the encodings under their content digest.
+    Returns {format: {width: relative path}}; widths are strings so the
+    mapping round-trips through JSON unchanged. Raises PosterError when the
+    file is not a decodable image.
+    """
+    media_dir = media_dir or settings.MEDIA_DIR
+    try:
+        with Image.open(os.path.join(media_dir, poster_path)) as source:
+            if source.width * source.height > MAX_POSTER_PIXELS:
+                raise PosterError("Poster has too many pixels")
+            image = ImageOps.exif_transpose(source)
+            image = image.convert("RGBA" if image.has_transparency_data else "RGB")
+    except (OSError, Image.DecompressionBombError) as exc:
+        raise PosterError("Unreadable poster image") from exc
+
+    widths = sorted({min(w, image.width) for w in settings.POSTER_VARIANT_WIDTHS})
+    variants: dict[str, dict[str, str]] = {}
+    for width in widths:
+        height = max(1, round(image.height * width / image.width))
+        resized = image.resize((width, height), Image.Resampling.LANCZOS)
+        for fmt, options in variant_formats().items():
+            data = _encode(resized, fmt, options)
+            variants.setdefault(fmt, {})[str(width)] = _store_bytes(data, fmt, media_dir)
+    return variants
@@ -0,0 +1,302 @@
+import os
+import stat
+import secrets
+from email.utils import formatdate, parsedate_to_datetime
+
+import aiofiles
+import anyio
+from starlette.datastructures import Headers
+from starlette.responses import Response
+from starlette.staticfiles import StaticFiles
+from starlette.types import Receive, Scope, Send
+
+from app.utils.http_cache import IMMUTABLE, is_not_modified
+from app.utils.metrics import ACTIVE_STREAMS, count_stream_bytes
+from app.utils.storage import is_content_addressed
+
+
+# read size of the async fallback path
+CHUNK_SIZE = 1024 * 1024
+# more ranges than this in one request is treated as abuse and ignored
+MAX_RANGES = 16
+
+
+class RangeNotSatisfiable(Exception):
+    pass
+
+
+def parse_range_header(range_header: str, file_size: int) -> list[tuple[int, int]] | None:
+    """
+    Parse an RFC 7233 byte-range header into a list of inclusive (start, end) pairs.
+    Supports "a-b", open ended "a-" and suffix "-n" specs, clamps `end` to the
+    file size and merges overlapping or adjacent ranges.
+    Returns None when the header should be ignored (other unit, bad syntax),
+    raises RangeNotSatisfiable when no range overlaps the file.
+    """
+    unit, _, specs = range_header.partition("=")
+    if unit.strip().lower() != "bytes" or not specs.strip():
+        return None
+
+    ranges = []
+    for spec in specs.split(","):
+        spec = spec.strip()
+        if not spec:
+            continue
+        start_str, sep, end_str = spec.partition("-")
+        if not sep:
+            return None
+        start_str, end_str = start_str.strip(), end_str.strip()
+        try:
+            if not start_str:
+                # suffix range: the last N bytes
+                suffix = int(end_str)
+                if suffix < 0:
+                    return None
+                if suffix == 0:
+                    continue
+                start, end = max(file_size - suffix, 0), file_size - 1
+            else:
+                start = int(start_str)
+                end = int(end_str) if end_str else max(start, file_size - 1)
+                if start < 0 or end < start:
+                    return None
+                end = min(end, file_size - 1)
+        except ValueError:
+            return None
+        if start >= file_size:
+            continue
+        ranges.append((start, end))
+
+    if not ranges:
+        raise RangeNotSatisfiable()
+    if len(ranges) > MAX_RANGES:
+        return None
+
+    ranges.sort()
+    merged = [ranges[0]]
+    for start, end in ranges[1:]:
+        last_start, last_end = merged[-1]
+        if start <= last_end + 1:
+            merged[-1] = (last_start, max(last_end, end))
+        else:
+            merged.append((start, end))
+    return merged
+
+
+class MediaFileResponse(Response):
+    """
+    File response for media playback with full byte-range support
+    (single, suffix and multipart/byteranges ranges, If-Range and HEAD),
+    answering If-None-Match / If-Modified-Since with 304.
+
+    Bytes are handed to the server without passing through Python when it
+    offers the ASGI `http.response.zerocopysend` (sendfile) or
+    `http.response.pathsend` extensions; otherwise the file is read with
+    async reads in large chunks.
+    """
+
+    def __init__(
+        self,
+        path: str,
+        media_type: str = "application/octet-stream",
+        headers: dict | None = None,
+    ):
+        self.path = path
+        self.media_type = media_type
+        self.status_code = 200
+        self.background = None
+        self.body = b""
+        self.init_headers(headers)
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        stat_result = await anyio.to_thread.run_sync(os.stat, self.path)
+        if not stat.S_ISREG(stat_result.st_mode):
+            raise RuntimeError(f"{self.path} is not a file")
+        file_size = stat_result.st_size
+        last_modified = formatdate(stat_result.st_mtime, usegmt=True)
+        etag = f'"{stat_result.st_mtime_ns:x}-{file_size:x}"'
+
+        self.headers.setdefault("accept-ranges", "bytes")
+        self.headers.setdefault("last-modified", last_modified)
+        etag = self.headers.setdefault("etag", etag)
+
+        request_headers = Headers(scope=scope)
+        if is_not_modified(request_headers, etag, stat_result.st_mtime):
+            self.status_code = 304
+            await self._send_headers(send)
+            await send({"type": "http.response.body", "body": b""})
+            return
+
+        ranges = None
+        range_header = request_headers.get("range")
+        if range_header and self._if_range_matches(
+            request_headers.get("if-range"), etag, stat_result.st_mtime
+        ):
+            try:
+                ranges = parse_range_header(range_header, file_size)
+            except RangeNotSatisfiable:
+                self.status_code = 416
+                self.headers["content-range"] = f"bytes */{file_size}"
+                self.headers["content-length"] = "0"
+                await self._send_headers(send)
+                await send({"type": "http.response.body", "body": b""})
+                return
+
+        send_body = scope["method"].upper() != "HEAD"
+        extensions = scope.get("extensions", {})
+
+        if not ranges:
+            self.headers["content-type"] = self.media_type
+            self.headers["content-length"] = str(file_size)
+            await self._send_headers(send)
+            if not send_body:
+                await send({"type": "http.response.body", "body": b""})
+            elif "http.response.pathsend" in extensions:
+                await send({"type": "http.response.pathsend", "path": self.path})
+            else:
+                await self._send_file_ranges(send, extensions, [(0, file_size - 1)])
+            return
+
+        self.status_code = 206
+        if len(ranges) == 1:
+            start, end = ranges[0]
+            self.headers["content-type"] = self.media_type
+            self.headers["content-range"] = f"bytes {start}-{end}/{file_size}"
+            self.headers["content-length"] = str(end - start + 1)
+            await self._send_headers(send)
+            if send_body:
+                await self._send_file_ranges(send, extensions, ranges)
+            else:
+                await send({"type": "http.response.body", "body": b""})
+            return
+
+        boundary = secrets.token_hex(16)
+        part_headers = [
+            (
+                f"--{boundary}\r\n"
+                f"Content-Type: {self.media_type}\r\n"
+                f"Content-Range: bytes {start}-{end}/{file_size}\r\n\r\n"
+            ).encode("latin-1")
+            for start, end in ranges
+        ]
+        closing = f"\r\n--{boundary}--\r\n".encode("latin-1")
+        content_length = (
+            sum(len(h) for h in part_headers)
+            + sum(end - start + 1 for start, end in ranges)
+            + 2 * (len(ranges) - 1)  # CRLF between parts
+            + len(closing)
+        )
+        self.headers["content-type"] = f"multipart/byteranges; boundary={boundary}"
+        self.headers["content-length"] = str(content_length)
+        await self._send_headers(send)
+        if not send_body:
+            await send({"type": "http.response.body", "body": b""})
+            return
+        await self._send_file_ranges(
+            send, extensions, ranges, part_headers=part_headers, closing=closing
+        )
+
+    @staticmethod
+    def _if_range_matches(if_range: str | None, etag: str, mtime: float) -> bool:
+        """A Range header is honoured only if If-Range is absent or still valid."""
+        if not if_range:
+            return True
+        if_range = if_range.strip()
+        if if_range.startswith('"') or if_range.startswith("W/"):
+            # weak validators never match (RFC 7233 section 3.2)
+            return if_range == etag
+        try:
+            return int(parsedate_to_datetime(if_range).timestamp()) == int(mtime)
+        except (TypeError, ValueError):
+            return False
+
+    async def _send_headers(self, send: Send) -> None:
+        await send(
+            {
+                "type": "http.response.start",
+                "status": self.status_code,
+                "headers": self.raw_headers,
+            }
+        )
+
+    async def _send_file_ranges(
+        self,
+        send: Send,
+        extensions: dict,
+        ranges: list[tuple[int, int]],
+        part_headers: list[bytes] | None = None,
+        closing: bytes = b"",
+    ) -> None:
+        if "http.response.zerocopysend" in extensions:
+            f = await anyio.to_thread.run_sync(open, self.path, "rb")
+            try:
+                for index, (start, end) in enumerate(ranges):
+                    if part_headers:
+                        await self._send_part_header(send, index, part_headers)
+                    await send(
+                        {
+                            "type": "http.response.zerocopysend",
+                            "file": f,
+                            "offset": start,
+                            "count": end - start + 1,
+                            # the closing message below ends the body
+                            "more_body": True,
+                        }
+                    )
+            finally:
+                f.close()
+        else:
+            async with aiofiles.open(self.path, "rb") as f:
+                for index, (start, end) in enumerate(ranges):
+                    if part_headers:
+                        await self._send_part_header(send, index, part_headers)
+                    await f.seek(start)
+                    remaining = end - start + 1
+                    while remaining > 0:
+                        chunk = await f.read(min(CHUNK_SIZE, remaining))
+                        if not chunk:
+                            # file shrank under us; terminate the response
+                            await send({"type": "http.response.body", "body": b""})
+                            return
+                        remaining -= len(chunk)
+                        await send(
+                            {
+                                "type": "http.response.body",
+                                "body": chunk,
+                                "more_body": True,
+                            }
+                        )
+        await send({"type": "http.response.body", "body": closing})
+
+    @staticmethod
+    async def _send_part_header(send: Send, index: int, part_headers: list[bytes]):
+        prefix = b"\r\n" if index else b""
+        await send(
+            {
+                "type": "http.response.body",
+                "body": prefix + part_headers[index],
+                "more_body": True,
+            }
+        )
+
+
+class StreamResponse(MediaFileResponse):
+    """MediaFileResponse counted in the active stream and bytes sent metrics."""
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        ACTIVE_STREAMS.inc()
+        try:
+            await super().__call__(scope, receive, count_stream_bytes(send))
+        finally:
+            ACTIVE_STREAMS.dec()
+
+
+class MediaStaticFiles(StaticFiles):
+    """StaticFiles that marks content-addressed files as cacheable forever."""
+
+    def file_response(self, full_path, stat_result, scope, status_code=200) -> Response:
+        response = super().file_response(full_path, stat_result, scope, status_code)
+        rel_path = os.path.relpath(full_path, self.directory).replace(os.sep, "/")
+        if is_content_addressed(rel_path):
+            response.headers["cache-control"] = f"public, {IMMUTABLE}"
+        return response
@@ -0,0 +1,236 @@
+import os
+import time
+from contextlib import contextmanager
+
+from prometheus_client import (
+    CONTENT_TYPE_LATEST,
+    REGISTRY,
+    CollectorRegistry,
+    Counter,
+    Gauge,
+    Histogram,
+    generate_latest,
+    multiprocess,
+)
+from sqlalchemy import event
+from starlette.routing import BaseRoute, Match, Mount
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+# Prometheus metrics for the API, the database and Redis clients and the
+# Celery worker. Labels only ever hold route templates, HTTP methods and
+# status codes, command and task names, so their cardinality is bounded:
+# never put ids, emails or raw paths in a label.
+#
+# With several processes (uvicorn/gunicorn workers, Celery prefork) set
+# PROMETHEUS_MULTIPROC_DIR to an empty directory shared by all of them;
+# every process then writes its samples there and /metrics sums them up.
+
+UNMATCHED_ROUTE = "<unmatched>"
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+FAST_BUCKETS = (0.0001, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.5, 1)
+SLOW_BUCKETS = (0.1, 0.5, 1, 5, 15, 30, 60, 120, 300, 600, 1800, 3600)
+
+HTTP_REQUEST_DURATION = Histogram(
+    "auraflix_http_request_duration_seconds",
+    "Time to the end of the response, by route template",
+    ["method", "route", "status"],
+    buckets=LATENCY_BUCKETS,
+)
+HTTP_REQUESTS_IN_PROGRESS = Gauge(
+    "auraflix_http_requests_in_progress",
+    "Requests being handled, by route template",
+    ["method", "route"],
+    multiprocess_mode="livesum",
+)
+STREAM_BYTES_SENT = Counter(
+    "auraflix_stream_bytes_sent", "Response bytes sent by stream_movie"
+)
+ACTIVE_STREAMS = Gauge(
+    "auraflix_active_streams", "stream_movie responses in flight", multiprocess_mode="livesum"
+)
+UPLOAD_BYTES = Counter(
+    "auraflix_upload_bytes", "Bytes received by upload endpoints", ["kind"]
+)
+UPLOAD_DURATION = Histogram(
+    "auraflix_upload_duration_seconds",
+    "Time to receive and store an upload (form) or one chunk (chunk)",
+    ["kind"],
+    buckets=SLOW_BUCKETS,
+)
+DB_POOL_CHECKOUT_WAIT = Histogram(
+    "auraflix_db_pool_checkout_wait_seconds",
+    "Time spent waiting for a pooled database connection",
+    ["engine"],
+    buckets=FAST_BUCKETS,
+)
+REDIS_COMMAND_DURATION = Histogram(
+    "auraflix_redis_command_duration_seconds",
+    "Round trip of async Redis commands; pipelines count as PIPELINE",
+    ["command"],
+    buckets=FAST_BUCKETS,
+)
+CELERY_TASK_DURATION = Histogram(
+    "auraflix_celery_task_duration_seconds",
+    "Celery task run time, by final state",
+    ["task", "state"],
+    buckets=SLOW_BUCKETS,
+)
+CELERY_QUEUE_LENGTH = Gauge(
+    "auraflix_celery_queue_length",
+    "Messages waiting in the broker queue, sampled at scrape time",
+    ["queue"],
+    multiprocess_mode="mostrecent",
+)
+CELERY_QUEUED_TASKS = Gauge(
+    "auraflix_celery_queued_tasks",
+    "Waiting messages per task (first QUEUE_SCAN_LIMIT messages)",
+    ["task"],
+    multiprocess_mode="mostrecent",
+)
+
+
+def registry() -> CollectorRegistry:
+    """The registry to expose: this process, or all of them in multiprocess mode."""
+    if not os.environ.get("PROMETHEUS_MULTIPROC_DIR"):
+        return REGISTRY
+    collector_registry = CollectorRegistry()
+    multiprocess.MultiProcessCollector(collector_registry)
+    return collector_registry
+
+
+def render() -> tuple[bytes, str]:
+    return generate_latest(registry()), CONTENT_TYPE_LATEST
+
+
+def mark_process_dead(pid: int):
+    """Drop the live gauges of an exited process (multiprocess mode only)."""
+    if os.environ.get("PROMETHEUS_MULTIPROC_DIR"):
+        multiprocess.mark_process_dead(pid)
+
+
+def _route_template(route: BaseRoute) -> str:
+    if isinstance(route, Mount):
+        return f"{route.path}/{{path}}"
+    return route.path
+
+
+def _match_route(routes: list[BaseRoute], scope: Scope) -> tuple[Match, str | None]:
+    partial = None
+    for route in routes:
+        match, _ = route.matches(scope)
+        if match is Match.NONE:
+            continue
+        included = getattr(route, "original_router", None)
+        if included is not None:
+            # FastAPI wraps included routers; look for the route inside
+            match, template = _match_route(included.routes, scope)
+        else:
+            template = _route_template(route)
+        if match is Match.FULL:
+            return match, template
+        if match is Match.PARTIAL and partial is None:
+            partial = template
+    if partial is not None:
+        return Match.PARTIAL, partial
+    return Match.NONE, None
+
+
+def route_label(scope: Scope) -> str:
+    """
+    Route template the app's router will pick for a request: the route path,
+    `<mount>/{path}` for mounted apps (media, admin), or UNMATCHED_ROUTE.
+    Matched the way routing does it (a full match, else the first partial
+    one, answered with 405), so it is known before the request runs.
+    """
+    router = getattr(scope.get("app"), "router", None)
+    if router is None:
+        return UNMATCHED_ROUTE
+    _, template = _match_route(router.routes, scope)
+    return template or UNMATCHED_ROUTE
+
+
+class MetricsMiddleware:
+    """
+    Per-route latency histogram and in-flight gauge. Plain ASGI, so
+    streamed responses pass through untouched. The route is matched up
+    front, so a request counts as in flight for all of its handling.
+    """
+
+    def __init__(self, app: ASGIApp):
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        method = scope["method"]
+        route = route_label(scope)
+        status = 500
+
+        async def send_wrapper(message: Message) -> None:
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        in_progress = HTTP_REQUESTS_IN_PROGRESS.labels(method, route)
+        in_progress.inc()
+        start = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            in_progress.dec()
+            HTTP_REQUEST_DURATION.labels(method, route, str(status)).observe(
+                time.perf_counter() - start
+            )
+
+
+def count_stream_bytes(send: Send) -> Send:
+    """Wrap `send` to add every body byte to STREAM_BYTES_SENT."""
+
+    async def wrapper(message: Message) -> None:
+        kind = message["type"]
+        if kind == "http.response.body":
+            STREAM_BYTES_SENT.inc(len(message.get("body", b"")))
+        elif kind == "http.response.zerocopysend":
+            STREAM_BYTES_SENT.inc(message["count"])
+        elif kind == "http.response.pathsend":
+            STREAM_BYTES_SENT.inc(os.stat(message["path"]).st_size)
+        await send(message)
+
+    return wrapper
+
+
+@contextmanager
+def observe(histogram: Histogram, *labels: str):
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        histogram.labels(*labels).observe(time.perf_counter() - start)
+
+
+def instrument_pool(engine, label: str):
+    """
+    Time connection checkouts of `engine` (a sync Engine; pass
+    `async_engine.sync_engine` for an AsyncEngine). The wait covers queueing
+    for a free connection and opening a new one. Re-applied when
+    `engine.dispose()` replaces the pool.
+    """
+    histogram = DB_POOL_CHECKOUT_WAIT.labels(label)
+
+    def wrap(pool):
+        do_get = pool._do_get
+
+        def timed_do_get():
+            start = time.perf_counter()
+            try:
+                return do_get()
+            finally:
+                histogram.observe(time.perf_counter() - start)
+
+        pool._do_get = timed_do_get
+
+    wrap(engine.pool)
+    event.listen(engine, "engine_disposed", lambda eng: wrap(eng.pool))
@@ -0,0 +1,343 @@
+import hashlib
+import struct
+from dataclasses import dataclass, field
+from typing import BinaryIO
+
+# Minimal ISO-BMFF (MP4/MOV) reader: enough to probe duration, resolution and
+# codecs from `moov`, and to move `moov` in front of the media data
+# ("faststart") so players can start without fetching the end of the file.
+
+# boxes whose payload is only child boxes, on the way down to stco/co64
+CONTAINER_BOXES = {b"moov", b"trak", b"mdia", b"minf", b"stbl", b"edts", b"dinf", b"mvex"}
+# `moov` is read into memory; real ones are a few MiB even for long movies
+MAX_MOOV_BYTES = 64 * 1024 * 1024
+COPY_CHUNK_SIZE = 1024 * 1024
+UINT32_MAX = 0xFFFFFFFF
+
+QUICKTIME_BRANDS = {b"qt  "}
+
+
+class Mp4Error(ValueError):
+    pass
+
+
+@dataclass
+class Mp4Info:
+    media_type: str = "video/mp4"
+    duration: float | None = None
+    width: int | None = None
+    height: int | None = None
+    codecs: list[str] = field(default_factory=list)
+    # moov precedes the media data
+    faststart: bool = False
+    # fragmented MP4 (moof boxes); sample offsets are not in moov
+    fragmented: bool = False
+
+
+@dataclass
+class TopBox:
+    type: bytes
+    offset: int
+    size: int
+
+
+@dataclass
+class Box:
+    type: bytes
+    payload: bytes = b""
+    children: list["Box"] | None = None
+
+    def find(self, box_type: bytes) -> "Box | None":
+        return next((c for c in self.children or () if c.type == box_type), None)
+
+    def find_all(self, box_type: bytes) -> list["Box"]:
+        return [c for c in self.children or () if c.type == box_type]
+
+
+def _read_header(data: bytes, offset: int, end: int) -> tuple[bytes, int, int]:
+    if end - offset < 8:
+        raise Mp4Error("Truncated box header")
+    size, box_type = struct.unpack_from(">I4s", data, offset)
+    header = 8
+    if size == 1:
+        if end - offset < 16:
+            raise Mp4Error("Truncated box header")
+        (size,) = struct.unpack_from(">Q", data, offset + 8)
+        header = 16
+    elif size == 0:
+        size = end - offset
+    if size < header or offset + size > end:
+        raise Mp4Error(f"Invalid size for box {box_type!r}")
+    return box_type, size, header
+
+
+def top_level_boxes(f: BinaryIO, file_size: int) -> list[TopBox]:
+    boxes = []
+    offset = 0
+    while offset < file_size:
+        f.seek(offset)
+        try:
+            box_type, size, _ = _read_header(f.read(16), 0, file_size - offset)
+        except struct.error as exc:
+            raise Mp4Error("Truncated box header") from exc
+        if not boxes and box_type != b"ftyp":
+            # not worth walking the rest of a file that is no MP4
+            raise Mp4Error("Not an ISO-BMFF file")
+        boxes.append(TopBox(box_type, offset, size))
+        offset += size
+    if not boxes:
+        raise Mp4Error("Not an ISO-BMFF file")
+    return boxes
+
+
+def parse_boxes(data: bytes, offset: int = 0, end: int | None = None) -> list[Box]:
+    end = len(data) if end is None else end
+    boxes = []
+    while offset < end:
+        box_type, size, header = _read_header(data, offset, end)
+        start = offset + header
+        if box_type in CONTAINER_BOXES:
+            boxes.append(Box(box_type, children=parse_boxes(data, start, offset + size)))
+        else:
+            boxes.append(Box(box_type, payload=data[start : offset + size]))
+        offset += size
+    return boxes
+
+
+def serialize(boxes: list[Box]) -> bytes:
+    out = bytearray()
+    for box in boxes:
+        body = serialize(box.children) if box.children is not None else box.payload
+        size = len(body) + 8
+        if size > UINT32_MAX:
+            out += struct.pack(">I4sQ", 1, box.type, size + 8)
+        else:
+            out += struct.pack(">I4s", size, box.type)
+        out += body
+    return bytes(out)
+
+
+def _read_moov(f: BinaryIO, boxes: list[TopBox]) -> tuple[TopBox, Box]:
+    moov = next((b for b in boxes if b.type == b"moov"), None)
+    if moov is None:
+        raise Mp4Error("No moov box")
+    if moov.size > MAX_MOOV_BYTES:
+        raise Mp4Error("moov box too large")
+    f.seek(moov.offset)
+    data = f.read(moov.size)
+    return moov, parse_boxes(data)[0]
+
+
+def _stbl_boxes(moov: Box):
+    for trak in moov.find_all(b"trak"):
+        stbl = _descend(trak, b"mdia", b"minf", b"stbl")
+        if stbl is not None:
+            yield trak, stbl
+
+
+def _descend(box: Box | None, *path: bytes) -> Box | None:
+    for box_type in path:
+        if box is None:
+            return None
+        box = box.find(box_type)
+    return box
+
+
+def _timescaled(payload: bytes, v0_at: int) -> tuple[int, int]:
+    """(timescale, duration) from an mvhd/mdhd payload."""
+    if payload[0] == 1:
+        return struct.unpack_from(">IQ", payload, v0_at + 8)
+    return struct.unpack_from(">II", payload, v0_at)
+
+
+def _descriptor(data: bytes, offset: int) -> tuple[int, int, int]:
+    """(tag, payload offset, payload length) of an MPEG-4 descriptor."""
+    tag = data[offset]
+    offset += 1
+    length = 0
+    for _ in range(4):
+        byte = data[offset]
+        offset += 1
+        length = (length << 7) | (byte & 0x7F)
+        if not byte & 0x80:
+            break
+    return tag, offset, length
+
+
+def _mp4a_codec(entry: bytes) -> str:
+    # AudioSampleEntry is 28 bytes, then child boxes (esds)
+    esds = next((b for b in parse_boxes(entry, 28) if b.type == b"esds"), None)
+    if esds is None:
+        return "mp4a"
+    data = esds.payload
+    tag, offset, _ = _descriptor(data, 4)  # ES_Descriptor
+    if tag != 0x03:
+        return "mp4a"
+    flags = data[offset + 2]
+    offset += 3
+    if flags & 0x80:
+        offset += 2
+    if flags & 0x40:
+        offset += 1 + data[offset]
+    if flags & 0x20:
+        offset += 2
+    tag, offset, _ = _descriptor(data, offset)  # DecoderConfigDescriptor
+    if tag != 0x04:
+        return "mp4a"
+    object_type = data[offset]
+    codec = f"mp4a.{object_type:x}"
+    tag, offset, _ = _descriptor(data, offset + 13)  # DecoderSpecificInfo
+    if tag == 0x05 and object_type == 0x40:
+        codec += f".{data[offset] >> 3}"
+    return codec
+
+
+def _sample_entry_codec(stsd: Box) -> tuple[str, int | None, int | None]:
+    """RFC 6381 codec string and coded size of the first sample entry."""
+    entries = parse_boxes(stsd.payload, 8)
+    if not entries:
+        return "", None, None
+    entry = entries[0]
+    fourcc = entry.type.decode("latin-1")
+    if fourcc in ("avc1", "avc3", "hvc1", "hev1", "vp09", "av01"):
+        width, height = struct.unpack_from(">HH", entry.payload, 24)
+        # VisualSampleEntry is 78 bytes, then child boxes (avcC, ...)
+        avcc = next((b for b in parse_boxes(entry.payload, 78) if b.type == b"avcC"), None)
+        if avcc is not None and len(avcc.payload) >= 4:
+            fourcc += ".{:02x}{:02x}{:02x}".format(*avcc.payload[1:4])
+        return fourcc, width, height
+    if fourcc == "mp4a":
+        return _mp4a_codec(entry.payload), None, None
+    return fourcc, None, None
+
+
+def _probe_moov(moov: Box, info: Mp4Info):
+    mvhd = moov.find(b"mvhd")
+    if mvhd is not None:
+        timescale, duration = _timescaled(mvhd.payload, 12)
+        if timescale:
+            info.duration = duration / timescale
+    info.fragmented = moov.find(b"mvex") is not None
+    for trak, stbl in _stbl_boxes(moov):
+        hdlr = _descend(trak, b"mdia", b"hdlr")
+        handler = hdlr.payload[8:12] if hdlr is not None else b""
+        stsd = stbl.find(b"stsd")
+        if stsd is None or handler not in (b"vide", b"soun"):
+            continue
+        codec, width, height = _sample_entry_codec(stsd)
+        if codec:
+            info.codecs.append(codec)
+        if handler == b"vide" and info.width is None:
+            tkhd = trak.find(b"tkhd")
+            if tkhd is not None and len(tkhd.payload) >= 8:
+                # display size, 16.16 fixed point, in the last 8 bytes
+                tk_width, tk_height = struct.unpack_from(">II", tkhd.payload, len(tkhd.payload) - 8)
+                width, height = (tk_width >> 16) or width, (tk_height >> 16) or height
+            info.width, info.height = width, height
+
+
+def probe(path: str) -> Mp4Info:
+    """Read container metadata. Raises Mp4Error for non-ISO-BMFF input."""
+    with open(path, "rb") as f:
+        f.seek(0, 2)
+        boxes = top_level_boxes(f, f.tell())
+        f.seek(0)
+        ftyp = f.read(min(boxes[0].size, 16))
+        moov_box, moov = _read_moov(f, boxes)
+    info = Mp4Info()
+    if ftyp[8:12] in QUICKTIME_BRANDS:
+        info.media_type = "video/quicktime"
+    mdat = next((b for b in boxes if b.type == b"mdat"), None)
+    info.faststart = mdat is None or moov_box.offset < mdat.offset
+    try:
+        _probe_moov(moov, info)
+    except (struct.error, IndexError) as exc:
+        raise Mp4Error(f"Malformed moov: {exc}") from exc
+    info.fragmented = info.fragmented or any(b.type == b"moof" for b in boxes)
+    return info
+
+
+def _relocate_moov(moov: Box, shift) -> bytes:
+    """
+    Serialize `moov` with every chunk offset passed through `shift`, which
+    depends on the final moov size. stco tables whose offsets no longer fit
+    32 bits become co64, which grows moov, so iterate until the size settles.
+    """
+    tables = []
+    for _, stbl in _stbl_boxes(moov):
+        for table in stbl.children:
+            if table.type in (b"stco", b"co64"):
+                (count,) = struct.unpack_from(">I", table.payload, 4)
+                fmt = ">%dI" % count if table.type == b"stco" else ">%dQ" % count
+                tables.append((table, struct.unpack_from(fmt, table.payload, 8)))
+
+    size = len(serialize([moov]))
+    while True:
+        for table, offsets in tables:
+            moved = [shift(offset, size) for offset in offsets]
+            if table.type == b"stco" and moved and max(moved) > UINT32_MAX:
+                table.type = b"co64"
+            fmt = ">%dI" % len(moved) if table.type == b"stco" else ">%dQ" % len(moved)
+            table.payload = table.payload[:8] + struct.pack(fmt, *moved)
+        data = serialize([moov])
+        if len(data) == size:
+            return data
+        size = len(data)
+
+
+def faststart(src: str, dst: str) -> str | None:
+    """
+    Write a copy of `src` to `dst` with `moov` moved in front of the first
+    `mdat`, and return the SHA-256 of the written file. Returns None (and
+    writes nothing) when `src` is already faststart or fragmented.
+    """
+    with open(src, "rb") as f:
+        f.seek(0, 2)
+        boxes = top_level_boxes(f, f.tell())
+        moov_box, moov = _read_moov(f, boxes)
+        first_mdat = next((i for i, b in enumerate(boxes) if b.type == b"mdat"), None)
+        if (
+            first_mdat is None
+            or moov_box.offset < boxes[first_mdat].offset
+            or moov.find(b"mvex") is not None
+            or any(b.type == b"moof" for b in boxes)
+        ):
+            return None
+
+        insert_at = boxes[first_mdat].offset
+
+        def shift(offset: int, moov_size: int) -> int:
+            # data between the insertion point and the old moov moves up by
+            # the new moov; data after the old moov also loses the old one
+            if offset >= moov_box.offset + moov_box.size:
+                return offset + moov_size - moov_box.size
+            if offset >= insert_at:
+                return offset + moov_size
+            return offset
+
+        try:
+            moov_data = _relocate_moov(moov, shift)
+        except struct.error as exc:
+            raise Mp4Error(f"Malformed chunk offset table: {exc}") from exc
+
+        digest = hashlib.sha256()
+        with open(dst, "wb") as out:
+
+            def write(data: bytes):
+                digest.update(data)
+                out.write(data)
+
+            for box in boxes:
+                if box.type == b"moov":
+                    continue
+                if box.offset == insert_at:
+                    write(moov_data)
+                f.seek(box.offset)
+                remaining = box.size
+                while remaining:
+                    chunk = f.read(min(COPY_CHUNK_SIZE, remaining))
+                    if not chunk:
+                        raise Mp4Error("Unexpected end of file")
+                    write(chunk)
+                    remaining -= len(chunk)
+    return digest.hexdigest()
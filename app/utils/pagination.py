@@ -0,0 +1,20 @@
+import base64
+import json
+
+
+def encode_cursor(data: dict) -> str:
+    """Opaque, URL-safe cursor for keyset pagination."""
+    raw = json.dumps(data, separators=(",", ":"), default=str).encode()
+    return base64.urlsafe_b64encode(raw).rstrip(b"=").decode()
+
+
+def decode_cursor(cursor: str) -> dict:
+    """Inverse of `encode_cursor`; raises ValueError on a malformed cursor."""
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        data = json.loads(base64.urlsafe_b64decode(padded.encode()))
+    except Exception as exc:
+        raise ValueError("Invalid cursor") from exc
+    if not isinstance(data, dict):
+        raise ValueError("Invalid cursor")
+    return data
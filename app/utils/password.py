@@ -1,10 +1,22 @@
+import asyncio
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
 from passlib.context import CryptContext
 from datetime import datetime, timedelta, timezone
 import jwt
+from fastapi import HTTPException, status
 from app.config import settings
 
 
-pwd_context = CryptContext(schemes=["argon2"], deprecated="auto")
+# hashes made with other parameters are flagged by needs_update and
+# transparently rehashed on the next successful login
+pwd_context = CryptContext(
+    schemes=["argon2"],
+    deprecated="auto",
+    argon2__rounds=settings.ARGON2_TIME_COST,
+    argon2__memory_cost=settings.ARGON2_MEMORY_COST,
+    argon2__parallelism=settings.ARGON2_PARALLELISM,
+)
 
 
 def hash_password(password: str) -> str:
@@ -15,6 +27,58 @@ def verify_password(password: str, hash: str) -> bool:
     return pwd_context.verify(password, hash)
 
 
+def verify_and_update_password(password: str, hash: str) -> tuple[bool, str | None]:
+    """Verify, and return a new hash when the stored one uses outdated parameters."""
+    return pwd_context.verify_and_update(password, hash)
+
+
+# Argon2 is CPU and memory heavy; async handlers run it in a dedicated process
+# pool so a login burst cannot freeze the event loop. At most
+# PASSWORD_HASH_WORKERS + PASSWORD_HASH_QUEUE_SIZE calls may be in flight per
+# API process, beyond that requests fail fast with 503.
+_pool: ProcessPoolExecutor | None = None
+_slots = asyncio.Semaphore(settings.PASSWORD_HASH_WORKERS + settings.PASSWORD_HASH_QUEUE_SIZE)
+
+
+def _get_pool() -> ProcessPoolExecutor:
+    global _pool
+    if _pool is None:
+        _pool = ProcessPoolExecutor(
+            max_workers=settings.PASSWORD_HASH_WORKERS,
+            mp_context=multiprocessing.get_context("spawn"),
+        )
+    return _pool
+
+
+def shutdown_password_pool():
+    global _pool
+    if _pool is not None:
+        _pool.shutdown(cancel_futures=True)
+        _pool = None
+
+
+async def _run_in_pool(fn, *args):
+    if _slots.locked():
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="Server busy, please retry shortly.",
+            headers={"Retry-After": "1"},
+        )
+    async with _slots:
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(_get_pool(), fn, *args)
+
+
+async def hash_password_async(password: str) -> str:
+    return await _run_in_pool(hash_password, password)
+
+
+async def verify_and_update_password_async(
+    password: str, hash: str
+) -> tuple[bool, str | None]:
+    return await _run_in_pool(verify_and_update_password, password, hash)
+
+
 def create_access_token(data: dict, expires_delta: timedelta | None = None):
     if expires_delta is None:
         expires_delta = timedelta(minutes=settings.ACCESS_TOKEN_EXPIRE_MINUTES)
@@ -0,0 +1,192 @@
+import time
+from collections import defaultdict
+from datetime import datetime, timezone
+import redis
+from app.config import settings
+from app.utils.redis_pool import get_redis, register_script
+from app.utils.views import drain_registry_key, start_drain
+
+# Watch progress hot tier. Per user:
+#   progress:{user_id}         hash  movie id -> "position:updated_at:completed"
+#   progress:recent:{user_id}  zset  unfinished movie ids by updated_at
+# Both expire PROGRESS_TTL_SECONDS after the user's last heartbeat. Every
+# heartbeat also adds "user_id:movie_id" to DIRTY_KEY; the Celery flush
+# upserts the latest position of those entries into watch_progress, so a
+# movie watched for an hour is one row write per flush, not 700 commits.
+
+DIRTY_KEY = "progress:dirty"
+# at this fraction of the duration a movie counts as watched to the end
+COMPLETED_FRACTION = 0.95
+# unfinished movies kept per user for "continue watching"
+CONTINUE_WATCHING_MAX = 50
+
+
+def progress_key(user_id: int) -> str:
+    return f"progress:{user_id}"
+
+
+def recent_key(user_id: int) -> str:
+    return f"progress:recent:{user_id}"
+
+
+# KEYS: positions, recent, dirty; ARGV: movie id, entry, updated_at,
+# completed (0/1), dirty member, ttl, recent max
+_RECORD_PROGRESS_LUA = """
+redis.call('HSET', KEYS[1], ARGV[1], ARGV[2])
+if ARGV[4] == '1' then
+    redis.call('ZREM', KEYS[2], ARGV[1])
+else
+    redis.call('ZADD', KEYS[2], ARGV[3], ARGV[1])
+    redis.call('ZREMRANGEBYRANK', KEYS[2], 0, -(tonumber(ARGV[7]) + 1))
+end
+redis.call('SADD', KEYS[3], ARGV[5])
+redis.call('EXPIRE', KEYS[1], ARGV[6])
+redis.call('EXPIRE', KEYS[2], ARGV[6])
+return 1
+"""
+_record_progress = register_script(_RECORD_PROGRESS_LUA)
+
+# KEYS: recent, positions; ARGV: limit -> {movie ids, entries}
+_RECENT_PROGRESS_LUA = """
+local ids = redis.call('ZREVRANGE', KEYS[1], 0, tonumber(ARGV[1]) - 1)
+if #ids == 0 then
+    return {}
+end
+return {ids, redis.call('HMGET', KEYS[2], unpack(ids))}
+"""
+_recent_progress = register_script(_RECENT_PROGRESS_LUA)
+
+# KEYS: positions, recent; ARGV: ttl, recent max, then (movie id, entry,
+# updated_at, completed) per row. A row is written only where the hash has
+# no entry or an older one: a newer entry may not be flushed yet.
+_WARM_PROGRESS_LUA = """
+local written = 0
+for i = 3, #ARGV, 4 do
+    local stored = redis.call('HGET', KEYS[1], ARGV[i])
+    local stored_at = stored and tonumber(string.match(stored, '^[^:]*:([^:]*):'))
+    if not stored_at or stored_at < tonumber(ARGV[i + 2]) then
+        redis.call('HSET', KEYS[1], ARGV[i], ARGV[i + 1])
+        if ARGV[i + 3] == '1' then
+            redis.call('ZREM', KEYS[2], ARGV[i])
+        else
+            redis.call('ZADD', KEYS[2], ARGV[i + 2], ARGV[i])
+        end
+        written = written + 1
+    end
+end
+redis.call('ZREMRANGEBYRANK', KEYS[2], 0, -(tonumber(ARGV[2]) + 1))
+redis.call('EXPIRE', KEYS[1], ARGV[1])
+redis.call('EXPIRE', KEYS[2], ARGV[1])
+return written
+"""
+_warm_progress = register_script(_WARM_PROGRESS_LUA)
+
+
+def _encode(position: int, updated_at: float, completed: bool) -> str:
+    return f"{position}:{updated_at:.3f}:{int(completed)}"
+
+
+def _decode(movie_id, entry: str) -> dict:
+    position, updated_at, completed = entry.split(":")
+    return {
+        "movie_id": int(movie_id),
+        "position_seconds": int(position),
+        "completed": completed == "1",
+        "updated_at": datetime.fromtimestamp(float(updated_at), timezone.utc),
+    }
+
+
+async def record_progress(
+    user_id: int, movie_id: int, position: int, completed: bool
+) -> dict:
+    """Store a heartbeat (single round trip) and mark it for the next flush."""
+    updated_at = time.time()
+    entry = _encode(position, updated_at, completed)
+    await _record_progress(
+        keys=[progress_key(user_id), recent_key(user_id), DIRTY_KEY],
+        args=[
+            movie_id,
+            entry,
+            updated_at,
+            int(completed),
+            f"{user_id}:{movie_id}",
+            settings.PROGRESS_TTL_SECONDS,
+            CONTINUE_WATCHING_MAX,
+        ],
+        client=get_redis(),
+    )
+    return _decode(movie_id, entry)
+
+
+async def get_progress(user_id: int, movie_id: int) -> dict | None:
+    entry = await get_redis().hget(progress_key(user_id), str(movie_id))
+    return _decode(movie_id, entry) if entry else None
+
+
+async def recent_progress(user_id: int, limit: int) -> list[dict]:
+    """The user's unfinished movies, last watched first ([] on a cold tier)."""
+    reply = await _recent_progress(
+        keys=[recent_key(user_id), progress_key(user_id)], args=[limit], client=get_redis()
+    )
+    if not reply:
+        return []
+    movie_ids, entries = reply
+    return [
+        _decode(movie_id, entry) for movie_id, entry in zip(movie_ids, entries) if entry
+    ]
+
+
+async def warm_progress(user_id: int, rows: list[dict]) -> int:
+    """
+    Load progress read from the database back into the hot tier (single
+    round trip), keeping entries that are newer than their row. Returns the
+    number of rows written.
+    """
+    if not rows:
+        return 0
+    args = [settings.PROGRESS_TTL_SECONDS, CONTINUE_WATCHING_MAX]
+    for row in rows:
+        updated_at = row["updated_at"].timestamp()
+        args += [
+            row["movie_id"],
+            _encode(row["position_seconds"], updated_at, row["completed"]),
+            updated_at,
+            int(row["completed"]),
+        ]
+    return await _warm_progress(
+        keys=[progress_key(user_id), recent_key(user_id)], args=args, client=get_redis()
+    )
+
+
+def drain_dirty_progress(client: redis.Redis) -> tuple[str | None, list[dict]]:
+    """
+    Like `drain_pending_views`, for progress: returns the key now holding
+    the dirty entries and their latest values as watch_progress rows.
+    Entries whose user hash has expired meanwhile are skipped.
+    """
+    flushing_key = start_drain(client, DIRTY_KEY, "progress", restore_dirty_progress)
+    if flushing_key is None:
+        return None, []
+    movies_by_user = defaultdict(list)
+    for member in client.smembers(flushing_key):
+        user_id, movie_id = member.split(":")
+        movies_by_user[int(user_id)].append(movie_id)
+
+    pipe = client.pipeline(transaction=False)
+    for user_id, movie_ids in movies_by_user.items():
+        pipe.hmget(progress_key(user_id), movie_ids)
+    rows = []
+    for (user_id, movie_ids), entries in zip(movies_by_user.items(), pipe.execute()):
+        for movie_id, entry in zip(movie_ids, entries):
+            if entry:
+                rows.append({"user_id": user_id, **_decode(movie_id, entry)})
+    return flushing_key, rows
+
+
+def restore_dirty_progress(client: redis.Redis, flushing_key: str):
+    """Mark drained entries dirty again so the next flush retries them."""
+    pipe = client.pipeline()
+    pipe.sunionstore(DIRTY_KEY, [DIRTY_KEY, flushing_key])
+    pipe.delete(flushing_key)
+    pipe.zrem(drain_registry_key(flushing_key), flushing_key)
+    pipe.execute()
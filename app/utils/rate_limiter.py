@@ -1,23 +1,90 @@
-import redis
-from fastapi import HTTPException, status
-from app.config import settings
+import math
+import time
+from collections import OrderedDict
+from fastapi import HTTPException, Request, status
+from app.utils.redis_pool import get_redis, register_script
 
-r = redis.Redis.from_url(settings.REDIS_URL, decode_responses=True)
+# Sliding-window counter: the previous fixed window's count is weighted by how
+# much of it still overlaps the sliding window. Check, INCR and PEXPIRE run
+# atomically in one round trip, so a key can never be left without a TTL.
+_SLIDING_WINDOW_LUA = """
+local limit = tonumber(ARGV[1])
+local window_ms = tonumber(ARGV[2])
+local weight = tonumber(ARGV[3])
+local previous = tonumber(redis.call('GET', KEYS[2]) or '0')
+local current = tonumber(redis.call('GET', KEYS[1]) or '0')
+if previous * weight + current >= limit then
+    return 0
+end
+redis.call('INCR', KEYS[1])
+redis.call('PEXPIRE', KEYS[1], window_ms * 2)
+return 1
+"""
+_sliding_window = register_script(_SLIDING_WINDOW_LUA)
 
+# keys tracked by each limiter's in-process tier
+LOCAL_MAX_KEYS = 10_000
 
-def rate_limit(key: str, limit: int, window: int):
+
+def client_ip(request: Request) -> str:
+    return request.client.host if request.client else "unknown"
+
+
+class RateLimiter:
     """
-    Simple fixed-window rate limiter using Redis.
-    key: identifier (e.g., email)
-    limit: max attempts allowed
-    window: window seconds
+    Sliding-window rate limiter, usable as a FastAPI dependency (keyed by
+    client IP) or directly via `hit(identifier)` for per-account limits.
+
+    An in-process tier counts the hits this worker has seen; once those alone
+    exceed the limit the request is rejected without touching Redis. That is
+    always correct, since the global count can only be higher.
     """
-    count = r.incr(key)
-    if count == 1:
-        r.expire(key, window)
-    if count > limit:
+
+    def __init__(self, scope: str, limit: int, window: int):
+        self.scope = scope
+        self.limit = limit
+        self.window = window
+        # identifier -> [window index, previous count, current count]
+        self._local: OrderedDict[str, list[int]] = OrderedDict()
+
+    def _local_entry(self, identifier: str, index: int) -> list[int]:
+        entry = self._local.get(identifier)
+        if entry is None or entry[0] < index - 1:
+            entry = [index, 0, 0]
+        elif entry[0] == index - 1:
+            entry = [index, entry[2], 0]
+        self._local[identifier] = entry
+        self._local.move_to_end(identifier)
+        while len(self._local) > LOCAL_MAX_KEYS:
+            self._local.popitem(last=False)
+        return entry
+
+    def _reject(self, now: float):
+        retry_after = math.ceil(self.window - (now % self.window)) or 1
         raise HTTPException(
             status_code=status.HTTP_429_TOO_MANY_REQUESTS,
             detail="Too many requests. Please try later.",
+            headers={"Retry-After": str(retry_after)},
         )
-    return True
+
+    async def hit(self, identifier: str):
+        now = time.time()
+        index = int(now // self.window)
+        weight = 1 - (now % self.window) / self.window
+        entry = self._local_entry(identifier, index)
+        if entry[1] * weight + entry[2] >= self.limit:
+            self._reject(now)
+        base = f"ratelimit:{self.scope}:{identifier}"
+        allowed = await _sliding_window(
+            keys=[f"{base}:{index}", f"{base}:{index - 1}"],
+            args=[self.limit, self.window * 1000, weight],
+            client=get_redis(),
+        )
+        if not allowed:
+            self._reject(now)
+        # only hits Redis counted, so the local count never exceeds the global one
+        entry[2] += 1
+        return True
+
+    async def __call__(self, request: Request):
+        await self.hit(client_ip(request))
@@ -0,0 +1,66 @@
+import time
+
+import redis.asyncio as aioredis
+from redis.commands.core import AsyncScript
+from app.config import settings
+from app.utils.metrics import REDIS_COMMAND_DURATION
+
+
+class InstrumentedPipeline(aioredis.client.Pipeline):
+    async def execute(self, raise_on_error: bool = True):
+        start = time.perf_counter()
+        try:
+            return await super().execute(raise_on_error)
+        finally:
+            REDIS_COMMAND_DURATION.labels("PIPELINE").observe(time.perf_counter() - start)
+
+
+class InstrumentedRedis(aioredis.Redis):
+    """Redis client timing each command into REDIS_COMMAND_DURATION."""
+
+    async def execute_command(self, *args, **options):
+        start = time.perf_counter()
+        try:
+            return await super().execute_command(*args, **options)
+        finally:
+            command = str(args[0]).split(" ", 1)[0].upper()
+            REDIS_COMMAND_DURATION.labels(command).observe(time.perf_counter() - start)
+
+    def pipeline(self, transaction: bool = True, shard_hint: str | None = None):
+        return InstrumentedPipeline(
+            self.connection_pool, self.response_callbacks, transaction, shard_hint
+        )
+
+
+# One connection pool for every async Redis user in the API process
+# (verification codes, rate limiting, caches, view buffering).
+# Connections are opened lazily; the app lifespan checks and closes the pool.
+_pool = aioredis.ConnectionPool.from_url(
+    settings.REDIS_URL,
+    decode_responses=True,
+    max_connections=settings.REDIS_MAX_CONNECTIONS,
+)
+_client = InstrumentedRedis(connection_pool=_pool)
+
+
+def get_redis() -> aioredis.Redis:
+    return _client
+
+
+def use_redis(client: aioredis.Redis):
+    """Swap the shared client, e.g. for a local stand-in in benchmarks."""
+    global _client
+    _client = client
+
+
+def register_script(source: str) -> AsyncScript:
+    """Lua script; call it with `client=get_redis()` so swaps are honoured."""
+    return _client.register_script(source)
+
+
+async def init_redis():
+    await _client.ping()
+
+
+async def close_redis():
+    await _client.connection_pool.disconnect()
@@ -0,0 +1,21 @@
+import orjson
+from app.utils.redis_pool import get_redis
+
+# movie id -> JSON [[movie id, cosine similarity], ...], best first. Written
+# by the similar movies job (app.tasks.similarity), which replaces the whole
+# hash at the end of each run.
+SIMILAR_MOVIES_KEY = "similar:movies"
+
+
+def encode_neighbours(movie_ids, scores) -> bytes:
+    return orjson.dumps(
+        [[int(movie_id), round(float(score), 4)] for movie_id, score in zip(movie_ids, scores)]
+    )
+
+
+async def get_neighbours(movie_id: int) -> list[tuple[int, float]]:
+    """Precomputed neighbours of `movie_id` (one HGET); [] when it has none."""
+    raw = await get_redis().hget(SIMILAR_MOVIES_KEY, str(movie_id))
+    if not raw:
+        return []
+    return [(neighbour, score) for neighbour, score in orjson.loads(raw)]
@@ -0,0 +1,292 @@
+import fcntl
+import hashlib
+import os
+import re
+import time
+import uuid
+from contextlib import contextmanager
+from pathlib import Path
+
+import anyio
+from sqlalchemy import func, or_, select
+
+from app import models
+from app.config import settings
+from app.utils import mp4
+
+# Media files are stored under their SHA-256 digest:
+#   movies/ab/ab12...ef.mp4, posters/cd/cd34...90.png
+# so identical uploads share one file. A file is referenced by
+# Movie.file_path / Movie.poster_path / Movie.poster_variants and removed
+# once no row points at it.
+#
+# An upload stores (or deduplicates onto) its file before its row exists,
+# so "no row points at it" is not enough to delete a file. Reusing a file
+# touches a claim file beside it (`.<name>.claim`), under a lock per shard
+# directory; the served file itself is left alone, its mtime being part of
+# its HTTP validators. A file is only deleted, under the same lock, when no
+# row references it and neither it nor its claim changed within
+# MEDIA_GC_GRACE_SECONDS. Files that are still too recent are left to
+# `collect_unreferenced_media` (Celery beat).
+CONTENT_PATH_RE = re.compile(r"^(?P<subdir>[\w-]+)/[0-9a-f]{2}/(?P<digest>[0-9a-f]{64})(\.\w+)?$")
+HASH_CHUNK_SIZE = 1024 * 1024
+
+
+def content_rel_path(subdir: str, digest: str, filename: str) -> str:
+    ext = Path(filename).suffix.lower()
+    return os.path.join(subdir, digest[:2], f"{digest}{ext}")
+
+
+def is_content_addressed(rel_path: str) -> bool:
+    return bool(CONTENT_PATH_RE.match(rel_path))
+
+
+def hash_file(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        while chunk := f.read(HASH_CHUNK_SIZE):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+@contextmanager
+def _shard_lock(full_path: str):
+    """Exclusive lock on the directory holding a content-addressed file."""
+    with open(os.path.join(os.path.dirname(full_path), ".lock"), "a") as f:
+        fcntl.flock(f, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(f, fcntl.LOCK_UN)
+
+
+def _claim_path(full_path: str) -> str:
+    directory, name = os.path.split(full_path)
+    return os.path.join(directory, f".{name}.claim")
+
+
+def _last_claimed(full_path: str) -> float:
+    """When the file was stored or last reused (raises if it is gone)."""
+    stored_at = os.stat(full_path).st_mtime
+    try:
+        return max(stored_at, os.stat(_claim_path(full_path)).st_mtime)
+    except FileNotFoundError:
+        return stored_at
+
+
+def reuse_content(full_path: str) -> bool:
+    """
+    Whether a content-addressed file is already stored. If it is, its claim
+    is refreshed, so it is not collected before the caller's row refers to it.
+    """
+    if not os.path.exists(full_path):
+        return False
+    with _shard_lock(full_path):
+        if not os.path.exists(full_path):
+            return False
+        Path(_claim_path(full_path)).touch()
+    return True
+
+
+def store_content(
+    tmp_path: str,
+    subdir: str,
+    digest: str,
+    filename: str,
+    media_dir: str | None = None,
+    link: bool = False,
+) -> tuple[str, bool]:
+    """
+    Move a fully written temp file to its content address, or drop it if the
+    same content is already stored. With `link` the temp file is hard-linked
+    instead and left in place either way. Returns (relative path, created).
+    """
+    rel_path = content_rel_path(subdir, digest, filename)
+    full_path = os.path.join(media_dir or settings.MEDIA_DIR, rel_path)
+    if reuse_content(full_path):
+        if not link:
+            os.remove(tmp_path)
+        return rel_path, False
+    os.makedirs(os.path.dirname(full_path), exist_ok=True)
+    if not link:
+        os.replace(tmp_path, full_path)
+        return rel_path, True
+    try:
+        os.link(tmp_path, full_path)
+    except FileExistsError:
+        return rel_path, False
+    return rel_path, True
+
+
+def ingest_video(
+    rel_path: str, created: bool, media_dir: str | None = None
+) -> tuple[str, bool, mp4.Mp4Info | None]:
+    """
+    Probe a freshly stored video. An MP4 whose `moov` sits after the media
+    data is rewritten with `moov` first and stored under the new digest.
+
+    Returns (relative path, created, info); info is None for files that are
+    not ISO-BMFF (WebM, Ogg), which are stored as they are.
+    """
+    media_dir = media_dir or settings.MEDIA_DIR
+    full_path = os.path.join(media_dir, rel_path)
+    try:
+        info = mp4.probe(full_path)
+    except mp4.Mp4Error:
+        return rel_path, created, None
+    if info.faststart or info.fragmented:
+        return rel_path, created, info
+
+    tmp_path = os.path.join(os.path.dirname(full_path), f".{uuid.uuid4().hex}.part")
+    try:
+        digest = mp4.faststart(full_path, tmp_path)
+    except BaseException as exc:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        if isinstance(exc, mp4.Mp4Error):
+            # playable as uploaded, just not progressively
+            return rel_path, created, info
+        raise
+    if digest is None:
+        return rel_path, created, info
+    subdir = rel_path.split("/", 1)[0]
+    new_rel_path, new_created = store_content(tmp_path, subdir, digest, rel_path, media_dir)
+    # the original is not referenced by any row, so it is collected later
+    # (an identical upload may have deduplicated onto it meanwhile)
+    info.faststart = True
+    return new_rel_path, new_created, info
+
+
+def movie_media_fields(info: mp4.Mp4Info | None, content_type: str) -> dict:
+    """Movie columns filled from a probe; the upload's type is the fallback."""
+    if info is None:
+        return {"media_type": content_type}
+    return {
+        "media_type": info.media_type,
+        "codecs": ",".join(info.codecs) or None,
+        "width": info.width,
+        "height": info.height,
+        "duration": round(info.duration) if info.duration else None,
+    }
+
+
+def _references_stmt(rel_path: str):
+    return select(func.count(models.Movie.id)).where(
+        or_(models.Movie.file_path == rel_path, models.Movie.poster_path == rel_path)
+    )
+
+
+def remove_media(full_path: str) -> bool:
+    """
+    Delete a media file no movie references. Content-addressed files stored
+    or reused within MEDIA_GC_GRACE_SECONDS are kept for
+    `collect_unreferenced_media`. Returns whether the file is gone.
+    """
+    if not is_content_addressed("/".join(Path(full_path).parts[-3:])):
+        try:
+            os.remove(full_path)
+        except FileNotFoundError:
+            pass
+        return True
+    if not os.path.exists(full_path):
+        return True
+    with _shard_lock(full_path):
+        try:
+            if time.time() - _last_claimed(full_path) < settings.MEDIA_GC_GRACE_SECONDS:
+                return False
+            os.remove(full_path)
+        except FileNotFoundError:
+            pass
+        try:
+            os.remove(_claim_path(full_path))
+        except FileNotFoundError:
+            pass
+    return True
+
+
+def _remove(rel_path: str) -> bool:
+    return remove_media(os.path.join(settings.MEDIA_DIR, rel_path))
+
+
+def release_media_sync(db, *rel_paths: str | None) -> list[str]:
+    """Delete media files no movie references any more (sync session).
+    Returns the paths that were released."""
+    released = []
+    for rel_path in filter(None, rel_paths):
+        if not db.execute(_references_stmt(rel_path)).scalar_one():
+            if _remove(rel_path):
+                released.append(rel_path)
+    return released
+
+
+def variant_paths(variants: dict | None) -> list[str]:
+    """Files of a Movie.poster_variants mapping."""
+    return [path for by_width in (variants or {}).values() for path in by_width.values()]
+
+
+def release_movie_media_sync(db, movie: models.Movie):
+    """
+    Release a deleted movie's video and poster. Poster variants are derived
+    from the poster's content, so they go when the poster itself does.
+    """
+    released = release_media_sync(db, movie.file_path, movie.poster_path)
+    if movie.poster_path and movie.poster_path in released:
+        for rel_path in variant_paths(movie.poster_variants):
+            _remove(rel_path)
+
+
+async def release_media(db, *rel_paths: str | None):
+    """Delete media files no movie references any more (async session)."""
+    for rel_path in filter(None, rel_paths):
+        if not (await db.execute(_references_stmt(rel_path))).scalar_one():
+            await anyio.to_thread.run_sync(_remove, rel_path)
+
+
+def referenced_media(db) -> set[str]:
+    """Every media path some movie row points at."""
+    paths = set()
+    rows = db.execute(
+        select(models.Movie.file_path, models.Movie.poster_path, models.Movie.poster_variants)
+    )
+    for file_path, poster_path, variants in rows:
+        paths.update(filter(None, (file_path, poster_path)))
+        paths.update(variant_paths(variants))
+    return paths
+
+
+def collect_unreferenced_media(db, media_dir: str | None = None) -> int:
+    """
+    Delete the content-addressed files no movie references and nobody has
+    stored or reused within MEDIA_GC_GRACE_SECONDS: files released while
+    still recent, discarded uploads, faststart originals. Returns the count.
+    """
+    media_dir = media_dir or settings.MEDIA_DIR
+    # loaded first: a row written after this refers to a file that was
+    # stored or reused after it too, and so is within the grace period
+    referenced = referenced_media(db)
+    removed = 0
+    for subdir in os.scandir(media_dir):
+        if not subdir.is_dir():
+            continue
+        for shard in os.scandir(subdir.path):
+            if not shard.is_dir():
+                continue
+            for entry in os.scandir(shard.path):
+                rel_path = "/".join((subdir.name, shard.name, entry.name))
+                if is_content_addressed(rel_path) and rel_path not in referenced:
+                    removed += remove_media(entry.path)
+                elif entry.name.startswith(".") and entry.name.endswith(".claim"):
+                    _remove_stale_claim(entry.path)
+    return removed
+
+
+def _remove_stale_claim(claim_path: str):
+    """Drop a claim whose file is gone (e.g. deleted by hand)."""
+    directory, name = os.path.split(claim_path)
+    full_path = os.path.join(directory, name[1 : -len(".claim")])
+    with _shard_lock(full_path):
+        if not os.path.exists(full_path):
+            try:
+                os.remove(claim_path)
+            except FileNotFoundError:
+                pass
@@ -0,0 +1,265 @@
+import hashlib
+import os
+import uuid
+from dataclasses import dataclass, field
+
+import aiofiles
+import anyio
+import magic
+from python_multipart import MultipartParser
+from python_multipart.multipart import parse_options_header
+from starlette.requests import Request
+
+from app.utils.storage import remove_media, store_content
+
+# plain (non-file) form fields are kept in memory, so cap them
+MAX_FIELD_BYTES = 64 * 1024
+# ... and so is the number of parts (fields and files) of one form
+MAX_FORM_PARTS = 32
+# leading bytes of a file part whose content type is sniffed
+SNIFF_BYTES = 4096
+# what libmagic reports for containers it cannot narrow down further
+SNIFFED_ALIASES = {"application/ogg": "video/ogg"}
+
+
+class StreamingUploadError(Exception):
+    def __init__(self, status_code: int, detail: str):
+        super().__init__(detail)
+        self.status_code = status_code
+        self.detail = detail
+
+
+@dataclass
+class FileFieldSpec:
+    """Where and under which constraints a file field of the form is stored."""
+
+    label: str
+    media_dir: str
+    subdir: str
+    allowed_mime: set[str]
+    max_bytes: int | None = None
+
+
+@dataclass
+class SavedFile:
+    filename: str
+    content_type: str
+    rel_path: str
+    full_path: str
+    size: int = 0
+    sha256: str = ""
+    # False when identical content was already stored (deduplicated)
+    created: bool = False
+
+
+@dataclass
+class _Part:
+    name: str = ""
+    filename: str | None = None
+    content_type: str = ""
+    headers: list[tuple[bytes, bytes]] = field(default_factory=list)
+    data: bytearray = field(default_factory=bytearray)
+    saved: SavedFile | None = None
+    spec: FileFieldSpec | None = None
+    out: object = None
+    tmp_path: str = ""
+    digest: object = None
+    discard: bool = False
+    sniffed: bool = False
+
+
+async def parse_streaming_upload(
+    request: Request,
+    file_fields: dict[str, FileFieldSpec],
+    max_body_bytes: int | None = None,
+) -> tuple[dict[str, str], dict[str, SavedFile]]:
+    """
+    Parse a multipart/form-data body while it arrives, writing each file part
+    to its media directory with aiofiles while hashing it. The MIME type and
+    size limits are enforced per chunk so a bad upload is rejected as soon as
+    it is detected: the declared content type when the part starts, the one
+    libmagic sniffs from its first SNIFF_BYTES, and max_body_bytes for the
+    whole body, which chunked requests send without a Content-Length. A
+    finished part is renamed to its content address (see app.utils.storage);
+    if that content is already stored the new copy is dropped.
+
+    Returns (fields, files). Raises StreamingUploadError; files written so far
+    are removed in that case.
+    """
+    content_type, params = parse_options_header(request.headers.get("content-type", ""))
+    if content_type != b"multipart/form-data" or b"boundary" not in params:
+        raise StreamingUploadError(400, "Expected multipart/form-data")
+
+    events: list[tuple[str, bytes]] = []
+    header_field = bytearray()
+    header_value = bytearray()
+
+    def on_part_begin():
+        events.append(("begin", b""))
+
+    def on_part_data(data: bytes, start: int, end: int):
+        events.append(("data", data[start:end]))
+
+    def on_part_end():
+        events.append(("end", b""))
+
+    def on_header_field(data: bytes, start: int, end: int):
+        header_field.extend(data[start:end])
+
+    def on_header_value(data: bytes, start: int, end: int):
+        header_value.extend(data[start:end])
+
+    def on_header_end():
+        events.append(("header", bytes(header_field) + b"\0" + bytes(header_value)))
+        header_field.clear()
+        header_value.clear()
+
+    def on_headers_finished():
+        events.append(("headers_done", b""))
+
+    parser = MultipartParser(
+        params[b"boundary"],
+        {
+            "on_part_begin": on_part_begin,
+            "on_part_data": on_part_data,
+            "on_part_end": on_part_end,
+            "on_header_field": on_header_field,
+            "on_header_value": on_header_value,
+            "on_header_end": on_header_end,
+            "on_headers_finished": on_headers_finished,
+        },
+    )
+
+    fields: dict[str, str] = {}
+    files: dict[str, SavedFile] = {}
+    part = _Part()
+    parts = 0
+    received = 0
+    try:
+        async for chunk in request.stream():
+            received += len(chunk)
+            if max_body_bytes is not None and received > max_body_bytes:
+                raise StreamingUploadError(413, "Request body too large")
+            parser.write(chunk)
+            for kind, payload in events:
+                if kind == "begin":
+                    parts += 1
+                    if parts > MAX_FORM_PARTS:
+                        raise StreamingUploadError(400, "Too many form fields")
+                    part = _Part()
+                elif kind == "header":
+                    name, _, value = payload.partition(b"\0")
+                    part.headers.append((name.lower(), value))
+                elif kind == "headers_done":
+                    await _start_part(part, file_fields, files)
+                elif kind == "data":
+                    await _write_part(part, payload)
+                elif kind == "end":
+                    if part.out is not None:
+                        await _finish_part(part)
+                    elif part.saved is None and not part.discard:
+                        fields[part.name] = part.data.decode("utf-8", errors="replace")
+            events.clear()
+        parser.finalize()
+        if part.out is not None:
+            raise StreamingUploadError(400, "Incomplete multipart body")
+    except BaseException:
+        if part.out is not None:
+            await part.out.close()
+            _remove_quietly(part.tmp_path)
+        discard_saved_files(files)
+        raise
+    return fields, files
+
+
+def discard_saved_files(files: dict[str, SavedFile]):
+    """
+    Release files written by this upload, keeping deduplicated content. Until
+    the grace period is over another upload may have deduplicated onto them,
+    so they are usually left to `collect_unreferenced_media`.
+    """
+    for saved in files.values():
+        if saved.created:
+            remove_media(saved.full_path)
+
+
+def _remove_quietly(path: str):
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+
+
+async def _start_part(part: _Part, file_fields: dict, files: dict):
+    for name, value in part.headers:
+        if name == b"content-disposition":
+            _, options = parse_options_header(value)
+            part.name = options.get(b"name", b"").decode("utf-8", errors="replace")
+            if b"filename" in options:
+                part.filename = options[b"filename"].decode("utf-8", errors="replace")
+        elif name == b"content-type":
+            part.content_type = value.decode("latin-1").strip()
+
+    if part.filename is None:
+        return
+    if not part.filename:
+        # browsers send an empty file part for an unselected optional input
+        part.discard = True
+        return
+    spec = file_fields.get(part.name)
+    if spec is None:
+        raise StreamingUploadError(400, f"Unexpected file field: {part.name}")
+    if part.name in files:
+        raise StreamingUploadError(400, f"Duplicate file field: {part.name}")
+    if part.content_type not in spec.allowed_mime:
+        raise StreamingUploadError(
+            400, f"Invalid {spec.label} content-type: {part.content_type}"
+        )
+    os.makedirs(os.path.join(spec.media_dir, spec.subdir), exist_ok=True)
+    part.tmp_path = os.path.join(spec.media_dir, spec.subdir, f".{uuid.uuid4().hex}.part")
+    part.saved = SavedFile(part.filename, part.content_type, "", "")
+    part.spec = spec
+    files[part.name] = part.saved
+    part.digest = hashlib.sha256()
+    part.out = await aiofiles.open(part.tmp_path, "wb")
+
+
+def _sniff(part: _Part, head: bytes):
+    part.sniffed = True
+    sniffed = magic.from_buffer(head, mime=True)
+    if SNIFFED_ALIASES.get(sniffed, sniffed) not in part.spec.allowed_mime:
+        raise StreamingUploadError(400, f"Invalid {part.spec.label} content: {sniffed}")
+
+
+async def _finish_part(part: _Part):
+    if not part.sniffed:
+        _sniff(part, bytes(part.data))
+    await part.out.close()
+    part.out = None
+    saved, spec = part.saved, part.spec
+    saved.sha256 = part.digest.hexdigest()
+    saved.rel_path, saved.created = await anyio.to_thread.run_sync(
+        store_content, part.tmp_path, spec.subdir, saved.sha256, saved.filename, spec.media_dir
+    )
+    saved.full_path = os.path.join(spec.media_dir, saved.rel_path)
+
+
+async def _write_part(part: _Part, data: bytes):
+    if part.discard:
+        return
+    if part.saved is None:
+        if len(part.data) + len(data) > MAX_FIELD_BYTES:
+            raise StreamingUploadError(413, f"Form field too large: {part.name}")
+        part.data.extend(data)
+        return
+    part.saved.size += len(data)
+    max_bytes = part.spec.max_bytes
+    if max_bytes is not None and part.saved.size > max_bytes:
+        raise StreamingUploadError(413, f"{part.spec.label.capitalize()} file too large")
+    if not part.sniffed:
+        # file parts buffer only their head, to sniff it before going on
+        part.data.extend(data[: SNIFF_BYTES - len(part.data)])
+        if len(part.data) >= SNIFF_BYTES:
+            _sniff(part, bytes(part.data))
+    part.digest.update(data)
+    await part.out.write(data)
@@ -0,0 +1,97 @@
+import time
+
+import redis
+from app.utils.redis_pool import get_redis, register_script
+
+# Trending scores: playback starts decayed exponentially, one sorted set per
+# window, the window being the half-life of a play. Instead of decaying every
+# member over time, each new play is added with weight 2^((now - landmark) /
+# half_life), so a play counts for more the later it happens and the ranking
+# is that of the decayed counts: a play is one ZINCRBY, O(log n). Scores are
+# relative to the landmark; `rescale_trending` (Celery beat) moves it to now,
+# which keeps the weights from overflowing and trims the long tail.
+
+TRENDING_WINDOWS = {"hour": 60 * 60, "day": 24 * 60 * 60}
+# each window keeps this many movies when rescaled
+TRENDING_MAX_MOVIES = 10_000
+# movies whose decayed score falls under this many plays are dropped
+TRENDING_MIN_SCORE = 0.01
+RESCALE_INTERVAL_SECONDS = 10 * 60
+
+
+def trending_key(window: str) -> str:
+    return f"trending:{window}"
+
+
+def landmark_key(window: str) -> str:
+    return f"trending:{window}:landmark"
+
+
+# KEYS: (scores, landmark) per window; ARGV: movie id, now, half-life per window
+_RECORD_PLAY_LUA = """
+local now = tonumber(ARGV[2])
+for i = 1, #KEYS, 2 do
+    local landmark = tonumber(redis.call('GET', KEYS[i + 1]))
+    if not landmark then
+        landmark = now
+        redis.call('SET', KEYS[i + 1], now)
+    end
+    local half_life = tonumber(ARGV[3 + (i - 1) / 2])
+    redis.call('ZINCRBY', KEYS[i], 2 ^ ((now - landmark) / half_life), ARGV[1])
+end
+return 1
+"""
+_record_play = register_script(_RECORD_PLAY_LUA)
+
+_RESCALE_LUA = """
+local landmark = tonumber(redis.call('GET', KEYS[2]))
+if not landmark then
+    return 0
+end
+local now, half_life = tonumber(ARGV[1]), tonumber(ARGV[2])
+local factor = 2 ^ (-(now - landmark) / half_life)
+redis.call('ZUNIONSTORE', KEYS[1], 1, KEYS[1], 'WEIGHTS', factor)
+redis.call('SET', KEYS[2], now)
+redis.call('ZREMRANGEBYSCORE', KEYS[1], '-inf', '(' .. ARGV[4])
+redis.call('ZREMRANGEBYRANK', KEYS[1], 0, -(tonumber(ARGV[3]) + 1))
+return redis.call('ZCARD', KEYS[1])
+"""
+
+
+async def record_play(movie_id: int):
+    """Count a playback start in every trending window (single round trip)."""
+    keys, half_lives = [], []
+    for window, half_life in TRENDING_WINDOWS.items():
+        keys += [trending_key(window), landmark_key(window)]
+        half_lives.append(half_life)
+    await _record_play(
+        keys=keys, args=[movie_id, time.time(), *half_lives], client=get_redis()
+    )
+
+
+async def top_trending(window: str, limit: int) -> list[tuple[int, float]]:
+    """
+    The `limit` highest-scored movies of `window` as (movie id, score), the
+    score being the number of plays decayed to now.
+    """
+    pipe = get_redis().pipeline(transaction=False)
+    pipe.get(landmark_key(window))
+    pipe.zrevrange(trending_key(window), 0, limit - 1, withscores=True)
+    landmark, rows = await pipe.execute()
+    if landmark is None:
+        return []
+    decay = 2 ** (-(time.time() - float(landmark)) / TRENDING_WINDOWS[window])
+    return [(int(movie_id), score * decay) for movie_id, score in rows]
+
+
+def rescale_trending(client: redis.Redis) -> dict[str, int]:
+    """Move every window's landmark to now and trim it; returns the sizes."""
+    script = client.register_script(_RESCALE_LUA)
+    now = time.time()
+    return {
+        window: script(
+            keys=[trending_key(window), landmark_key(window)],
+            args=[now, half_life, TRENDING_MAX_MOVIES, TRENDING_MIN_SCORE],
+        )
+        for window, half_life in TRENDING_WINDOWS.items()
+    }
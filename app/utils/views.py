@@ -0,0 +1,167 @@
+import time
+import uuid
+from datetime import datetime, timezone
+import redis
+from app.config import settings
+from app.utils.redis_pool import get_redis, register_script
+
+PENDING_KEY = "views:pending"
+# "user_id:movie_id:unix time" per playback start, persisted to watch_events
+WATCH_EVENTS_KEY = "watch:events"
+
+# One view per playback session: the session key is (re)armed on every
+# request of the playback, so a player's Range requests never count twice,
+# and only a new playback after VIEW_SESSION_TTL_SECONDS of idleness counts.
+# A counted view is also logged as a watch event.
+_RECORD_VIEW_LUA = """
+if redis.call('SET', KEYS[1], 1, 'NX', 'EX', ARGV[1]) then
+    redis.call('HINCRBY', KEYS[2], ARGV[2], 1)
+    redis.call('RPUSH', KEYS[3], ARGV[3])
+    return 1
+end
+redis.call('EXPIRE', KEYS[1], ARGV[1])
+return 0
+"""
+_record_view = register_script(_RECORD_VIEW_LUA)
+
+
+async def record_view(movie_id: int, user_id: int) -> bool:
+    """
+    Buffer a view in Redis (single round trip).
+    Returns True when this request started a new playback session.
+    """
+    added = await _record_view(
+        keys=[f"views:session:{movie_id}:{user_id}", PENDING_KEY, WATCH_EVENTS_KEY],
+        args=[
+            settings.VIEW_SESSION_TTL_SECONDS,
+            movie_id,
+            f"{user_id}:{movie_id}:{int(time.time())}",
+        ],
+        client=get_redis(),
+    )
+    return bool(added)
+
+
+# Flushes take a buffer out of the way of new writes by renaming it to a
+# flushing key, persist it, then ack (delete) the key, or restore it into the
+# buffer on failure. Flushing keys are registered, at the rename, in a
+# sorted set by drain time; a flush first restores the keys of flushes that
+# died before acking or restoring (registered FLUSH_ORPHAN_SECONDS ago,
+# far longer than any flush takes). One that died between its commit and its
+# ack is replayed too: flushes are at least once, never lost.
+FLUSH_ORPHAN_SECONDS = 15 * 60
+
+# KEYS: buffer, flushing key, registry; ARGV: now -> 1 if anything was taken
+_DRAIN_LUA = """
+if redis.call('EXISTS', KEYS[1]) == 0 then
+    return 0
+end
+redis.call('RENAME', KEYS[1], KEYS[2])
+redis.call('ZADD', KEYS[3], ARGV[1], KEYS[2])
+return 1
+"""
+
+# KEYS: flushing key, buffer, registry
+_RESTORE_VIEWS_LUA = """
+local counts = redis.call('HGETALL', KEYS[1])
+for i = 1, #counts, 2 do
+    redis.call('HINCRBY', KEYS[2], counts[i], counts[i + 1])
+end
+redis.call('DEL', KEYS[1])
+redis.call('ZREM', KEYS[3], KEYS[1])
+return #counts / 2
+"""
+
+# KEYS: flushing key, buffer, registry; drained events go back in front
+_RESTORE_EVENTS_LUA = """
+local entries = redis.call('LRANGE', KEYS[1], 0, -1)
+for i = #entries, 1, -1 do
+    redis.call('LPUSH', KEYS[2], entries[i])
+end
+redis.call('DEL', KEYS[1])
+redis.call('ZREM', KEYS[3], KEYS[1])
+return #entries
+"""
+
+
+def drain_registry_key(flushing_key: str) -> str:
+    """"views:flushing:<id>" -> "views:flushing"."""
+    return flushing_key.rsplit(":", 1)[0]
+
+
+def start_drain(
+    client: redis.Redis, buffer_key: str, prefix: str, restore
+) -> str | None:
+    """
+    Restore the orphaned flushing keys of `prefix` with `restore(client,
+    key)`, then rename `buffer_key` to a new registered flushing key and
+    return it (None when nothing is buffered).
+    """
+    registry_key = f"{prefix}:flushing"
+    now = time.time()
+    for orphan in client.zrangebyscore(registry_key, "-inf", now - FLUSH_ORPHAN_SECONDS):
+        restore(client, orphan)
+    flushing_key = f"{registry_key}:{uuid.uuid4().hex}"
+    taken = client.register_script(_DRAIN_LUA)(
+        keys=[buffer_key, flushing_key, registry_key], args=[now]
+    )
+    return flushing_key if taken else None
+
+
+def ack_drained(client: redis.Redis, flushing_key: str):
+    """Drop a flushing key (views, watch events, progress) once persisted."""
+    pipe = client.pipeline()
+    pipe.delete(flushing_key)
+    pipe.zrem(drain_registry_key(flushing_key), flushing_key)
+    pipe.execute()
+
+
+def drain_pending_views(client: redis.Redis) -> tuple[str | None, dict[int, int]]:
+    """
+    Atomically take the buffered counts out of the way of new views.
+    Returns the key now holding them (pass it to `ack_drained` once
+    persisted, or `restore_drained_views` on failure) and the counts.
+    """
+    flushing_key = start_drain(client, PENDING_KEY, "views", restore_drained_views)
+    if flushing_key is None:
+        # nothing buffered since the last flush
+        return None, {}
+    counts = client.hgetall(flushing_key)
+    return flushing_key, {int(k): int(v) for k, v in counts.items()}
+
+
+def restore_drained_views(client: redis.Redis, flushing_key: str):
+    """Put counts back into the pending buffer so the next flush retries them."""
+    client.register_script(_RESTORE_VIEWS_LUA)(
+        keys=[flushing_key, PENDING_KEY, drain_registry_key(flushing_key)]
+    )
+
+
+def drain_watch_events(client: redis.Redis) -> tuple[str | None, list[dict]]:
+    """
+    Like `drain_pending_views`, for the watch event log: returns the key now
+    holding the events and the events as watch_events rows.
+    """
+    flushing_key = start_drain(
+        client, WATCH_EVENTS_KEY, "watch", restore_drained_watch_events
+    )
+    if flushing_key is None:
+        return None, []
+    events = []
+    for entry in client.lrange(flushing_key, 0, -1):
+        user_id, movie_id, timestamp = entry.split(":")
+        events.append(
+            {
+                "user_id": int(user_id),
+                "movie_id": int(movie_id),
+                "watched_at": datetime.fromtimestamp(int(timestamp), timezone.utc),
+            }
+        )
+    return flushing_key, events
+
+
+def restore_drained_watch_events(client: redis.Redis, flushing_key: str):
+    """Put drained events back in front of the log for the next flush."""
+    client.register_script(_RESTORE_EVENTS_LUA)(
+        keys=[flushing_key, WATCH_EVENTS_KEY, drain_registry_key(flushing_key)]
+    )
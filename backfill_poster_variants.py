@@ -0,0 +1,56 @@
+"""
+Script to generate resized poster renditions for existing movies.
+By default only movies with a poster but no variants are processed; run it
+again with --force after changing POSTER_VARIANT_WIDTHS or POSTER_AVIF.
+
+Usage:
+    python backfill_poster_variants.py [--force] [--enqueue]
+
+    --enqueue   hand each movie to the Celery worker instead of rendering here
+"""
+
+import argparse
+
+from sqlalchemy import select
+
+from app.database import SessionLocal
+from app.models import Movie
+from app.tasks.celery import generate_poster_variants_task
+
+
+def backfill(force: bool = False, enqueue: bool = False):
+    db = SessionLocal()
+    try:
+        stmt = select(Movie.id).where(Movie.poster_path.is_not(None)).order_by(Movie.id)
+        if not force:
+            stmt = stmt.where(Movie.poster_variants.is_(None))
+        movie_ids = db.execute(stmt).scalars().all()
+    finally:
+        db.close()
+
+    failed = 0
+    for movie_id in movie_ids:
+        if enqueue:
+            generate_poster_variants_task.delay(movie_id)
+            print(f"→ movie {movie_id} queued")
+            continue
+        variants = generate_poster_variants_task(movie_id)
+        if variants is None:
+            failed += 1
+            print(f"⚠️  movie {movie_id}: poster could not be read")
+        else:
+            print(f"✓ movie {movie_id}: {', '.join(sorted(variants))}")
+
+    print(f"\n✓ {len(movie_ids) - failed} of {len(movie_ids)} movies processed")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Backfill poster variants")
+    parser.add_argument("--force", action="store_true", help="re-render existing variants")
+    parser.add_argument("--enqueue", action="store_true", help="use the Celery worker")
+    args = parser.parse_args()
+
+    print("=" * 50)
+    print("AuraFlix - Poster variant backfill")
+    print("=" * 50)
+    backfill(force=args.force, enqueue=args.enqueue)
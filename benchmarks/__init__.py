@@ -0,0 +1,4 @@
+"""
+End-to-end benchmarks: boot `app.main:app` against local stand-ins and drive
+concurrent scenarios over HTTP. See `python -m benchmarks.run --help`.
+"""
@@ -0,0 +1,307 @@
+"""
+Run the end-to-end benchmarks and write a JSON report.
+
+Boots `benchmarks.server` (SQLite + fakeredis + stub SMTP unless a database
+or Redis URL is given), logs the seeded accounts in and drives each
+scenario over HTTP. The report holds throughput, p50/p90/p99 latency,
+server memory and CPU per scenario, plus the commit it ran against; pass
+an earlier report to --compare to print the change. --stream-impl legacy
+or zerocopy reruns the stream scenarios against the pre-zero-copy
+iter_file response or a server offering the zero-copy extensions.
+
+Usage:
+    python -m benchmarks.run [--scenarios login,verify,catalog,catalog-1000,stream,
+                                          ttff-faststart,ttff-moov-at-end,upload]
+                             [--concurrency 32] [--duration 15]
+                             [--database-url postgresql://...] [--redis-url redis://...]
+                             [--upload-mb 1024] [--uploads 2]
+                             [--range-mb 1] [--stream-impl media|zerocopy|legacy]
+                             [--output report.json] [--compare baseline.json]
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timezone
+
+import httpx
+
+from benchmarks.scenarios import SCENARIOS, Context, Recorder, login
+from benchmarks.server import BENCH_ADMIN_EMAIL, free_port, mail_dir, user_email
+from benchmarks.streaming import STREAM_IMPLS
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+STARTUP_TIMEOUT = 120
+MEMORY_SAMPLE_SECONDS = 0.1
+
+
+def git_commit() -> str | None:
+    try:
+        return subprocess.run(
+            ["git", "describe", "--always", "--dirty"],
+            cwd=ROOT, capture_output=True, text=True, check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def rss_mib(pid: int) -> float | None:
+    """Resident set size of `pid` (Linux /proc; None elsewhere)."""
+    try:
+        with open(f"/proc/{pid}/status") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        return None
+    return None
+
+
+def cpu_seconds(pid: int) -> float | None:
+    """User + system CPU time of `pid` (Linux /proc; None elsewhere)."""
+    try:
+        with open(f"/proc/{pid}/stat") as f:
+            # fields after the parenthesised command name, which may hold spaces
+            fields = f.read().rsplit(")", 1)[1].split()
+    except OSError:
+        return None
+    return (int(fields[11]) + int(fields[12])) / os.sysconf("SC_CLK_TCK")
+
+
+def percentile(sorted_values: list[float], pct: float) -> float:
+    """Nearest-rank percentile of an ascending list."""
+    index = max(0, min(len(sorted_values) - 1, round(pct / 100 * len(sorted_values)) - 1))
+    return sorted_values[index]
+
+
+def latency_summary(samples: list[float]) -> dict | None:
+    if not samples:
+        return None
+    values = sorted(samples)
+    return {
+        "mean_ms": round(sum(values) / len(values) * 1000, 3),
+        **{f"p{p}_ms": round(percentile(values, p) * 1000, 3) for p in (50, 90, 99)},
+        "max_ms": round(values[-1] * 1000, 3),
+    }
+
+
+def summarize(rec: Recorder, memory: list[float]) -> dict:
+    elapsed = rec.elapsed or 1e-9
+    return {
+        "requests": len(rec.latencies),
+        "errors": rec.errors,
+        "elapsed_s": round(rec.elapsed, 3),
+        "throughput_rps": round(len(rec.latencies) / elapsed, 2),
+        "throughput_mib_s": round(rec.bytes / elapsed / 2**20, 2),
+        "latency": latency_summary(rec.latencies),
+        "first_byte": latency_summary(rec.first_byte),
+        # scenarios whose steps make several requests (a playback start)
+        "per_step": {
+            "http_requests": round(rec.http_requests / len(rec.latencies), 2),
+            "kib": round(rec.bytes / len(rec.latencies) / 1024, 1),
+        }
+        if rec.http_requests and rec.latencies
+        else None,
+        "server_cpu": {
+            "seconds": round(rec.server_cpu_s, 2),
+            "s_per_gib": round(rec.server_cpu_s / (rec.bytes / 2**30), 2) if rec.bytes else None,
+        }
+        if rec.server_cpu_s is not None
+        else None,
+        "server_rss_mib": {
+            "start": round(memory[0], 1),
+            "end": round(memory[-1], 1),
+            "peak": round(max(memory), 1),
+        }
+        if memory
+        else None,
+    }
+
+
+async def sample_memory(pid: int, samples: list[float]):
+    while True:
+        if (value := rss_mib(pid)) is not None:
+            samples.append(value)
+        await asyncio.sleep(MEMORY_SAMPLE_SECONDS)
+
+
+async def wait_ready(client: httpx.AsyncClient, server: subprocess.Popen):
+    deadline = time.monotonic() + STARTUP_TIMEOUT
+    while time.monotonic() < deadline:
+        if server.poll() is not None:
+            raise RuntimeError(f"benchmark server exited with {server.returncode}")
+        try:
+            if (await client.get("/")).status_code == 200:
+                return
+        except httpx.TransportError:
+            pass
+        await asyncio.sleep(0.2)
+    raise RuntimeError("benchmark server did not start in time")
+
+
+async def run(args, server: subprocess.Popen, base_url: str, workdir: str) -> dict:
+    limits = httpx.Limits(max_connections=max(args.concurrency, args.uploads) + 4)
+    timeout = httpx.Timeout(args.request_timeout)
+    results = {}
+    async with httpx.AsyncClient(base_url=base_url, limits=limits, timeout=timeout) as client:
+        await wait_ready(client, server)
+        tokens = [await login(client, user_email(i)) for i in range(args.users)]
+        ctx = Context(
+            client=client,
+            tokens=tokens,
+            admin_token=await login(client, BENCH_ADMIN_EMAIL),
+            concurrency=args.concurrency,
+            duration=args.duration,
+            warmup=args.warmup,
+            page_size=args.page_size,
+            fields=args.fields,
+            stream_bytes=args.stream_mb * 2**20,
+            range_bytes=args.range_mb * 2**20,
+            uploads=args.uploads,
+            upload_bytes=args.upload_mb * 2**20,
+            mail_dir=mail_dir(workdir),
+            faststart_movie_id=args.movies + 1,
+            server_cpu=lambda: cpu_seconds(server.pid),
+        )
+        for name in args.scenarios:
+            print(f"→ {name}")
+            memory: list[float] = []
+            sampler = asyncio.create_task(sample_memory(server.pid, memory))
+            try:
+                recorder = await SCENARIOS[name](ctx)
+            finally:
+                sampler.cancel()
+            results[name] = summary = summarize(recorder, memory)
+            latency = summary["latency"] or {}
+            print(
+                f"✓ {summary['requests']} ok, {sum(recorder.errors.values())} errors, "
+                f"{summary['throughput_rps']} req/s, {summary['throughput_mib_s']} MiB/s, "
+                f"p50 {latency.get('p50_ms')} ms, p99 {latency.get('p99_ms')} ms"
+            )
+    return results
+
+
+def compare(report: dict, baseline: dict):
+    """Print each headline metric next to the baseline's."""
+    impl = baseline["meta"]["args"].get("stream_impl", "media")
+    print(
+        f"\nvs {baseline['meta'].get('commit')} ({baseline['meta'].get('started_at')}, "
+        f"stream impl {impl})"
+    )
+    for name, current in report["scenarios"].items():
+        previous = baseline["scenarios"].get(name)
+        if not previous:
+            continue
+        for label, path in (
+            ("req/s", ("throughput_rps",)),
+            ("MiB/s", ("throughput_mib_s",)),
+            ("p50 ms", ("latency", "p50_ms")),
+            ("p99 ms", ("latency", "p99_ms")),
+            ("peak RSS MiB", ("server_rss_mib", "peak")),
+            ("CPU s/GiB", ("server_cpu", "s_per_gib")),
+            ("requests/step", ("per_step", "http_requests")),
+            ("KiB/step", ("per_step", "kib")),
+        ):
+            new, old = current, previous
+            for key in path:
+                new = (new or {}).get(key)
+                old = (old or {}).get(key)
+            if new is None or old is None:
+                continue
+            change = f"{(new - old) / old * 100:+.1f}%" if old else "n/a"
+            print(f"  {name:<16} {label:<13} {old:>10} -> {new:<10} {change}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="AuraFlix end-to-end benchmarks")
+    parser.add_argument(
+        "--scenarios",
+        default="login,verify,catalog,catalog-1000,stream,ttff-faststart,ttff-moov-at-end,upload",
+    )
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--duration", type=float, default=15.0, help="seconds per scenario")
+    parser.add_argument("--warmup", type=float, default=2.0, help="unmeasured seconds first")
+    parser.add_argument("--users", type=int, default=64)
+    parser.add_argument("--movies", type=int, default=2000)
+    parser.add_argument("--page-size", type=int, default=50)
+    parser.add_argument("--fields", default=None, help="sparse fieldset for catalog pages")
+    parser.add_argument("--stream-mb", type=int, default=256)
+    parser.add_argument("--range-mb", type=int, default=1, help="bytes per stream read")
+    parser.add_argument(
+        "--stream-impl", choices=STREAM_IMPLS, default="media",
+        help="how the server sends streams (see benchmarks.streaming)",
+    )
+    parser.add_argument("--upload-mb", type=int, default=1024)
+    parser.add_argument("--uploads", type=int, default=2, help="concurrent uploads")
+    parser.add_argument("--request-timeout", type=float, default=600.0)
+    parser.add_argument("--database-url", default="", help="empty database to seed")
+    parser.add_argument("--redis-url", default="", help="default: in-process fakeredis")
+    parser.add_argument("--workdir", default=None, help="default: a temporary directory")
+    parser.add_argument("--output", default=None)
+    parser.add_argument("--compare", default=None, help="earlier report to diff against")
+    args = parser.parse_args()
+    args.scenarios = [name.strip() for name in args.scenarios.split(",") if name.strip()]
+    unknown = set(args.scenarios) - set(SCENARIOS)
+    if unknown:
+        parser.error(f"unknown scenarios: {', '.join(sorted(unknown))}")
+
+    print("=" * 50)
+    print("AuraFlix - Benchmarks")
+    print("=" * 50)
+
+    workdir = args.workdir or tempfile.mkdtemp(prefix="auraflix-bench-")
+    port = free_port()
+    started_at = datetime.now(timezone.utc).isoformat(timespec="seconds")
+    server = subprocess.Popen(
+        [
+            sys.executable, "-m", "benchmarks.server",
+            "--port", str(port),
+            "--workdir", workdir,
+            "--database-url", args.database_url,
+            "--redis-url", args.redis_url,
+            "--users", str(args.users),
+            "--movies", str(args.movies),
+            "--stream-mb", str(args.stream_mb),
+            "--stream-impl", args.stream_impl,
+        ],
+        cwd=ROOT,
+    )
+    try:
+        scenarios = asyncio.run(run(args, server, f"http://127.0.0.1:{port}", workdir))
+    finally:
+        server.terminate()
+        server.wait(timeout=30)
+
+    report = {
+        "meta": {
+            "commit": git_commit(),
+            "started_at": started_at,
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpus": os.cpu_count(),
+            "database": "external" if args.database_url else "sqlite",
+            "redis": "external" if args.redis_url else "fakeredis",
+            "args": {k: v for k, v in vars(args).items() if k not in ("output", "compare", "database_url", "redis_url")},
+        },
+        "scenarios": scenarios,
+    }
+    output = args.output or os.path.join(
+        workdir, f"bench-{report['meta']['commit'] or 'unknown'}-{int(time.time())}.json"
+    )
+    with open(output, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"\n✓ Report written to {output}")
+
+    if args.compare:
+        with open(args.compare) as f:
+            compare(report, json.load(f))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,396 @@
+"""
+Concurrent scenarios. Each one returns a Recorder; request-loop scenarios
+run `concurrency` workers until the deadline, the upload scenario sends a
+fixed number of bodies at once.
+"""
+
+import asyncio
+import os
+import random
+import struct
+import time
+import uuid
+from dataclasses import dataclass, field
+from typing import Awaitable, Callable
+
+import httpx
+
+from app.utils import mp4
+
+from benchmarks.server import BENCH_PASSWORD, user_email
+
+RANGE_BYTES = 1024 * 1024
+UPLOAD_BLOCK = 1024 * 1024
+# rows per step of the catalog-1000 scenario, and the API's cap on `limit`
+CATALOG_ROWS = 1000
+MAX_PAGE_SIZE = 200
+
+
+@dataclass
+class Recorder:
+    latencies: list[float] = field(default_factory=list)
+    # time to the first response byte, where the scenario measures it
+    first_byte: list[float] = field(default_factory=list)
+    errors: dict[str, int] = field(default_factory=dict)
+    bytes: int = 0
+    elapsed: float = 0.0
+    # HTTP requests made, where a step makes several
+    http_requests: int = 0
+    # CPU seconds the server spent while measured, where it can be read
+    server_cpu_s: float | None = None
+
+    def error(self, kind: str):
+        self.errors[kind] = self.errors.get(kind, 0) + 1
+
+
+@dataclass
+class Context:
+    client: httpx.AsyncClient
+    tokens: list[str]
+    admin_token: str
+    concurrency: int
+    duration: float
+    warmup: float
+    page_size: int = 50
+    fields: str | None = None
+    stream_bytes: int = 0
+    range_bytes: int = RANGE_BYTES
+    uploads: int = 1
+    upload_bytes: int = 0
+    movie_id: int = 1
+    faststart_movie_id: int = 2
+    # where the benchmark server's SMTP sink leaves mailed codes
+    mail_dir: str = ""
+    # the server's CPU seconds so far (None where unreadable)
+    server_cpu: Callable[[], float | None] = lambda: None
+
+
+def auth(token: str) -> dict[str, str]:
+    return {"Authorization": f"Bearer {token}"}
+
+
+async def login(client: httpx.AsyncClient, email: str) -> str:
+    response = await client.post(
+        "/api/v1/auth/login", data={"username": email, "password": BENCH_PASSWORD}
+    )
+    response.raise_for_status()
+    return response.json()["access_token"]
+
+
+async def _run_workers(ctx: Context, step) -> Recorder:
+    """Run `step(worker, recorder)` in `concurrency` loops: warmup, then measure."""
+    recorder = Recorder()
+
+    async def loop(worker: int, until: float, rec: Recorder):
+        while time.perf_counter() < until:
+            start = time.perf_counter()
+            try:
+                ok = await step(worker, rec)
+            except httpx.HTTPError as exc:
+                rec.error(type(exc).__name__)
+                continue
+            if ok:
+                rec.latencies.append(time.perf_counter() - start)
+
+    for rec, seconds in ((Recorder(), ctx.warmup), (recorder, ctx.duration)):
+        if seconds <= 0:
+            continue
+        cpu = ctx.server_cpu()
+        start = time.perf_counter()
+        until = start + seconds
+        await asyncio.gather(*(loop(w, until, rec) for w in range(ctx.concurrency)))
+        rec.elapsed = time.perf_counter() - start
+        if cpu is not None and (now := ctx.server_cpu()) is not None:
+            rec.server_cpu_s = now - cpu
+    return recorder
+
+
+def _check(response: httpx.Response, rec: Recorder, expected: int = 200) -> bool:
+    if response.status_code != expected:
+        rec.error(f"http_{response.status_code}")
+        return False
+    return True
+
+
+async def login_storm(ctx: Context) -> Recorder:
+    """Every worker logs its own account in, over and over (Argon2 verify)."""
+    users = len(ctx.tokens)
+
+    async def step(worker: int, rec: Recorder) -> bool:
+        response = await ctx.client.post(
+            "/api/v1/auth/login",
+            data={"username": user_email(worker % users), "password": BENCH_PASSWORD},
+        )
+        return _check(response, rec)
+
+    return await _run_workers(ctx, step)
+
+
+async def code_flow(ctx: Context) -> Recorder:
+    """
+    Each worker requests a new verification code for its account, reads it
+    from the SMTP sink and verifies it: the resend/verify round trips plus
+    the email task. Workers share accounts when concurrency > users.
+    """
+    users = len(ctx.tokens)
+
+    async def step(worker: int, rec: Recorder) -> bool:
+        email = user_email(worker % users)
+        response = await ctx.client.post("/api/v1/auth/resend-code", params={"email": email})
+        if not _check(response, rec):
+            return False
+        with open(os.path.join(ctx.mail_dir, email)) as f:
+            code = f.read()
+        response = await ctx.client.post(
+            "/api/v1/auth/verify", params={"email": email, "code": code}
+        )
+        return _check(response, rec)
+
+    return await _run_workers(ctx, step)
+
+
+async def catalog_paging(ctx: Context) -> Recorder:
+    """Each worker walks the whole catalog page by page, then starts over."""
+    cursors: dict[int, str | None] = {}
+
+    async def step(worker: int, rec: Recorder) -> bool:
+        params = {"limit": ctx.page_size}
+        if ctx.fields:
+            params["fields"] = ctx.fields
+        if cursors.get(worker):
+            params["cursor"] = cursors[worker]
+        response = await ctx.client.get(
+            "/api/v1/movies/",
+            params=params,
+            headers=auth(ctx.tokens[worker % len(ctx.tokens)]),
+        )
+        if not _check(response, rec):
+            return False
+        rec.bytes += len(response.content)
+        cursors[worker] = response.json()["next_cursor"]
+        return True
+
+    return await _run_workers(ctx, step)
+
+
+async def catalog_rows(ctx: Context) -> Recorder:
+    """
+    Each step reads the first CATALOG_ROWS movies, MAX_PAGE_SIZE per page; a
+    step's latency is the time to serialize and transfer all of them.
+    """
+
+    async def step(worker: int, rec: Recorder) -> bool:
+        params = {"limit": MAX_PAGE_SIZE}
+        if ctx.fields:
+            params["fields"] = ctx.fields
+        rows = 0
+        while rows < CATALOG_ROWS:
+            response = await ctx.client.get(
+                "/api/v1/movies/",
+                params=params,
+                headers=auth(ctx.tokens[worker % len(ctx.tokens)]),
+            )
+            if not _check(response, rec):
+                return False
+            rec.bytes += len(response.content)
+            page = response.json()
+            rows += len(page["items"])
+            if not page["next_cursor"]:
+                break
+            params["cursor"] = page["next_cursor"]
+        return True
+
+    return await _run_workers(ctx, step)
+
+
+async def range_streaming(ctx: Context) -> Recorder:
+    """Parallel Range reads (1 MiB by default) at random offsets of one seeded video."""
+    last_start = max(ctx.stream_bytes - ctx.range_bytes, 0)
+    url = f"/api/v1/movies/{ctx.movie_id}/stream"
+
+    async def step(worker: int, rec: Recorder) -> bool:
+        offset = random.randint(0, last_start)
+        headers = auth(ctx.tokens[worker % len(ctx.tokens)])
+        headers["Range"] = f"bytes={offset}-{offset + ctx.range_bytes - 1}"
+        start = time.perf_counter()
+        async with ctx.client.stream("GET", url, headers=headers) as response:
+            if not _check(response, rec, expected=206):
+                await response.aread()
+                return False
+            first = True
+            async for chunk in response.aiter_raw():
+                if first:
+                    rec.first_byte.append(time.perf_counter() - start)
+                    first = False
+                rec.bytes += len(chunk)
+        return True
+
+    return await _run_workers(ctx, step)
+
+
+class _Player:
+    """
+    The start of a progressive MP4 playback as a browser does it: read from
+    offset 0 walking the top-level boxes, jump past `mdat` while `moov` has
+    not been seen, then read the first video sample. Each read is an
+    open-ended Range request, dropped as soon as the player wants another
+    offset; playback can start once `moov` and the first sample are in.
+    """
+
+    def __init__(self, ctx: Context, movie_id: int, rec: Recorder, token: str):
+        self.ctx = ctx
+        self.url = f"/api/v1/movies/{movie_id}/stream"
+        self.rec = rec
+        self.headers = auth(token)
+        self.next_box = 0
+        self.first_sample: tuple[int, int] | None = None
+
+    async def start(self):
+        """Read until playback can start."""
+        offset = 0
+        while True:
+            offset = await self._read(offset)
+            if offset is None:
+                return
+
+    async def _read(self, offset: int) -> int | None:
+        """Stream from `offset` until playback can start (None) or the player
+        wants to continue from another offset (returned)."""
+        self.rec.http_requests += 1
+        headers = {**self.headers, "Range": f"bytes={offset}-"}
+        buffer = bytearray()
+        async with self.ctx.client.stream("GET", self.url, headers=headers) as response:
+            if response.status_code != 206:
+                await response.aread()
+                raise httpx.HTTPStatusError(
+                    f"http_{response.status_code}", request=response.request, response=response
+                )
+            async for chunk in response.aiter_raw():
+                self.rec.bytes += len(chunk)
+                buffer += chunk
+                done, seek = self._consume(offset, buffer)
+                if done:
+                    return seek
+        raise httpx.ReadError("Stream ended before playback could start")
+
+    def _consume(self, offset: int, buffer: bytearray) -> tuple[bool, int | None]:
+        """(stop reading, offset to continue from or None when playable)."""
+        end = offset + len(buffer)
+        while self.first_sample is None:
+            position = self.next_box
+            if position + 16 > end:
+                return False, None
+            start = position - offset
+            size, box_type = struct.unpack_from(">I4s", buffer, start)
+            if size == 1:
+                (size,) = struct.unpack_from(">Q", buffer, start + 8)
+            if box_type == b"mdat":
+                # the sample offsets are in moov, so the media is useless yet
+                self.next_box = position + size
+                return True, self.next_box
+            if position + size > end:
+                return False, None
+            if box_type == b"moov":
+                self.first_sample = _first_sample(bytes(buffer[start : start + size]))
+            self.next_box = position + size
+
+        sample_offset, sample_size = self.first_sample
+        if sample_offset < offset:
+            # moov came from the end of the file: go back for the media
+            return True, sample_offset
+        return end >= sample_offset + sample_size, None
+
+
+def _first_sample(moov: bytes) -> tuple[int, int]:
+    """(offset, size) of the first sample of the first track."""
+    stbl = mp4.parse_boxes(moov)[0]
+    for box_type in (b"trak", b"mdia", b"minf", b"stbl"):
+        stbl = stbl.find(box_type)
+    stsz = stbl.find(b"stsz").payload
+    size = struct.unpack_from(">I", stsz, 4)[0] or struct.unpack_from(">I", stsz, 12)[0]
+    chunk_offsets = stbl.find(b"stco") or stbl.find(b"co64")
+    fmt = ">I" if chunk_offsets.type == b"stco" else ">Q"
+    return struct.unpack_from(fmt, chunk_offsets.payload, 8)[0], size
+
+
+def time_to_first_frame(movie_attr: str):
+    def scenario(ctx: Context) -> Awaitable[Recorder]:
+        movie_id = getattr(ctx, movie_attr)
+
+        async def step(worker: int, rec: Recorder) -> bool:
+            player = _Player(ctx, movie_id, rec, ctx.tokens[worker % len(ctx.tokens)])
+            try:
+                await player.start()
+            except httpx.HTTPStatusError as exc:
+                rec.error(str(exc))
+                return False
+            return True
+
+        return _run_workers(ctx, step)
+
+    scenario.__doc__ = (
+        f"Playback starts of the {movie_attr.replace('_', ' ')}: the requests, bytes "
+        "and time a player needs before the first frame."
+    )
+    return scenario
+
+
+async def _multipart_body(boundary: str, size: int, title: str):
+    yield (
+        f"--{boundary}\r\n"
+        f'Content-Disposition: form-data; name="title"\r\n\r\n{title}\r\n'
+        f"--{boundary}\r\n"
+        f'Content-Disposition: form-data; name="file"; filename="{title}.mp4"\r\n'
+        "Content-Type: video/mp4\r\n\r\n"
+    ).encode()
+    # an MP4 head passes the upload's content sniffing; a unique first block
+    # keeps content-addressed storage from deduplicating
+    ftyp = mp4.Box(b"ftyp", b"isom" + struct.pack(">I", 512) + b"isomiso2avc1mp41")
+    head = mp4.serialize([ftyp]) + struct.pack(">I4s", 0, b"mdat") + uuid.uuid4().bytes
+    block = os.urandom(UPLOAD_BLOCK)
+    yield head + block[len(head) :]
+    remaining = size - UPLOAD_BLOCK
+    while remaining > 0:
+        yield block[:remaining]
+        remaining -= UPLOAD_BLOCK
+    yield f"\r\n--{boundary}--\r\n".encode()
+
+
+async def parallel_uploads(ctx: Context) -> Recorder:
+    """`uploads` streamed multipart uploads of `upload_bytes` each, at once."""
+    recorder = Recorder()
+
+    async def upload(index: int):
+        boundary = uuid.uuid4().hex
+        headers = auth(ctx.admin_token)
+        headers["Content-Type"] = f"multipart/form-data; boundary={boundary}"
+        start = time.perf_counter()
+        try:
+            response = await ctx.client.post(
+                "/api/v1/movies/upload",
+                content=_multipart_body(boundary, ctx.upload_bytes, f"bench-upload-{index}"),
+                headers=headers,
+            )
+        except httpx.HTTPError as exc:
+            recorder.error(type(exc).__name__)
+            return
+        if _check(response, recorder, expected=201):
+            recorder.latencies.append(time.perf_counter() - start)
+            recorder.bytes += ctx.upload_bytes
+
+    start = time.perf_counter()
+    await asyncio.gather(*(upload(i) for i in range(ctx.uploads)))
+    recorder.elapsed = time.perf_counter() - start
+    return recorder
+
+
+SCENARIOS = {
+    "login": login_storm,
+    "verify": code_flow,
+    "catalog": catalog_paging,
+    "catalog-1000": catalog_rows,
+    "stream": range_streaming,
+    "ttff-faststart": time_to_first_frame("faststart_movie_id"),
+    "ttff-moov-at-end": time_to_first_frame("movie_id"),
+    "upload": parallel_uploads,
+}
@@ -0,0 +1,293 @@
+"""
+Benchmark server: `app.main:app` under uvicorn, wired to local stand-ins.
+
+- database: SQLite in the work directory unless --database-url is given
+  (the schema is created and seeded on start; point it at an empty database)
+- Redis: an in-process fakeredis unless --redis-url is given
+- SMTP: an aiosmtpd relay on a free port that accepts everything and keeps
+  only the last code mailed to each address, in <workdir>/mail/<address>
+- Celery: tasks run eagerly inside the server process
+- media: every seeded movie plays one synthetic MP4 with `moov` at the end;
+  one more movie has the same video with `moov` first (faststart)
+
+Rate limits are lifted so the scenarios measure the code paths, not 429s.
+--stream-impl picks how streams are sent (see benchmarks.streaming).
+Started by `benchmarks.run`; settings are read from the environment at
+import time, so everything under `app` is imported after it is prepared.
+"""
+
+import argparse
+import email
+import email.policy
+import os
+import random
+import re
+import socket
+import struct
+from datetime import datetime, timedelta
+
+BENCH_PASSWORD = "bench-password"
+BENCH_ADMIN_EMAIL = "bench-admin@auraflix.local"
+# fixed so runs against the same seed are comparable
+SEED = 1234
+GENRES = ["Action", "Comedy", "Drama", "Documentary", "Horror", "Sci-Fi"]
+LANGUAGES = ["en", "fr", "de", "es", "ja"]
+CODE_RE = re.compile(r"code is: (\d+)")
+# bytes per video sample of the seeded MP4s
+SAMPLE_BYTES = 64 * 1024
+
+
+def user_email(index: int) -> str:
+    return f"bench-user-{index}@auraflix.local"
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def prepare_environment(args):
+    os.makedirs(args.workdir, exist_ok=True)
+    media_dir = os.path.join(args.workdir, "media")
+    sqlite_path = os.path.join(args.workdir, "bench.db")
+    if not args.database_url and os.path.exists(sqlite_path):
+        os.remove(sqlite_path)  # left by an earlier run in the same workdir
+    env = {
+        "DATABASE_URL": args.database_url or f"sqlite:///{sqlite_path}",
+        "MEDIA_DIR": media_dir,
+        "CELERY_BROKER_URL": "memory://",
+        "CELERY_RESULT_BACKEND": "cache+memory://",
+        "SMTP_HOST": "127.0.0.1",
+        "SMTP_PORT": str(args.smtp_port),
+        "SMTP_STARTTLS": "False",
+        "SMTP_USER": "",
+        "SMTP_FROM": "AuraFlix <bench@auraflix.local>",
+        "MAX_VIDEO_UPLOAD_BYTES": "0",
+    }
+    if args.redis_url:
+        env["REDIS_URL"] = args.redis_url
+    os.environ.update(env)
+    os.makedirs(media_dir, exist_ok=True)
+
+
+def mail_dir(workdir: str) -> str:
+    return os.path.join(workdir, "mail")
+
+
+def start_smtp(port: int, codes_dir: str):
+    from aiosmtpd.controller import Controller
+
+    os.makedirs(codes_dir, exist_ok=True)
+
+    class Sink:
+        async def handle_DATA(self, server, session, envelope):
+            body = email.message_from_bytes(envelope.content, policy=email.policy.default)
+            match = CODE_RE.search(body.get_content())
+            if match:
+                for rcpt in envelope.rcpt_tos:
+                    tmp_path = os.path.join(codes_dir, f".{rcpt}")
+                    with open(tmp_path, "w") as f:
+                        f.write(match.group(1))
+                    os.replace(tmp_path, os.path.join(codes_dir, rcpt))
+            return "250 OK"
+
+    controller = Controller(Sink(), hostname="127.0.0.1", port=port)
+    controller.start()
+    return controller
+
+
+def use_fake_redis():
+    import fakeredis
+    from fakeredis import aioredis as fake_aioredis
+
+    from app.tasks import celery as tasks
+    from app.utils import redis_pool
+
+    server = fakeredis.FakeServer()
+    redis_pool.use_redis(fake_aioredis.FakeRedis(server=server, decode_responses=True))
+    tasks.r = fakeredis.FakeRedis(server=server, decode_responses=True)
+
+
+def lift_rate_limits():
+    from app.routers import auth, movies
+    from app.utils.rate_limiter import RateLimiter
+
+    for module in (auth, movies):
+        for limiter in vars(module).values():
+            if isinstance(limiter, RateLimiter):
+                limiter.limit = 10**9
+
+
+def _full(fmt: str, *values, flags: int = 0) -> bytes:
+    """Payload of a version 0 full box: version/flags, then `values`."""
+    return struct.pack(">I" + fmt, flags, *values)
+
+
+def write_mp4(media_dir: str, rel_path: str, size: int):
+    """
+    A minimal single-track H.264 MP4 of about `size` bytes with `moov` after
+    `mdat`, as many encoders write it: SAMPLE_BYTES samples of pseudo-random
+    data at 25 fps, one sample per chunk.
+    """
+    from app.utils.mp4 import Box, serialize
+
+    samples = max(1, size // SAMPLE_BYTES)
+    timescale, delta = 25_000, 1000
+    duration = samples * delta
+    matrix = (0x10000, 0, 0, 0, 0x10000, 0, 0, 0, 0x40000000)
+    ftyp = Box(b"ftyp", b"isom" + struct.pack(">I", 512) + b"isomiso2avc1mp41")
+    mdat_offset = len(serialize([ftyp])) + 8
+
+    avc1 = struct.pack(
+        ">6xH16xHHII4xH32xHh", 1, 1920, 1080, 0x480000, 0x480000, 1, 0x18, -1
+    ) + serialize([Box(b"avcC", bytes([1, 0x64, 0, 0x28, 0xFF, 0xE0, 0]))])
+    offsets = [mdat_offset + i * SAMPLE_BYTES for i in range(samples)]
+    stbl = [
+        Box(b"stsd", _full("I", 1) + serialize([Box(b"avc1", avc1)])),
+        Box(b"stts", _full("III", 1, samples, delta)),
+        Box(b"stsc", _full("IIII", 1, 1, 1, 1)),
+        Box(b"stsz", _full("II", SAMPLE_BYTES, samples)),
+        Box(b"stco", _full(f"I{samples}I", samples, *offsets)),
+    ]
+    dref = _full("I", 1) + serialize([Box(b"url ", _full("", flags=1))])
+    minf = [
+        Box(b"vmhd", _full("8x", flags=1)),
+        Box(b"dinf", children=[Box(b"dref", dref)]),
+        Box(b"stbl", children=stbl),
+    ]
+    mdia = [
+        Box(b"mdhd", _full("IIIIHH", 0, 0, timescale, duration, 0x55C4, 0)),
+        Box(b"hdlr", _full("I4s12x", 0, b"vide") + b"Video\0"),
+        Box(b"minf", children=minf),
+    ]
+    tkhd = _full(
+        "IIIII8xhhh2x9III", 0, 0, 1, 0, duration, 0, 0, 0, *matrix, 1920 << 16, 1080 << 16,
+        flags=3,
+    )
+    mvhd = _full("IIIIIH10x9I24xI", 0, 0, timescale, duration, 0x10000, 0x100, *matrix, 2)
+    moov = Box(
+        b"moov",
+        children=[
+            Box(b"mvhd", mvhd),
+            Box(b"trak", children=[Box(b"tkhd", tkhd), Box(b"mdia", children=mdia)]),
+        ],
+    )
+
+    full_path = os.path.join(media_dir, rel_path)
+    os.makedirs(os.path.dirname(full_path), exist_ok=True)
+    block = random.Random(SEED).randbytes(SAMPLE_BYTES)
+    with open(full_path, "wb") as f:
+        f.write(serialize([ftyp]))
+        f.write(struct.pack(">I4s", 8 + samples * SAMPLE_BYTES, b"mdat"))
+        for _ in range(samples):
+            f.write(block)
+        f.write(serialize([moov]))
+
+
+def seed(args):
+    from app import models
+    from app.database import Base, SessionLocal, engine
+    from app.utils import mp4
+    from app.utils.password import hash_password
+
+    Base.metadata.create_all(engine)
+    rng = random.Random(SEED)
+    hashed = hash_password(BENCH_PASSWORD)
+    db = SessionLocal()
+    try:
+        db.add(
+            models.User(
+                email=BENCH_ADMIN_EMAIL,
+                hashed_password=hashed,
+                is_active=True,
+                is_verified=True,
+                is_admin=True,
+            )
+        )
+        db.add_all(
+            models.User(
+                email=user_email(i), hashed_password=hashed, is_active=True, is_verified=True
+            )
+            for i in range(args.users)
+        )
+        genres = [models.Genre(name=name) for name in GENRES]
+        db.add_all(genres)
+        db.flush()
+
+        media_dir = os.environ["MEDIA_DIR"]
+        stream_path = os.path.join("movies", "bench", "stream.mp4")
+        write_mp4(media_dir, stream_path, args.stream_mb * 1024 * 1024)
+        faststart_path = os.path.join("movies", "bench", "stream-faststart.mp4")
+        mp4.faststart(
+            os.path.join(media_dir, stream_path), os.path.join(media_dir, faststart_path)
+        )
+        epoch = datetime(2000, 1, 1)
+        db.add_all(
+            models.Movie(
+                title=f"Bench movie {i}",
+                description="Seeded for benchmarks. " * 8,
+                genre_id=rng.choice(genres).id,
+                language=rng.choice(LANGUAGES),
+                duration=rng.randint(60 * 60, 3 * 60 * 60),
+                file_path=stream_path,
+                media_type="video/mp4",
+                view_count=rng.randint(0, 100_000),
+                release_date=epoch + timedelta(days=rng.randint(0, 9000)),
+                # distinct timestamps keep keyset pages stable
+                created_at=epoch + timedelta(seconds=i),
+            )
+            for i in range(args.movies)
+        )
+        # the same video with moov first; its id is the one after the others
+        db.add(
+            models.Movie(
+                title="Bench movie faststart",
+                file_path=faststart_path,
+                media_type="video/mp4",
+                created_at=epoch + timedelta(seconds=args.movies),
+            )
+        )
+        db.commit()
+    finally:
+        db.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="AuraFlix benchmark server")
+    parser.add_argument("--port", type=int, required=True)
+    parser.add_argument("--workdir", required=True)
+    parser.add_argument("--database-url", default="")
+    parser.add_argument("--redis-url", default="")
+    parser.add_argument("--users", type=int, default=64)
+    parser.add_argument("--movies", type=int, default=2000)
+    parser.add_argument("--stream-mb", type=int, default=256)
+    parser.add_argument("--stream-impl", default="media")
+    args = parser.parse_args()
+    args.smtp_port = free_port()
+
+    prepare_environment(args)
+    smtp = start_smtp(args.smtp_port, mail_dir(args.workdir))
+    if not args.redis_url:
+        use_fake_redis()
+    lift_rate_limits()
+
+    from app.tasks.celery import celery_app
+
+    celery_app.conf.task_always_eager = True
+    seed(args)
+
+    import uvicorn
+
+    from app.main import app
+    from benchmarks.streaming import use_stream_impl
+
+    options = use_stream_impl(args.stream_impl)
+    try:
+        uvicorn.run(app, host="127.0.0.1", port=args.port, log_level="warning", **options)
+    finally:
+        smtp.stop()
+
+
+if __name__ == "__main__":
+    main()
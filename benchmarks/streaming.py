@@ -0,0 +1,145 @@
+"""
+Stream response variants for the before/after comparison of the stream
+scenarios (`benchmarks.run --stream-impl`):
+
+- media: `StreamResponse` as served by plain uvicorn, which offers no ASGI
+  file extensions, so bytes are read with aiofiles in 1 MiB chunks
+- zerocopy: the same response under uvicorn's h11 protocol extended with
+  `http.response.zerocopysend` and `http.response.pathsend`, implemented
+  with `loop.sendfile` (os.sendfile), as servers offering them do
+- legacy: the `iter_file` generator behind a StreamingResponse that
+  `stream_movie` used before the media response
+"""
+
+import asyncio
+import os
+
+import h11
+from starlette.datastructures import Headers
+from starlette.responses import Response, StreamingResponse
+from uvicorn.protocols.http import h11_impl
+
+STREAM_IMPLS = ("media", "zerocopy", "legacy")
+
+
+class IterFileResponse(Response):
+    """`stream_movie`'s response before the media response (same reads and ranges)."""
+
+    def __init__(self, path: str, media_type: str = "video/mp4", headers: dict | None = None):
+        self.path = path
+        self.background = None
+
+    async def __call__(self, scope, receive, send):
+        path = self.path
+        file_size = os.path.getsize(path)
+        range_header = Headers(scope=scope).get("range")
+
+        def iter_file(start: int = 0, end: int = None, chunk_size: int = 1024 * 1024):
+            with open(path, "rb") as f:
+                f.seek(start)
+                remaining = (end - start + 1) if end is not None else None
+                while True:
+                    read_size = chunk_size if remaining is None else min(chunk_size, remaining)
+                    chunk = f.read(read_size)
+                    if not chunk:
+                        break
+                    yield chunk
+                    if remaining is not None:
+                        remaining -= len(chunk)
+                        if remaining <= 0:
+                            break
+
+        if range_header:
+            _, range_val = range_header.split("=")
+            start_str, end_str = range_val.split("-")
+            start = int(start_str) if start_str else 0
+            end = int(end_str) if end_str else file_size - 1
+            if start >= file_size:
+                resp = Response(status_code=416)
+            else:
+                resp = StreamingResponse(iter_file(start, end), status_code=206)
+                resp.headers["Content-Range"] = f"bytes {start}-{end}/{file_size}"
+                resp.headers["Accept-Ranges"] = "bytes"
+                resp.headers["Content-Length"] = str(end - start + 1)
+                resp.headers["Content-Type"] = "video/mp4"
+        else:
+            resp = StreamingResponse(iter_file(0, file_size - 1), media_type="video/mp4")
+            resp.headers["Content-Length"] = str(file_size)
+        await resp(scope, receive, send)
+
+
+class _FileSpan:
+    """Stands in for `count` body bytes in h11's data passthrough."""
+
+    def __init__(self, count: int):
+        self.count = count
+
+    def __len__(self) -> int:
+        return self.count
+
+
+class ZeroCopyCycle(h11_impl.RequestResponseCycle):
+    """uvicorn's h11 request cycle, plus the ASGI zero-copy extensions."""
+
+    def __init__(self, scope, *args, **kwargs):
+        scope["extensions"] = {
+            **scope.get("extensions", {}),
+            "http.response.zerocopysend": {},
+            "http.response.pathsend": {},
+        }
+        super().__init__(scope, *args, **kwargs)
+
+    async def send(self, message):
+        if message["type"] == "http.response.pathsend":
+            with open(message["path"], "rb") as f:
+                await self._sendfile(f, 0, os.fstat(f.fileno()).st_size, more_body=False)
+        elif message["type"] == "http.response.zerocopysend":
+            file = message["file"]
+            offset = message.get("offset")
+            if offset is None:
+                offset = file.tell()
+            count = message.get("count")
+            if count is None:
+                count = os.fstat(file.fileno()).st_size - offset
+            await self._sendfile(file, offset, count, message.get("more_body", False))
+        else:
+            await super().send(message)
+
+    async def _sendfile(self, file, offset: int, count: int, more_body: bool):
+        if self.flow.write_paused and not self.disconnected:
+            await self.flow.drain()
+        if self.disconnected:
+            return
+        if count and self.scope["method"] != "HEAD":
+            for data in self.conn.send_with_data_passthrough(h11.Data(data=_FileSpan(count))):
+                if not isinstance(data, _FileSpan):
+                    self.transport.write(data)
+                    continue
+                try:
+                    await asyncio.get_running_loop().sendfile(
+                        self.transport, file, offset, count
+                    )
+                except ConnectionError:
+                    # the client went away mid-body (players drop reads)
+                    self.transport.close()
+                    return
+                except RuntimeError:
+                    # ... or did so before the send started
+                    if self.transport.is_closing():
+                        return
+                    raise
+        if not more_body:
+            await super().send({"type": "http.response.body", "body": b""})
+
+
+def use_stream_impl(impl: str) -> dict:
+    """Switch `stream_movie` to `impl`; returns the uvicorn.run options it needs."""
+    if impl == "legacy":
+        from app.routers import movies
+
+        movies.StreamResponse = IterFileResponse
+    elif impl == "zerocopy":
+        h11_impl.RequestResponseCycle = ZeroCopyCycle
+        # uvloop transports fall back to read + write in loop.sendfile
+        return {"http": "h11", "loop": "asyncio"}
+    return {}
@@ -0,0 +1,69 @@
+"""
+Script to pick Argon2 parameters for a target hashing latency on this machine.
+Run it on the hardware that serves logins and copy the printed values into .env.
+Existing hashes are upgraded transparently on each user's next login.
+
+Usage:
+    python calibrate_argon2.py [--target-ms 250] [--max-memory-mib 256] [--parallelism 4]
+"""
+
+import argparse
+import time
+
+from argon2 import PasswordHasher
+
+
+def measure_ms(time_cost: int, memory_cost: int, parallelism: int, rounds: int = 3):
+    """Median wall time of one hash, in milliseconds."""
+    hasher = PasswordHasher(
+        time_cost=time_cost, memory_cost=memory_cost, parallelism=parallelism
+    )
+    samples = []
+    for _ in range(rounds):
+        start = time.perf_counter()
+        hasher.hash("calibration-password")
+        samples.append((time.perf_counter() - start) * 1000)
+    return sorted(samples)[len(samples) // 2]
+
+
+def calibrate(target_ms: float, max_memory_kib: int, parallelism: int):
+    """
+    Use as much memory as allowed (the main cost for attackers), halving it
+    while a single pass is already too slow, then raise the number of passes
+    until the target latency is reached.
+    """
+    memory_cost = max_memory_kib
+    while memory_cost > 8 * parallelism and measure_ms(1, memory_cost, parallelism) > target_ms:
+        memory_cost //= 2
+
+    time_cost = 1
+    elapsed = measure_ms(time_cost, memory_cost, parallelism)
+    while elapsed < target_ms:
+        time_cost += 1
+        elapsed = measure_ms(time_cost, memory_cost, parallelism)
+    if time_cost > 1 and elapsed - target_ms > target_ms * 0.25:
+        # overshot by a lot: one pass fewer is closer to the target
+        time_cost -= 1
+        elapsed = measure_ms(time_cost, memory_cost, parallelism)
+    return time_cost, memory_cost, elapsed
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Calibrate Argon2 parameters")
+    parser.add_argument("--target-ms", type=float, default=250.0)
+    parser.add_argument("--max-memory-mib", type=int, default=256)
+    parser.add_argument("--parallelism", type=int, default=4)
+    args = parser.parse_args()
+
+    print("=" * 50)
+    print("AuraFlix - Argon2 calibration")
+    print("=" * 50)
+    time_cost, memory_cost, elapsed = calibrate(
+        args.target_ms, args.max_memory_mib * 1024, args.parallelism
+    )
+    print(f"Measured {elapsed:.0f} ms per hash (target {args.target_ms:.0f} ms)\n")
+    print("Add to your .env:")
+    print(f"ARGON2_TIME_COST={time_cost}")
+    print(f"ARGON2_MEMORY_COST={memory_cost}")
+    print(f"ARGON2_PARALLELISM={args.parallelism}")
+    print("=" * 50)
@@ -0,0 +1,103 @@
+"""
+Script to move existing media files to content-addressed storage.
+Every movie/poster path that is not yet stored under its SHA-256 digest is
+hashed, linked to movies/<ab>/<digest>.<ext> (or posters/...), the movie rows
+are updated, and the old file is removed. Identical files collapse into one.
+Safe to interrupt and re-run: rows are committed one file at a time and the
+old file is only removed after its rows point at the new one.
+
+Usage:
+    python migrate_media.py [--dry-run]
+"""
+
+import argparse
+import os
+import shutil
+
+import redis
+from sqlalchemy import select, update
+
+from app.config import settings
+from app.database import SessionLocal
+from app.models import Movie
+from app.utils.cache import invalidate_movie_sync
+from app.utils.storage import (
+    content_rel_path,
+    hash_file,
+    is_content_addressed,
+    reuse_content,
+)
+
+
+def link_content(src: str, dest: str):
+    """Give `src` a second name `dest`; copy when hard links are unavailable."""
+    os.makedirs(os.path.dirname(dest), exist_ok=True)
+    try:
+        os.link(src, dest)
+    except FileExistsError:
+        pass
+    except OSError:
+        shutil.copy2(src, dest)
+
+
+def legacy_paths(db) -> set[str]:
+    paths = set()
+    for file_path, poster_path in db.execute(select(Movie.file_path, Movie.poster_path)):
+        for path in (file_path, poster_path):
+            if path and not is_content_addressed(path):
+                paths.add(path)
+    return paths
+
+
+def migrate(dry_run: bool = False):
+    db = SessionLocal()
+    cache = redis.Redis.from_url(settings.REDIS_URL, decode_responses=True)
+    moved = deduplicated = missing = 0
+    try:
+        for old_rel in sorted(legacy_paths(db)):
+            old_full = os.path.join(settings.MEDIA_DIR, old_rel)
+            if not os.path.exists(old_full):
+                print(f"⚠️  missing on disk, left as is: {old_rel}")
+                missing += 1
+                continue
+            subdir = old_rel.split(os.sep, 1)[0] if os.sep in old_rel else "movies"
+            new_rel = content_rel_path(subdir, hash_file(old_full), old_rel)
+            new_full = os.path.join(settings.MEDIA_DIR, new_rel)
+            exists = reuse_content(new_full)
+            print(f"{'=' if exists else '→'} {old_rel} -> {new_rel}")
+            if dry_run:
+                continue
+            if exists:
+                deduplicated += 1
+            else:
+                link_content(old_full, new_full)
+                moved += 1
+
+            movie_ids = set()
+            for column in (Movie.file_path, Movie.poster_path):
+                result = db.execute(
+                    update(Movie)
+                    .where(column == old_rel)
+                    .values({column.key: new_rel})
+                    .returning(Movie.id)
+                )
+                movie_ids.update(result.scalars())
+            db.commit()
+            for movie_id in movie_ids:
+                invalidate_movie_sync(cache, movie_id)
+            os.remove(old_full)
+    finally:
+        db.close()
+
+    print(f"\n✓ {moved} stored, {deduplicated} deduplicated, {missing} missing")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Migrate media to content addresses")
+    parser.add_argument("--dry-run", action="store_true", help="only print the plan")
+    args = parser.parse_args()
+
+    print("=" * 50)
+    print("AuraFlix - Media storage migration")
+    print("=" * 50)
+    migrate(dry_run=args.dry_run)
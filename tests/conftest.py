@@ -0,0 +1,113 @@
+"""
+The app under test: SQLite in a temporary directory, fakeredis for both
+Redis clients, Celery eager and the per-request query profiler on, driven
+in-process through httpx's ASGITransport. Settings are read from the
+environment at import time, so it is prepared before `app` is imported.
+"""
+
+import os
+import shutil
+import tempfile
+
+WORKDIR = tempfile.mkdtemp(prefix="auraflix-tests-")
+os.environ.update(
+    {
+        "DATABASE_URL": f"sqlite:///{os.path.join(WORKDIR, 'test.db')}",
+        "MEDIA_DIR": os.path.join(WORKDIR, "media"),
+        "CELERY_BROKER_URL": "memory://",
+        "CELERY_RESULT_BACKEND": "cache+memory://",
+        "SMTP_HOST": "127.0.0.1",
+        "SMTP_FROM": "AuraFlix <test@auraflix.local>",
+        "DB_PROFILING": "True",
+    }
+)
+os.makedirs(os.environ["MEDIA_DIR"], exist_ok=True)
+
+import fakeredis  # noqa: E402
+import httpx  # noqa: E402
+import pytest  # noqa: E402
+from fakeredis import aioredis as fake_aioredis  # noqa: E402
+
+from app import models, services  # noqa: E402
+from app.database import Base, SessionLocal, engine  # noqa: E402
+from app.main import app  # noqa: E402
+from app.tasks import celery as tasks  # noqa: E402
+from app.utils import cache, redis_pool  # noqa: E402
+from app.utils.password import create_access_token  # noqa: E402
+
+MOVIES = 3
+
+
+def pytest_sessionfinish(session, exitstatus):
+    shutil.rmtree(WORKDIR, ignore_errors=True)
+
+
+@pytest.fixture
+def anyio_backend():
+    return "asyncio"
+
+
+@pytest.fixture(autouse=True)
+def redis():
+    """Empty Redis and in-process cache tiers for every test."""
+    server = fakeredis.FakeServer()
+    redis_pool.use_redis(fake_aioredis.FakeRedis(server=server, decode_responses=True))
+    tasks.r = fakeredis.FakeRedis(server=server, decode_responses=True)
+    for two_tier in (cache.movie_cache, cache.movie_list_cache, cache.user_status_cache):
+        two_tier.local.clear()
+    cache._catalog_state.clear()
+    return tasks.r
+
+
+@pytest.fixture
+def db():
+    Base.metadata.drop_all(engine)
+    Base.metadata.create_all(engine)
+    session = SessionLocal()
+    try:
+        yield session
+    finally:
+        session.close()
+
+
+@pytest.fixture
+def media_dir():
+    media_dir = os.environ["MEDIA_DIR"]
+    shutil.rmtree(media_dir)
+    os.makedirs(media_dir)
+    return media_dir
+
+
+@pytest.fixture
+def user(db):
+    user = models.User(
+        email="viewer@auraflix.local", hashed_password="-", is_active=True, is_verified=True
+    )
+    db.add(user)
+    db.commit()
+    return user
+
+
+@pytest.fixture
+def movies(db):
+    rows = [
+        models.Movie(title=f"Movie {i}", file_path=f"movies/{i}.mp4", media_type="video/mp4")
+        for i in range(MOVIES)
+    ]
+    db.add_all(rows)
+    db.commit()
+    return rows
+
+
+@pytest.fixture
+async def client(user):
+    token = create_access_token(
+        {"sub": str(user.id), "st": services.user_status_payload(user)}
+    )
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(
+        transport=transport,
+        base_url="http://test",
+        headers={"Authorization": f"Bearer {token}"},
+    ) as client:
+        yield client
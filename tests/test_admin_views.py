@@ -0,0 +1,44 @@
+from types import SimpleNamespace
+
+import pytest
+
+from app import models
+from app.admin import views
+
+pytestmark = pytest.mark.anyio
+
+
+@pytest.fixture
+def poster_tasks(monkeypatch):
+    queued = []
+    monkeypatch.setattr(
+        views.generate_poster_variants_task, "delay", lambda movie_id: queued.append(movie_id)
+    )
+    return queued
+
+
+async def edit(db, movie, **changes):
+    view = views.MovieAdminView(models.Movie)
+    request = SimpleNamespace(state=SimpleNamespace(session=db))
+    db.refresh(movie)  # loaded, as by find_by_pk
+    for name, value in changes.items():
+        setattr(movie, name, value)
+    await view.before_edit(request, {}, movie)
+    db.commit()
+    await view.after_edit(request, movie)
+
+
+@pytest.mark.parametrize(
+    "changes, queued",
+    [
+        ({"title": "Renamed"}, False),
+        ({"title": "Renamed", "poster_path": "posters/old.png"}, False),
+        ({"poster_path": "posters/new.png"}, True),
+    ],
+)
+async def test_poster_variants_only_for_a_new_poster(db, movies, poster_tasks, changes, queued):
+    movie = movies[0]
+    movie.poster_path = "posters/old.png"
+    db.commit()
+    await edit(db, movie, **changes)
+    assert poster_tasks == ([movie.id] if queued else [])
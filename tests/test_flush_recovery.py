@@ -0,0 +1,50 @@
+import pytest
+from sqlalchemy import func, select
+
+from app import models
+from app.tasks import celery as tasks
+from app.utils import views
+from app.utils.progress import drain_dirty_progress, record_progress
+from app.utils.views import drain_pending_views, drain_watch_events, record_view
+
+pytestmark = pytest.mark.anyio
+
+
+@pytest.fixture
+def orphans_due(monkeypatch):
+    """Make flushing keys count as orphaned as soon as they are registered."""
+    monkeypatch.setattr(views, "FLUSH_ORPHAN_SECONDS", 0)
+
+
+async def test_views_of_a_dead_flush_are_replayed(db, movies, user, redis, monkeypatch):
+    await record_view(movies[0].id, user.id)
+    flushing_key, counts = drain_pending_views(redis)  # the worker dies here
+    assert counts == {movies[0].id: 1}
+    await record_view(movies[1].id, user.id)
+
+    # a flush that may still be running is left alone
+    assert tasks.increment_view_count_task() == 1
+    assert redis.exists(flushing_key)
+
+    monkeypatch.setattr(views, "FLUSH_ORPHAN_SECONDS", 0)
+    assert tasks.increment_view_count_task() == 1
+    db.expire_all()
+    assert [db.get(models.Movie, m.id).view_count for m in movies[:2]] == [1, 1]
+    assert not redis.exists(flushing_key)
+    assert not redis.zcard("views:flushing")
+
+
+async def test_watch_events_of_a_dead_flush_are_replayed(db, movies, user, redis, orphans_due):
+    await record_view(movies[0].id, user.id)
+    drain_watch_events(redis)
+    assert tasks.flush_watch_events_task() == 1
+    assert db.scalar(select(func.count(models.WatchEvent.id))) == 1
+    assert tasks.flush_watch_events_task() == 0
+
+
+async def test_progress_of_a_dead_flush_is_replayed(db, movies, user, redis, orphans_due):
+    await record_progress(user.id, movies[0].id, 42, False)
+    drain_dirty_progress(redis)
+    assert tasks.flush_watch_progress_task() == 1
+    row = db.get(models.WatchProgress, (user.id, movies[0].id))
+    assert row.position_seconds == 42
@@ -0,0 +1,61 @@
+import hashlib
+import os
+import time
+
+from app import models
+from app.config import settings
+from app.utils import storage
+
+AGED = time.time() - settings.MEDIA_GC_GRACE_SECONDS - 60
+
+
+def store(data: bytes) -> tuple[str, bool]:
+    tmp_path = os.path.join(settings.MEDIA_DIR, f".{hashlib.md5(data).hexdigest()}.tmp")
+    with open(tmp_path, "wb") as f:
+        f.write(data)
+    return storage.store_content(
+        tmp_path, "movies", hashlib.sha256(data).hexdigest(), "upload.mp4"
+    )
+
+
+def full(rel_path: str) -> str:
+    return os.path.join(settings.MEDIA_DIR, rel_path)
+
+
+def age(rel_path: str):
+    for path in (full(rel_path), storage._claim_path(full(rel_path))):
+        if os.path.exists(path):
+            os.utime(path, (AGED, AGED))
+
+
+def test_reuse_leaves_the_served_file_alone(db, media_dir):
+    rel_path, created = store(b"reuse")
+    age(rel_path)
+    mtime = os.stat(full(rel_path)).st_mtime
+
+    assert store(b"reuse") == (rel_path, False)
+    assert os.stat(full(rel_path)).st_mtime == mtime  # validators unchanged
+    assert storage.collect_unreferenced_media(db) == 0  # claimed just now
+    assert os.path.exists(full(rel_path))
+
+
+def test_collects_aged_unreferenced_files_and_their_claims(db, media_dir):
+    kept, _ = store(b"referenced")
+    dropped, _ = store(b"unreferenced")
+    store(b"unreferenced")
+    db.add(models.Movie(title="Kept", file_path=kept, media_type="video/mp4"))
+    db.commit()
+    age(kept)
+    age(dropped)
+
+    assert storage.collect_unreferenced_media(db) == 1
+    assert os.path.exists(full(kept))
+    assert not os.path.exists(full(dropped))
+    assert not os.path.exists(storage._claim_path(full(dropped)))
+
+
+def test_release_keeps_recent_files(db, media_dir):
+    rel_path, _ = store(b"recent")
+    assert storage.release_media_sync(db, rel_path) == []
+    age(rel_path)
+    assert storage.release_media_sync(db, rel_path) == [rel_path]
@@ -0,0 +1,53 @@
+import asyncio
+
+import pytest
+
+from app.routers import movies as movies_router
+from app.utils import metrics
+
+pytestmark = pytest.mark.anyio
+
+
+def in_flight(method: str, route: str) -> float:
+    value = metrics.registry().get_sample_value(
+        "auraflix_http_requests_in_progress", {"method": method, "route": route}
+    )
+    return value or 0
+
+
+@pytest.mark.parametrize(
+    "method, path, route",
+    [
+        ("GET", "/api/v1/movies/12", "/api/v1/movies/{movie_id}"),
+        ("DELETE", "/api/v1/movies/cache/stats", "/api/v1/movies/cache/stats"),
+        ("GET", "/media/posters/ab/cd.png", "/media/{path}"),
+        ("GET", "/nowhere", metrics.UNMATCHED_ROUTE),
+    ],
+)
+def test_route_label(method, path, route):
+    from app.main import app
+
+    scope = {"type": "http", "method": method, "path": path, "root_path": "", "app": app}
+    assert metrics.route_label(scope) == route
+
+
+async def test_in_flight_before_the_body_or_response(client, movies, monkeypatch):
+    entered, release = asyncio.Event(), asyncio.Event()
+    get_movie_cached = movies_router.services.get_movie_cached
+
+    async def blocked(*args, **kwargs):
+        entered.set()
+        await release.wait()
+        return await get_movie_cached(*args, **kwargs)
+
+    monkeypatch.setattr(movies_router.services, "get_movie_cached", blocked)
+    route = "/api/v1/movies/{movie_id}"
+    before = in_flight("GET", route)
+    request = asyncio.create_task(client.get(f"/api/v1/movies/{movies[0].id}"))
+    try:
+        await asyncio.wait_for(entered.wait(), 5)
+        assert in_flight("GET", route) == before + 1
+    finally:
+        release.set()
+    assert (await asyncio.wait_for(request, 5)).status_code == 200
+    assert in_flight("GET", route) == before
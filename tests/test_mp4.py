@@ -0,0 +1,38 @@
+import io
+import struct
+
+import pytest
+
+from app.utils import mp4
+
+
+class CountingReader(io.BytesIO):
+    def __init__(self, data: bytes):
+        super().__init__(data)
+        self.reads = 0
+
+    def read(self, size: int = -1) -> bytes:
+        self.reads += 1
+        return super().read(size)
+
+
+def boxes(*types: bytes) -> bytes:
+    return b"".join(struct.pack(">I4s", 16, box_type) + bytes(8) for box_type in types)
+
+
+def test_top_level_boxes():
+    data = boxes(b"ftyp", b"mdat", b"moov")
+    found = mp4.top_level_boxes(io.BytesIO(data), len(data))
+    assert [(b.type, b.offset, b.size) for b in found] == [
+        (b"ftyp", 0, 16),
+        (b"mdat", 16, 16),
+        (b"moov", 32, 16),
+    ]
+
+
+def test_rejects_after_the_first_box():
+    data = boxes(b"free", *[b"mdat"] * 1000)
+    f = CountingReader(data)
+    with pytest.raises(mp4.Mp4Error, match="Not an ISO-BMFF file"):
+        mp4.top_level_boxes(f, len(data))
+    assert f.reads == 1
@@ -0,0 +1,96 @@
+import os
+import struct
+
+import pytest
+from starlette.requests import Request
+
+from app.utils.files import ALLOWED_VIDEO_MIME
+from app.utils.streaming_upload import (
+    MAX_FORM_PARTS,
+    FileFieldSpec,
+    StreamingUploadError,
+    parse_streaming_upload,
+)
+
+pytestmark = pytest.mark.anyio
+
+BOUNDARY = "test-boundary"
+MP4_HEAD = struct.pack(">I4s4sI4s", 20, b"ftyp", b"isom", 512, b"isom") + struct.pack(
+    ">I4s", 0, b"mdat"
+)
+
+
+def field_part(name: str, value: str) -> bytes:
+    return (
+        f"--{BOUNDARY}\r\n"
+        f'Content-Disposition: form-data; name="{name}"\r\n\r\n{value}\r\n'
+    ).encode()
+
+
+def file_part(content: bytes, content_type: str = "video/mp4") -> bytes:
+    return (
+        f"--{BOUNDARY}\r\n"
+        'Content-Disposition: form-data; name="file"; filename="movie.mp4"\r\n'
+        f"Content-Type: {content_type}\r\n\r\n"
+    ).encode() + content + b"\r\n"
+
+
+def chunked_request(*parts: bytes, chunk_size: int = 1024) -> Request:
+    """A multipart request sent in chunks, without a Content-Length."""
+    body = b"".join(parts) + f"--{BOUNDARY}--\r\n".encode()
+    chunks = [body[i : i + chunk_size] for i in range(0, len(body), chunk_size)]
+
+    async def receive():
+        chunk = chunks.pop(0)
+        return {"type": "http.request", "body": chunk, "more_body": bool(chunks)}
+
+    content_type = f"multipart/form-data; boundary={BOUNDARY}".encode()
+    scope = {
+        "type": "http",
+        "method": "POST",
+        "path": "/",
+        "headers": [(b"content-type", content_type), (b"transfer-encoding", b"chunked")],
+    }
+    return Request(scope, receive)
+
+
+async def parse(request: Request, media_dir: str, max_body_bytes: int | None = None):
+    spec = FileFieldSpec("video", media_dir, "movies", ALLOWED_VIDEO_MIME)
+    return await parse_streaming_upload(request, {"file": spec}, max_body_bytes)
+
+
+def stored_files(media_dir: str) -> list[str]:
+    return [name for _, _, names in os.walk(media_dir) for name in names]
+
+
+async def test_sniffed_mp4_is_stored(media_dir):
+    content = MP4_HEAD + os.urandom(64 * 1024)
+    fields, files = await parse(
+        chunked_request(field_part("title", "Movie"), file_part(content)), media_dir
+    )
+    assert fields == {"title": "Movie"}
+    assert files["file"].size == len(content)
+    assert len(stored_files(media_dir)) == 1
+
+
+@pytest.mark.parametrize("content", [os.urandom(64 * 1024), b"\x89PNG\r\n\x1a\n" + bytes(16)])
+async def test_declared_type_is_not_trusted(media_dir, content):
+    with pytest.raises(StreamingUploadError, match="Invalid video content") as exc:
+        await parse(chunked_request(file_part(content)), media_dir)
+    assert exc.value.status_code == 400
+    assert stored_files(media_dir) == []
+
+
+async def test_body_without_content_length_is_capped(media_dir):
+    content = MP4_HEAD + bytes(256 * 1024)
+    with pytest.raises(StreamingUploadError) as exc:
+        await parse(chunked_request(file_part(content)), media_dir, max_body_bytes=128 * 1024)
+    assert exc.value.status_code == 413
+    assert stored_files(media_dir) == []
+
+
+async def test_field_count_is_capped(media_dir):
+    fields = [field_part(f"field{i}", "x") for i in range(MAX_FORM_PARTS + 1)]
+    with pytest.raises(StreamingUploadError, match="Too many form fields") as exc:
+        await parse(chunked_request(*fields), media_dir)
+    assert exc.value.status_code == 400
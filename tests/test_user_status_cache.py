@@ -0,0 +1,31 @@
+import pytest
+
+from app import services
+from app.utils import cache
+
+pytestmark = pytest.mark.anyio
+
+
+async def test_fill_racing_a_refresh_keeps_the_refresh(db, user):
+    claims = services.user_status_payload(user)  # as signed into a live token
+
+    async def deactivate_then_load():
+        user.is_active = False
+        db.commit()
+        await services.refresh_user_status(user)
+        return claims
+
+    loaded = await cache.user_status_cache.get_or_load(str(user.id), deactivate_then_load)
+    assert loaded["is_active"]  # the racing request itself saw the old claims
+
+    cache.user_status_cache.local.clear()
+    status = await services.get_user_status(None, user.id, claims=claims)
+    assert status.is_active is False
+
+
+async def test_deactivated_token_is_refused(client, db, user):
+    assert (await client.get("/api/v1/movies/")).status_code == 200
+    user.is_active = False
+    db.commit()
+    await services.refresh_user_status(user)
+    assert (await client.get("/api/v1/movies/")).status_code == 400